@@ -13,6 +13,11 @@ from .api.question_routes import init_question_service
 from .config import Config
 from .extensions import db, migrate, socketio
 from .realtime import socket_events  # noqa: F401
+from .realtime.presence import presence
+from .realtime.pubsub import message_queue_options
+from .realtime.scheduler import scheduler
+from .realtime.simulation_store import DatabaseSimulationStore, LocalSimulationStore
+from .services.openai_client import warm_pool
 
 
 def create_app():
@@ -21,13 +26,24 @@ def create_app():
 
     db.init_app(app)
     migrate.init_app(app, db)
-    socketio.init_app(app, cors_allowed_origins=app.config["SOCKETIO_CORS_ALLOWED_ORIGINS"])
+    socketio.init_app(
+        app,
+        cors_allowed_origins=app.config["SOCKETIO_CORS_ALLOWED_ORIGINS"],
+        **message_queue_options(app.config["SOCKETIO_MESSAGE_QUEUE"], app.config["SOCKETIO_CHANNEL"]),
+    )
+    # With a message queue listeners may sit on another worker, so local presence can't gate playback.
+    scheduler.presence = None if app.config["SOCKETIO_MESSAGE_QUEUE"] else presence
+    # ...and any worker may be asked about a simulation another one started.
+    scheduler.store = DatabaseSimulationStore(app) if app.config["SOCKETIO_MESSAGE_QUEUE"] else LocalSimulationStore()
 
     app.register_blueprint(ui_bp)
     app.register_blueprint(session_bp)
     app.register_blueprint(health_bp)
     init_question_service(app)
 
+    if app.config["OPENAI_WARMUP"]:
+        warm_pool()
+
     return app
 
 
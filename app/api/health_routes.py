@@ -1,7 +1,14 @@
 """Health check endpoint."""
 from __future__ import annotations
 
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, jsonify
+
+from ..metrics import registry
+from ..realtime.presence import presence
+from ..realtime.scheduler import scheduler
+from ..services.llm_cache import cache_stats
+from ..services.openai_client import llm_status
+from ..services.slot_rules import gate_tier_stats
 
 bp = Blueprint("health", __name__)
 
@@ -9,3 +16,33 @@ bp = Blueprint("health", __name__)
 @bp.get("/health")
 def health():
     return jsonify({"ok": True})
+
+
+@bp.get("/health/llm")
+def llm_health():
+    breaker = llm_status()
+    return jsonify(
+        {
+            "ok": breaker["state"] != "open",
+            "breaker": breaker,
+            "cache": cache_stats(),
+            "slot_gate": gate_tier_stats(),
+        }
+    )
+
+
+@bp.get("/health/realtime")
+def realtime_health():
+    return jsonify(
+        {
+            "ok": True,
+            "presence": presence.stats(),
+            "presence_gating": scheduler.presence is not None,
+            "simulations_active": scheduler.active(),
+        }
+    )
+
+
+@bp.get("/metrics")
+def metrics():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
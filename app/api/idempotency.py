@@ -0,0 +1,19 @@
+"""HTTP side of the Idempotency-Key replay cache.
+
+The cache itself lives in ``app/services/idempotency.py`` and is shared with
+the Socket.IO transport; this module only names the headers.
+"""
+from __future__ import annotations
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def mark_replayed(response, replayed: bool):
+    """Flag a response served from the replay cache."""
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return response
+
+
+__all__ = ["HEADER", "REPLAYED_HEADER", "mark_replayed"]
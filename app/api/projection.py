@@ -0,0 +1,39 @@
+"""Query-string fields and conditional GETs for session responses.
+
+``?fields=`` is parsed here and projected by ``app/services/projection.py``.
+``status`` and ``debug`` carry a weak ETag built from the session version, so
+a poll of an unchanged session is answered with ``304`` before anything is
+serialized.
+"""
+from __future__ import annotations
+
+from flask import current_app, request
+
+from ..services.projection import parse_fields
+
+
+def requested_fields(default=()) -> frozenset[str]:
+    """Parse ``?fields=``; ``default`` applies when the parameter is absent."""
+    return parse_fields(request.args.get("fields"), default)
+
+
+def session_etag(session, fields) -> str:
+    """Weak validator: the session version plus the projection it was rendered with."""
+    return f"{session.id}-{session.version}-{'+'.join(sorted(fields)) or 'lean'}"
+
+
+def not_modified(etag: str):
+    """A bare ``304`` when the client already holds ``etag``, else None."""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    return with_etag(current_app.response_class(status=304), etag)
+
+
+def with_etag(response, etag: str):
+    response.set_etag(etag, weak=True)
+    # Let clients cache the body but revalidate on every poll.
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+__all__ = ["requested_fields", "session_etag", "not_modified", "with_etag"]
@@ -1,36 +1,46 @@
 """Session routes."""
 from __future__ import annotations
 
+import logging
+import time
+
 from flask import Blueprint, current_app, jsonify, request
 
-from ..db.repo import create_session, get_session, save_session
-from ..extensions import socketio
-from ..realtime.scheduler import start_popup_simulation
-from ..services.combo_answer_parser import PARSERS as COMBO_PARSERS
-from ..services.combo_question_generator import generate_combo_question
-from ..services.combo_specs import COMBO_SPECS
-from ..services.fallbacks import CLARIFIER_QUESTION
-from ..services.gpt_client import detect_causes
-from ..services.planner import (
-    activate_domains_from_causes,
-    pick_next_slot,
-)
-from ..services.popup_generator import generate_popups
-from ..services.question_generator import generate_question, get_generic_domain_question
-from ..services.slot_manager import (
-    add_negated_slots,
-    get_missing_slots,
-    infer_emotion_signals,
-    is_slot_allowed,
-    set_slot_value,
+from ..db.repo import (
+    create_session,
+    get_popups,
+    get_session,
+    refresh_session,
+    retry_on_conflict,
+    save_session,
+    StaleSessionError,
 )
-from ..services.slot_prefill_llm import prefill_slots_with_llm
-from ..services.relevance import combo_relevant, domain_relevant
-from ..services.stop_engine import should_stop
+from ..extensions import socketio
+from .idempotency import HEADER as IDEMPOTENCY_HEADER, mark_replayed
+from .projection import not_modified, requested_fields, session_etag, with_etag
+from ..realtime.scheduler import DELIVERY_MODES, SchedulerFullError, scheduler, start_popup_simulation
+from ..services import session_service
+from ..services.intake import collect_intake, start_intake
+from ..services.planner import activate_domains_from_causes
+from ..services.popup_jobs import PENDING, READY, is_stale, job_for, wait_for_popups
+from ..services.projection import FieldsError, project
+from ..services.slot_manager import add_negated_slots, set_slot_value
+
+logger = logging.getLogger(__name__)
 
 bp = Blueprint("session", __name__, url_prefix="/session")
 
 
+@bp.errorhandler(FieldsError)
+def _bad_fields(exc):
+    return jsonify({"error": str(exc)}), 400
+
+
+@bp.errorhandler(StaleSessionError)
+def _conflict(exc):
+    return jsonify({"error": session_service.CONFLICT_ERROR}), 409
+
+
 @bp.post("/start")
 def start_session():
     body = request.get_json(force=True, silent=True) or {}
@@ -38,11 +48,12 @@ def start_session():
     if not text:
         return jsonify({"error": "text is required"}), 400
 
-    session = create_session(text)
+    deadline = time.monotonic() + current_app.config["INTAKE_DEADLINE_SECONDS"]
+    intake = start_intake(text, deadline)
 
-    prefill = prefill_slots_with_llm(text)
+    session = create_session(text)
 
-    causes = detect_causes(text)
+    prefill, causes = collect_intake(intake, deadline)
     meta = dict(session.meta or {})
     meta["causes"] = causes
     session.meta = meta
@@ -71,348 +82,149 @@ def start_session():
 
 @bp.post("/<session_id>/answer")
 def answer(session_id: str):
-    session = get_session(session_id)
-    if not session:
-        return jsonify({"error": "session not found"}), 404
-    if session.status != "active":
-        return jsonify({"error": "session is not active"}), 400
-
-    body = request.get_json(force=True, silent=True) or {}
-    answer_text = (body.get("answer") or "").strip()
-
-    meta = dict(session.meta or {})
-    current_question = meta.get("current_question") or {}
-    if current_question.get("type") == "combo":
-        combo_id = current_question.get("combo_id")
-        parser = COMBO_PARSERS.get(combo_id)
-        if parser:
-            parsed = parser(answer_text)
-            if not parsed:
-                hint = COMBO_SPECS.get(combo_id, {}).get("hint", "")
-                return jsonify(
-                    {
-                        "need_clarification": True,
-                        "question": f"Please follow the format:\n{hint}",
-                    }
-                )
-
-            for key, value in parsed["slots"].items():
-                domain_key, slot_key = key.split(".", 1)
-                set_slot_value(session.filled_slots, domain_key, slot_key, value)
-
-            emotion = parsed.get("emotion")
-            if emotion:
-                signals = list(meta.get("emotion_signals") or [])
-                signals.append(emotion)
-                meta["emotion_signals"] = signals
-
-            meta["current_question"] = None
-            session.meta = meta
-            session.history.append({"role": "user", "text": answer_text})
-            save_session(session)
-            return jsonify({"ok": True, "filled_slots": session.filled_slots, "meta": session.meta})
-
-    domain = body.get("domain")
-    slot = body.get("slot")
-    domain = domain or current_question.get("domain")
-    slot = slot or current_question.get("slot")
-
-    if not (domain and slot):
-        return jsonify({"error": "domain/slot missing (no current_question found)"}), 400
-
-    if not is_slot_allowed(domain, slot):
-        return jsonify({"error": "invalid domain/slot"}), 400
-
-    if not answer_text:
-        return jsonify({"error": "answer is required"}), 400
-
-    clarifier_used = list(meta.get("clarifier_used") or [])
-    key = f"{domain}.{slot}"
-    if len(answer_text.split()) < 2 and key not in clarifier_used:
-        clarifier_used.append(key)
-        meta["clarifier_used"] = clarifier_used
-        meta["current_question"] = {
-            "domain": domain,
-            "slot": slot,
-            "question": CLARIFIER_QUESTION,
-        }
-        session.meta = meta
-
-        session.history.append({"role": "user", "text": answer_text})
-        session.history.append({"role": "assistant", "text": CLARIFIER_QUESTION})
-        save_session(session)
-        return jsonify(
-            {
-                "need_clarification": True,
-                "domain": domain,
-                "slot": slot,
-                "question": CLARIFIER_QUESTION,
-            }
-        )
-
-    session.history.append({"role": "user", "text": answer_text})
-    set_slot_value(session.filled_slots, domain, slot, answer_text)
-    meta["current_question"] = None
-    session.meta = meta
-
-    save_session(session)
-    return jsonify({"ok": True, "filled_slots": session.filled_slots, "meta": session.meta})
+    return _session_call("answer", session_id)
 
 
 @bp.post("/<session_id>/next-question")
 def next_question(session_id: str):
-    session = get_session(session_id)
-    if not session or session.status != "active":
-        return jsonify({"error": "invalid session"}), 400
-
-    current_q = (session.meta or {}).get("current_question")
-    if current_q:
-        return jsonify(
-            {
-                "done": False,
-                "domain": current_q.get("domain"),
-                "slot": current_q.get("slot"),
-                "question": current_q.get("question"),
-                "meta": session.meta,
-                "pending": True,
-                "message": "Answer the current question first",
-            }
-        )
-
-    if not session.active_domains:
-        session.active_domains = extract_components(session.raw_initial_text or "")
-
-    if not session.active_domains:
-        causes = meta.get("causes")
-        if not causes:
-            causes = detect_causes(session.raw_initial_text or "")
-            meta["causes"] = causes
-            session.meta = meta
-        session.active_domains = activate_domains_from_causes(causes)
-
-    if not session.active_domains:
-        session.active_domains = ["time_pressure", "distractions", "academic_confidence"]
-
-    missing = get_missing_slots(session.active_domains, session.filled_slots)
-
-    def _is_missing(domain: str, slot: str) -> bool:
-        return not session.filled_slots.get(domain, {}).get(slot)
-
-    meta = dict(session.meta or {})
-    total_questions = int(meta.get("total_questions_asked", 0))
-    domain_counts = dict(meta.get("domain_question_count") or {})
-    combo_history = set(meta.get("combo_history") or [])
-    raw_text = session.raw_initial_text or ""
-
-    combo_spec_id = None
-    combo_spec = None
-
-    if total_questions <= 2:
-        if (
-            "friend_compare_emotion" not in combo_history
-            and combo_relevant("friend_compare_emotion", raw_text)
-            and domain_relevant("social_comparison", raw_text)
-            and (
-                _is_missing("distractions", "friend_name")
-                or _is_missing("social_comparison", "comparison_person")
-                or _is_missing("social_comparison", "comparison_gap")
-            )
-        ):
-            combo_spec_id = "friend_compare_emotion"
-        elif (
-            "distraction_time_combo" not in combo_history
-            and combo_relevant("distraction_time_combo", raw_text)
-            and domain_relevant("distractions", raw_text)
-            and domain_relevant("time_pressure", raw_text)
-            and (
-                _is_missing("distractions", "gaming_app")
-                or _is_missing("distractions", "gaming_time")
-                or _is_missing("time_pressure", "timetable_breaker")
-            )
-        ):
-            combo_spec_id = "distraction_time_combo"
-
-    if combo_spec_id:
-        combo_spec = COMBO_SPECS[combo_spec_id]
-        question = generate_combo_question(combo_spec_id, session, session.raw_initial_text or "")
-    if combo_spec_id and combo_spec and question:
-        meta["total_questions_asked"] = total_questions + 1
-        meta["current_question"] = {
-            "type": "combo",
-            "combo_id": combo_spec_id,
-            "question": question,
-        }
-        history = list(combo_history)
-        history.append(combo_spec_id)
-        meta["combo_history"] = history
-        session.meta = meta
-        session.history.append({"role": "assistant", "text": question})
-        save_session(session)
-        return jsonify(
-            {
-                "done": False,
-                "combo": True,
-                "question": question,
-                "hint": combo_spec["hint"],
-                "meta": session.meta,
-            }
-        )
-    elif combo_spec_id and not question:
-        combo_spec_id = None
-
-    if should_stop(
-        total_questions_asked=total_questions,
-        missing_slots_count=len(missing),
-        min_questions=current_app.config["MIN_QUESTIONS"],
-        max_questions=current_app.config["MAX_QUESTIONS"],
-    ):
-        return _complete_session(session)
-
-    question = None
-    domain = slot = None
-    attempts = 0
-    max_attempts = len(missing) + 3
-
-    while attempts < max_attempts:
-        missing = get_missing_slots(session.active_domains, session.filled_slots)
-        next_slot = pick_next_slot(
-            session.active_domains,
-            missing,
-            domain_counts,
-            current_app.config["MAX_DOMAIN_QUESTIONS"],
-            session.raw_initial_text or "",
-            session.filled_slots,
-            meta.get("causes") or {},
-        )
-        if not next_slot:
-            return _complete_session(session)
-
-        domain, slot = next_slot
-        profile = session.filled_slots or {}
-        domain_profile = profile.get(domain) or {}
-
-        excerpt = None
-        if domain == "academic_confidence":
-            weak = domain_profile.get("weak_subject") or ""
-            last = domain_profile.get("last_test_experience") or ""
-            if weak or last:
-                excerpt = f"Weak in {weak}. Last test felt {last}."
-        elif domain == "family_pressure":
-            expect = domain_profile.get("expectation_type") or ""
-            member = domain_profile.get("family_member") or ""
-            if expect or member:
-                excerpt = f"Family member {member} expects {expect}."
-        elif domain == "distractions":
-            friend = domain_profile.get("friend_name") or ""
-            app = domain_profile.get("phone_app") or ""
-            if friend or app:
-                excerpt = f"Distractions include {friend} and app {app}."
-
-        last_question = (meta.get("last_question") or "").strip()
-        context = {
-            "user_text": session.raw_initial_text or "",
-            "filled_slots": session.filled_slots,
-            "domain": domain,
-            "slot": slot,
-            "causes": meta.get("causes") or {},
-        }
-        context["meta"] = {"last_question": last_question}
-
-        if slot == "__generic__":
-            generic = get_generic_domain_question(domain)
-            if generic:
-                next_slot, generic_question = generic
-                if generic_question == last_question:
-                    add_negated_slots(session.filled_slots, [next_slot])
-                    attempts += 1
-                    continue
-                slot, question = next_slot, generic_question
-                break
-            attempts += 1
-            continue
-
-        question = generate_question(domain, slot, excerpt=excerpt, context=context)
-        if question:
-            break
-
-        generic = get_generic_domain_question(domain)
-        if generic:
-            next_slot, generic_question = generic
-            if generic_question == last_question:
-                add_negated_slots(session.filled_slots, [next_slot])
-                attempts += 1
-                continue
-            slot, question = next_slot, generic_question
-            break
-
-        add_negated_slots(session.filled_slots, [slot])
-        attempts += 1
-
-    if not question:
-        return _complete_session(session)
-
-    session.history.append({"role": "assistant", "text": question})
-    meta["total_questions_asked"] = total_questions + 1
-    domain_counts[domain] = int(domain_counts.get(domain, 0)) + 1
-    meta["domain_question_count"] = domain_counts
-    meta["current_question"] = {"domain": domain, "slot": slot, "question": question}
-    meta["last_question"] = question
-    session.meta = meta
+    return _session_call("next_question", session_id)
 
-    save_session(session)
 
-    return jsonify(
-        {
-            "done": False,
-            "domain": domain,
-            "slot": slot,
-            "question": question,
-            "meta": session.meta,
-        }
+def _session_call(action: str, session_id: str):
+    """Run a question-loop action through the session service and shape the response."""
+    fields = requested_fields()
+    body = request.get_json(force=True, silent=True) or {}
+    payload, status, replayed = session_service.handle(
+        action, session_id, body, fields, request.headers.get(IDEMPOTENCY_HEADER, "")
     )
+    response = jsonify(payload)
+    response.status_code = status
+    return mark_replayed(response, replayed)
 
 
 @bp.get("/<session_id>/status")
 def status(session_id: str):
+    fields = requested_fields(default=("active_domains",))
     session = get_session(session_id)
     if not session:
         return jsonify({"error": "session not found"}), 404
-    return jsonify(
-        {
-            "session_id": str(session.id),
-            "status": session.status,
-            "active_domains": session.active_domains,
-            "filled_slots": session.filled_slots,
-            "meta": session.meta,
-        }
-    )
+    etag = session_etag(session, fields)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    meta = session.meta or {}
+    body = {
+        "session_id": str(session.id),
+        "status": session.status,
+        "version": session.version,
+        "questions_asked": int(meta.get("total_questions_asked", 0)),
+        "popups_status": meta.get("popups_status"),
+    }
+    return with_etag(jsonify(project(session, body, fields)), etag)
 
 
 @bp.get("/<session_id>/debug")
 def debug_session(session_id: str):
+    fields = requested_fields(default=("filled_slots", "meta"))
     session = get_session(session_id)
     if not session:
         return jsonify({"error": "session not found"}), 404
-    return jsonify(
-        {
-            "id": str(session.id),
-            "status": session.status,
-            "popups_count": len(session.popups or []),
-            "popups": session.popups or [],
-            "filled_slots": session.filled_slots,
-            "meta": session.meta,
-        }
-    )
+    etag = session_etag(session, fields)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    body = {
+        "id": str(session.id),
+        "status": session.status,
+        "version": session.version,
+        "popups_count": int((session.meta or {}).get("popups_count") or len(get_popups(session))),
+    }
+    return with_etag(jsonify(project(session, body, fields)), etag)
 
 
 @bp.post("/<session_id>/start-simulation")
 def start_simulation(session_id: str):
+    body = request.get_json(force=True, silent=True) or {}
+    restart = bool(body.get("restart"))
+    delivery = str(body.get("delivery") or current_app.config["POPUP_DELIVERY"]).lower()
+    if delivery not in DELIVERY_MODES:
+        return jsonify({"error": f"unknown delivery {delivery!r}; use {' or '.join(DELIVERY_MODES)}"}), 400
+    running = scheduler.status(session_id)
+    if running is not None and not restart:
+        # Already started here (e.g. a refresh); rejoining the room resumes playback.
+        return jsonify(_simulation_body(running, started=False))
+
     session = get_session(session_id)
     if not session or session.status != "completed":
         return jsonify({"error": "session not completed"}), 400
 
-    start_popup_simulation(session_id, session.popups or [])
-    return jsonify({"ok": True, "popups_scheduled": len(session.popups or [])})
+    if (session.meta or {}).get("popups_status") == PENDING:
+        deadline = time.monotonic() + current_app.config["POPUP_WAIT_SECONDS"]
+        while (session.meta or {}).get("popups_status") == PENDING:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if wait_for_popups(session_id, timeout=remaining) is None and job_for(session_id) is None:
+                # The job runs in another worker (or was lost); poll the row.
+                time.sleep(min(0.5, remaining))
+            refresh_session(session)
+
+    meta = session.meta or {}
+    if meta.get("popups_status") == PENDING:
+        if job_for(session_id) is None and is_stale(meta):
+            _restart_lost_popup_job(session)
+        return (
+            jsonify({"ok": False, "popups_status": PENDING, "message": "popups are still being prepared"}),
+            202,
+        )
+
+    try:
+        simulation, started = start_popup_simulation(
+            session_id, get_popups(session), restart=restart, mode=delivery
+        )
+    except SchedulerFullError as exc:
+        logger.warning("popup simulation rejected session=%s: %s", session_id, exc)
+        return jsonify({"ok": False, "error": "too many simulations running, retry shortly"}), 503
+    return jsonify(_simulation_body(simulation, started=started) | {"popups_status": meta.get("popups_status", READY)})
+
+
+@retry_on_conflict
+def _restart_lost_popup_job(session) -> None:
+    """Restart a popup job no worker is tracking; only this save is retried on conflict."""
+    refresh_session(session)
+    meta = session.meta or {}
+    if meta.get("popups_status") != PENDING or job_for(str(session.id)) is not None or not is_stale(meta):
+        return  # another request got there first
+    logger.warning("restarting lost popup job session=%s", session.id)
+    session_service.complete_session(session)
+
+
+def _simulation_body(simulation: dict, started: bool) -> dict:
+    return {
+        "ok": True,
+        "started": started,
+        "popups_scheduled": simulation["total"] - simulation["cursor"],
+        "simulation": simulation,
+    }
+
+
+@bp.get("/<session_id>/simulation")
+def simulation_status(session_id: str):
+    simulation = scheduler.status(session_id)
+    if simulation is None:
+        return jsonify({"error": "no simulation for this session"}), 404
+    return jsonify({"simulation": simulation})
+
+
+@bp.post("/<session_id>/simulation/<action>")
+def control_simulation(session_id: str, action: str):
+    controls = {"pause": scheduler.pause, "resume": scheduler.resume, "cancel": scheduler.cancel}
+    if action not in controls:
+        return jsonify({"error": f"unknown action {action!r}; use pause, resume or cancel"}), 404
+    simulation = controls[action](session_id)
+    if simulation is None:
+        return jsonify({"error": "no active simulation for this session"}), 404
+    return jsonify({"ok": True, "simulation": simulation})
 
 
 @bp.post("/<session_id>/test-popup")
@@ -428,23 +240,3 @@ def test_popup(session_id: str):
     }
     socketio.emit("popup", payload, room=str(session_id))
     return jsonify({"ok": True, "sent": True, "payload": payload})
-
-
-def _complete_session(session):
-    session.status = "completed"
-    stress_profile = session.filled_slots or {}
-    inferred_signals = infer_emotion_signals(stress_profile)
-    stored_signals = (session.meta or {}).get("emotion_signals") or []
-    emotion_signals = list(dict.fromkeys(stored_signals + inferred_signals))
-    popups = generate_popups(stress_profile, emotion_signals)
-    session.popups = popups
-    save_session(session)
-    return jsonify(
-        {
-            "done": True,
-            "status": session.status,
-            "popups_ready": True,
-            "popups_count": len(session.popups or []),
-            "filled_slots": session.filled_slots,
-        }
-    )
@@ -13,10 +13,33 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
     SOCKETIO_CORS_ALLOWED_ORIGINS = os.getenv("SOCKETIO_CORS_ALLOWED_ORIGINS", "*")
+    # Fan emits out to other workers: redis://, amqp://, sqlite:///path or postgresql://.
+    SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE", "")
+    SOCKETIO_CHANNEL = os.getenv("SOCKETIO_CHANNEL", "stress-dost")
 
     MIN_QUESTIONS = int(os.getenv("MIN_QUESTIONS", "3"))
     MAX_QUESTIONS = int(os.getenv("MAX_QUESTIONS", "6"))
     MAX_DOMAIN_QUESTIONS = int(os.getenv("MAX_DOMAIN_QUESTIONS", "2"))
 
+    # Fill other open slots stated in an answer (runs with next-question planning).
+    ANSWER_EXTRACTION = os.getenv("ANSWER_EXTRACTION", "true").strip().lower() not in {"0", "false", "no"}
+
+    # Plan the next question in the background as soon as /answer commits.
+    PREGENERATE_QUESTIONS = os.getenv("PREGENERATE_QUESTIONS", "true").strip().lower() not in {"0", "false", "no"}
+
+    INTAKE_DEADLINE_SECONDS = float(os.getenv("INTAKE_DEADLINE_SECONDS", "20"))
+
+    # How long /start-simulation waits for a background popup job before answering 202.
+    POPUP_WAIT_SECONDS = float(os.getenv("POPUP_WAIT_SECONDS", "20"))
+
+    # Stream popup generation and emit each card as ``popup_generated`` as it validates.
+    POPUP_STREAMING = os.getenv("POPUP_STREAMING", "true").strip().lower() not in {"0", "false", "no"}
+
+    # "stream": the server emits each ``popup`` on time. "batch": one ``popup_batch`` with
+    # display offsets on join, scheduled by the client. /start-simulation can override it.
+    POPUP_DELIVERY = os.getenv("POPUP_DELIVERY", "stream").strip().lower()
+
+    OPENAI_WARMUP = os.getenv("OPENAI_WARMUP", "true").strip().lower() not in {"0", "false", "no"}
+
 
 __all__ = ["Config"]
@@ -49,5 +49,14 @@ PRIORITY_ORDER = [
     "motivation",
 ]
 
+CAUSE_KEYS = [
+    "family_pressure",
+    "digital_distraction",
+    "social_distraction",
+    "academic_confidence",
+    "time_pressure",
+    "emotional_overwhelm",
+]
+
 
-__all__ = ["SLOT_SCHEMA", "PRIORITY_ORDER"]
+__all__ = ["SLOT_SCHEMA", "PRIORITY_ORDER", "CAUSE_KEYS"]
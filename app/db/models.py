@@ -29,6 +29,10 @@ else:
         return uuid.uuid4()
 
 
+HISTORY = "history"
+POPUP = "popup"
+
+
 class Session(db.Model):
     __tablename__ = "sessions"
 
@@ -37,12 +41,18 @@ class Session(db.Model):
 
     raw_initial_text = db.Column(db.Text, nullable=True)
 
+    # Legacy whole-document columns; new turns and popups go to session_events.
     history = db.Column(MutableList.as_mutable(JSONType), nullable=False, default=list)
     active_domains = db.Column(MutableList.as_mutable(JSONType), nullable=False, default=list)
     filled_slots = db.Column(MutableDict.as_mutable(JSONType), nullable=False, default=dict)
     meta = db.Column(MutableDict.as_mutable(JSONType), nullable=False, default=dict)
     popups = db.Column(MutableList.as_mutable(JSONType), nullable=False, default=list)
 
+    # Optimistic lock: every UPDATE is ``... WHERE version = <version read>`` and
+    # bumps it, so a concurrent write raises instead of being overwritten. Also
+    # tags cached copies of the row.
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
     created_at = db.Column(
         db.DateTime, nullable=False, server_default=func.now(), default=datetime.utcnow
     )
@@ -54,5 +64,50 @@ class Session(db.Model):
         default=datetime.utcnow,
     )
 
+    __mapper_args__ = {"version_id_col": version}
+
+
+class SessionEvent(db.Model):
+    """Append-only log of a session's history turns and popups.
+
+    Rows are only ever inserted (popups are replaced as a set), so writes stay
+    the same size however long the session gets.
+    """
+
+    __tablename__ = "session_events"
+    __table_args__ = (db.Index("ix_session_events_session_kind", "session_id", "kind", "id"),)
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    session_id = db.Column(UUIDType, db.ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    payload = db.Column(JSONType, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, server_default=func.now(), default=datetime.utcnow)
+
+    # Many-to-one so inserts are ordered after a pending session; never loaded.
+    session = db.relationship("Session", lazy="raise")
+
+
+class PopupSimulation(db.Model):
+    """Shared playback state of a session's popup simulation.
+
+    ``generation`` is bumped by every state change and compared on write, so
+    workers coordinate through the row: a worker playing a simulation stops as
+    soon as the stored generation moves past its own.
+    """
+
+    __tablename__ = "popup_simulations"
+
+    session_id = db.Column(UUIDType, db.ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=1)
+    state = db.Column(db.String(20), nullable=False)
+    record = db.Column(JSONType, nullable=False)
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+        default=datetime.utcnow,
+    )
+
 
-__all__ = ["Session"]
+__all__ = ["Session", "SessionEvent", "PopupSimulation", "HISTORY", "POPUP"]
@@ -1,14 +1,62 @@
 """Thin repository helpers."""
 from __future__ import annotations
 
+import copy
+import functools
+import logging
+import os
+import random
+import time
+from datetime import datetime
+
+from sqlalchemy import Text, cast, delete, update
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, array
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.exc import StaleDataError
+
 from ..extensions import db
-from .models import Session
+from ..metrics import registry
+from . import session_cache
+from .models import HISTORY, POPUP, USE_SQLITE, Session, SessionEvent, _uuid_default
+
+logger = logging.getLogger(__name__)
+
+# JSON document columns written as top-level key patches on Postgres.
+PATCHED_COLUMNS = ("meta", "filled_slots")
+
+# Attempts per request when another writer bumped the session version first.
+SAVE_ATTEMPTS = int(os.getenv("SESSION_SAVE_ATTEMPTS", "3"))
+
+session_conflicts = registry.counter(
+    "session_save_conflicts_total",
+    "Optimistic-lock conflicts on session saves by outcome (retried, exhausted).",
+    labels=("outcome",),
+)
+
+
+class StaleSessionError(RuntimeError):
+    """The session row was updated by someone else since it was read."""
+
+
+def _snapshot(session: Session) -> Session:
+    """Remember the committed JSON documents so the next save can write only the diff.
+
+    Only Postgres patches JSON columns; on SQLite the copy would be wasted on every read.
+    """
+    if USE_SQLITE:
+        return session
+    session._json_snapshot = {
+        column: copy.deepcopy(dict(getattr(session, column) or {})) for column in PATCHED_COLUMNS
+    }
+    return session
 
 
 def create_session(raw_initial_text: str) -> Session:
+    """Build a pending session; the caller's ``save_session`` performs the single commit."""
     session = Session(
+        id=_uuid_default(),
         raw_initial_text=raw_initial_text,
-        history=[{"role": "user", "text": raw_initial_text}],
+        history=[],
         active_domains=[],
         filled_slots={},
         meta={
@@ -21,19 +69,154 @@ def create_session(raw_initial_text: str) -> Session:
         },
     )
     db.session.add(session)
-    db.session.commit()
-    db.session.refresh(session)
+    append_history(session, "user", raw_initial_text)
     return session
 
 
 def get_session(session_id) -> Session | None:
-    return Session.query.get(session_id)
+    session = session_cache.load(session_id)
+    if session is None:
+        session = db.session.get(Session, session_id)
+        if session is not None:
+            session_cache.store(session)
+    return _snapshot(session) if session is not None else None
+
+
+def append_history(session: Session, role: str, text: str) -> None:
+    """Queue one history turn; it is inserted with the next commit."""
+    db.session.add(SessionEvent(session=session, session_id=session.id, kind=HISTORY, payload={"role": role, "text": text}))
+
+
+def get_history(session: Session) -> list[dict]:
+    rows = db.session.execute(
+        db.select(SessionEvent.payload)
+        .where(SessionEvent.session_id == session.id, SessionEvent.kind == HISTORY)
+        .order_by(SessionEvent.id)
+    ).scalars()
+    return list(session.history or []) + list(rows)
+
+
+def set_popups(session: Session, popups: list[dict]) -> None:
+    """Replace the session's popups; committed with the next save."""
+    # No autoflush: the session row must only be written (and version-checked) by save_session.
+    with db.session.no_autoflush:
+        db.session.execute(
+            delete(SessionEvent).where(SessionEvent.session_id == session.id, SessionEvent.kind == POPUP)
+        )
+    for popup in popups or []:
+        db.session.add(SessionEvent(session=session, session_id=session.id, kind=POPUP, payload=popup))
+
+
+def get_popups(session: Session) -> list[dict]:
+    rows = list(
+        db.session.execute(
+            db.select(SessionEvent.payload)
+            .where(SessionEvent.session_id == session.id, SessionEvent.kind == POPUP)
+            .order_by(SessionEvent.id)
+        ).scalars()
+    )
+    # Sessions completed before session_events existed keep popups on the row.
+    return rows or list(session.popups or [])
+
+
+def _patch_json_columns(session: Session) -> None:
+    """On Postgres, write changed top-level keys of meta/filled_slots with ``||`` and ``-``."""
+    snapshot = getattr(session, "_json_snapshot", None)
+    if USE_SQLITE or snapshot is None:
+        return
+    values = {}
+    for column in PATCHED_COLUMNS:
+        before = snapshot.get(column)
+        current = getattr(session, column)
+        if before is None or current is None:
+            continue
+        patch = {key: value for key, value in current.items() if key not in before or before[key] != value}
+        removed = [key for key in before if key not in current]
+        # The ORM must not also write the whole document for this column.
+        set_committed_value(session, column, current)
+        if not (patch or removed):
+            continue
+        expr = Session.__table__.c[column].op("||")(cast(patch, JSONB))
+        if removed:
+            expr = expr.op("-")(cast(array(removed), ARRAY(Text)))
+        values[column] = expr
+    if values:
+        db.session.execute(
+            update(Session).where(Session.id == session.id).values(**values),
+            execution_options={"synchronize_session": False},
+        )
 
 
 def save_session(session: Session) -> None:
+    """Commit once and write the new state through to the cache (no refresh).
+
+    The UPDATE is a compare-and-swap on ``version``; losing the race raises
+    ``StaleSessionError`` with nothing written.
+    """
+    session_id = session.id
+    # Set client-side so the commit does not expire it for a server-side fetch.
+    session.updated_at = datetime.utcnow()
     db.session.add(session)
-    db.session.commit()
+    try:
+        _patch_json_columns(session)
+        db.session.commit()
+    except StaleDataError as exc:
+        db.session.rollback()
+        # Drop the stale instance so the retry re-reads the row from scratch.
+        db.session.expunge(session)
+        session_cache.invalidate(session_id)
+        raise StaleSessionError(f"session {session_id} was modified concurrently") from exc
+    except Exception:
+        db.session.rollback()
+        session_cache.invalidate(session_id)
+        raise
+    session_cache.store(session)
+    _snapshot(session)
+
+
+def retry_on_conflict(fn):
+    """Re-run ``fn`` (which must re-read the session) when its save loses a version race."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        for attempt in range(1, SAVE_ATTEMPTS + 1):
+            try:
+                return fn(*args, **kwargs)
+            except StaleSessionError as exc:
+                if attempt >= SAVE_ATTEMPTS:
+                    session_conflicts.inc(outcome="exhausted")
+                    raise
+                session_conflicts.inc(outcome="retried")
+                logger.info("%s; retrying %s (attempt %s)", exc, fn.__name__, attempt + 1)
+                time.sleep(random.uniform(0, 0.01 * attempt))
+
+    return wrapper
+
+
+def refresh_session(session: Session) -> None:
+    """Reload a session's columns, picking up writes from background jobs."""
     db.session.refresh(session)
+    session_cache.store(session)
+    _snapshot(session)
+
+
+def load_committed_meta(session_id) -> dict:
+    """Read the committed meta without flushing pending changes."""
+    with db.session.no_autoflush:
+        meta = db.session.query(Session.meta).filter(Session.id == session_id).scalar()
+    return dict(meta or {})
 
 
-__all__ = ["create_session", "get_session", "save_session"]
+__all__ = [
+    "create_session",
+    "get_session",
+    "save_session",
+    "retry_on_conflict",
+    "StaleSessionError",
+    "refresh_session",
+    "load_committed_meta",
+    "append_history",
+    "get_history",
+    "set_popups",
+    "get_popups",
+]
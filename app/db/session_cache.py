@@ -0,0 +1,143 @@
+"""Versioned write-through cache of session rows.
+
+``save_session`` writes the committed state here, so the hot path
+(``answer``, ``next-question``, ``status``) rebuilds the row without a
+query. The default backend is an in-process LRU, which is exact for a single
+worker; ``sqlite`` shares entries between workers on one host, and
+``SESSION_CACHE_VERIFY`` adds a cheap ``SELECT version`` check for setups
+where other hosts write to the same database.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy.orm import make_transient_to_detached
+
+from ..extensions import db
+from ..metrics import registry
+from ..services.cache_backends import build_backend
+from .models import USE_SQLITE, Session
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+
+CACHE_BACKEND = os.getenv("SESSION_CACHE_BACKEND", "memory")
+CACHE_MAX_BYTES = int(os.getenv("SESSION_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+CACHE_PATH = os.getenv("SESSION_CACHE_PATH", str(BASE_DIR / "instance" / "session_cache.db"))
+CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "3600"))
+VERIFY = os.getenv("SESSION_CACHE_VERIFY", "false").strip().lower() in {"1", "true", "yes"}
+
+JSON_COLUMNS = ("history", "active_domains", "filled_slots", "meta", "popups")
+
+session_cache_requests = registry.counter(
+    "session_cache_requests_total",
+    "Session cache lookups by result (hit, miss, stale).",
+    labels=("result",),
+)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = build_backend(CACHE_BACKEND, max_bytes=CACHE_MAX_BYTES, path=CACHE_PATH, table="session_cache")
+    return _backend
+
+
+def _key(session_id) -> str:
+    return f"session:{session_id}"
+
+
+def _encode(session: Session) -> bytes:
+    state = {
+        "id": str(session.id),
+        "status": session.status,
+        "raw_initial_text": session.raw_initial_text,
+        "version": session.version,
+        "created_at": session.created_at.isoformat() if session.created_at else None,
+        "updated_at": session.updated_at.isoformat() if session.updated_at else None,
+    }
+    for column in JSON_COLUMNS:
+        state[column] = getattr(session, column)
+    return json.dumps(state, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def _decode(raw: bytes) -> Session:
+    state = json.loads(raw)
+    session = Session(
+        id=state["id"] if USE_SQLITE else uuid.UUID(state["id"]),
+        status=state["status"],
+        raw_initial_text=state["raw_initial_text"],
+        version=state["version"],
+        created_at=datetime.fromisoformat(state["created_at"]) if state.get("created_at") else None,
+        updated_at=datetime.fromisoformat(state["updated_at"]) if state.get("updated_at") else None,
+        **{column: state.get(column) for column in JSON_COLUMNS},
+    )
+    # Treat the cached values as the committed row so only real edits are flushed.
+    make_transient_to_detached(session)
+    return session
+
+
+def store(session: Session) -> None:
+    backend = get_backend()
+    if backend is None or session is None or session.id is None:
+        return
+    try:
+        backend.set(_key(session.id), _encode(session), ttl=CACHE_TTL)
+    except Exception as exc:  # pragma: no cover - cache is best effort
+        logger.warning("session cache write failed: %s", exc)
+
+
+def invalidate(session_id) -> None:
+    backend = get_backend()
+    if backend is not None:
+        backend.delete(_key(session_id))
+
+
+def load(session_id) -> Session | None:
+    """Return a session attached to ``db.session`` from the cache, or None on a miss."""
+    backend = get_backend()
+    if backend is None:
+        return None
+    raw = backend.get(_key(session_id))
+    if raw is None:
+        session_cache_requests.inc(result="miss")
+        return None
+    try:
+        cached = _decode(raw)
+    except Exception as exc:  # pragma: no cover - corrupt entry
+        logger.warning("session cache entry unreadable for %s: %s", session_id, exc)
+        invalidate(session_id)
+        session_cache_requests.inc(result="miss")
+        return None
+    if VERIFY:
+        current = db.session.query(Session.version).filter(Session.id == cached.id).scalar()
+        if current != cached.version:
+            invalidate(session_id)
+            session_cache_requests.inc(result="stale")
+            return None
+    session_cache_requests.inc(result="hit")
+    return db.session.merge(cached, load=False)
+
+
+def cache_stats() -> dict:
+    backend = get_backend()
+    return {
+        "backend": backend.stats() if backend is not None else {"backend": "none"},
+        "verify": VERIFY,
+        "requests": {r: int(session_cache_requests.value(result=r)) for r in ("hit", "miss", "stale")},
+    }
+
+
+__all__ = ["load", "store", "invalidate", "cache_stats", "get_backend"]
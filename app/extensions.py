@@ -6,7 +6,8 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO
 
 
-db = SQLAlchemy()
+# Committed objects stay usable without a reload; the session cache relies on it.
+db = SQLAlchemy(session_options={"expire_on_commit": False})
 migrate = Migrate()
 socketio = SocketIO(cors_allowed_origins="*")
 
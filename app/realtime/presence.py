@@ -0,0 +1,101 @@
+"""Room presence registry.
+
+Tracks the Socket.IO connections of this worker and the session rooms they
+joined, updated from the connect, ``join_session`` and disconnect handlers.
+The popup scheduler asks it whether anyone is listening before doing work for
+a room, and the counts feed ``/health/realtime`` and ``/metrics``.
+
+Presence is per worker: with a message queue the clients of a room may be
+connected to another worker, so the app factory turns scheduler gating off.
+"""
+from __future__ import annotations
+
+import threading
+
+from ..metrics import registry
+
+connections_gauge = registry.gauge("socketio_connections", "Socket.IO connections on this worker.")
+rooms_gauge = registry.gauge("socketio_rooms_watched", "Session rooms with at least one local listener.")
+room_joins = registry.counter("socketio_room_joins_total", "join_session calls handled by this worker.")
+room_fanout = registry.histogram(
+    "socketio_room_fanout",
+    "Local listeners reached by a room emit.",
+    labels=("event",),
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100),
+)
+
+
+class PresenceRegistry:
+    """Connected sids and the session rooms each has joined."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rooms: dict[str, set[str]] = {}
+        self._joined: dict[str, set[str]] = {}
+
+    def connect(self, sid: str) -> None:
+        with self._lock:
+            self._joined.setdefault(sid, set())
+            self._publish()
+
+    def join(self, sid: str, room: str) -> int:
+        """Record ``sid`` in ``room``; return the room's listener count."""
+        with self._lock:
+            self._joined.setdefault(sid, set()).add(room)
+            listeners = self._rooms.setdefault(room, set())
+            listeners.add(sid)
+            room_joins.inc()
+            self._publish()
+            return len(listeners)
+
+    def leave(self, sid: str, room: str) -> bool:
+        """Drop ``sid`` from ``room``; return True if the room is now empty."""
+        with self._lock:
+            self._joined.get(sid, set()).discard(room)
+            emptied = self._discard(sid, room)
+            self._publish()
+            return emptied
+
+    def disconnect(self, sid: str) -> list[str]:
+        """Forget ``sid``; return the rooms nobody is listening to any more."""
+        with self._lock:
+            emptied = [room for room in self._joined.pop(sid, ()) if self._discard(sid, room)]
+            self._publish()
+            return emptied
+
+    def listeners(self, room: str) -> int:
+        with self._lock:
+            return len(self._rooms.get(str(room), ()))
+
+    def observe_fanout(self, event: str, room: str) -> None:
+        room_fanout.observe(self.listeners(room), event=event)
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = [len(sids) for sids in self._rooms.values()]
+            return {
+                "connections": len(self._joined),
+                "rooms": len(sizes),
+                "listeners": sum(sizes),
+                "max_room_listeners": max(sizes, default=0),
+            }
+
+    def _discard(self, sid: str, room: str) -> bool:
+        listeners = self._rooms.get(room)
+        if listeners is None:
+            return False
+        listeners.discard(sid)
+        if listeners:
+            return False
+        del self._rooms[room]
+        return True
+
+    def _publish(self) -> None:
+        connections_gauge.set(len(self._joined))
+        rooms_gauge.set(len(self._rooms))
+
+
+presence = PresenceRegistry()
+
+
+__all__ = ["PresenceRegistry", "presence"]
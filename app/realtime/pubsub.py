@@ -0,0 +1,147 @@
+"""Cross-process fan-out for Socket.IO emits.
+
+With ``SOCKETIO_MESSAGE_QUEUE`` set, every ``socketio.emit(..., room=...)`` is
+handled locally and published to the other workers, which deliver it to the
+clients connected to them. Supported URLs:
+
+- ``redis://``, ``amqp://``, ``kafka://``: Flask-SocketIO's own managers
+  (need ``redis`` / ``kombu`` / ``kafka-python`` installed);
+- ``sqlite:///path``: a polled outbox table, for several workers on one host
+  and for tests;
+- ``postgresql://``: ``LISTEN``/``NOTIFY`` on the application database.
+
+Messages are JSON (never pickled), so emitted data must be JSON-serializable.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import socketio
+
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS = float(os.getenv("SOCKETIO_QUEUE_POLL_SECONDS", "0.05"))
+RETENTION_SECONDS = float(os.getenv("SOCKETIO_QUEUE_RETENTION_SECONDS", "60"))
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more.
+NOTIFY_MAX_BYTES = 7999
+
+
+class SQLiteQueueManager(socketio.PubSubManager):
+    """Pub/sub over an append-only SQLite table polled by every worker."""
+
+    name = "sqlite"
+
+    def __init__(self, url: str, channel: str = "socketio", write_only: bool = False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = url.split("sqlite:///", 1)[-1]
+        self._local = threading.local()
+        self._last_prune = 0.0
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS socketio_messages "
+            "(id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, payload TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _publish(self, data):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO socketio_messages (channel, payload, created_at) VALUES (?, ?, ?)",
+            (self.channel, json.dumps(data), now),
+        )
+        if now - self._last_prune > RETENTION_SECONDS:
+            self._last_prune = now
+            conn.execute("DELETE FROM socketio_messages WHERE created_at < ?", (now - RETENTION_SECONDS,))
+
+    def _listen(self):
+        conn = self._conn()
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM socketio_messages").fetchone()[0]
+        while True:
+            try:
+                rows = conn.execute(
+                    "SELECT id, payload FROM socketio_messages WHERE id > ? AND channel = ? ORDER BY id",
+                    (last_id, self.channel),
+                ).fetchall()
+            except sqlite3.Error as exc:
+                logger.warning("socketio sqlite queue read failed: %s", exc)
+                rows = []
+            for row_id, payload in rows:
+                last_id = row_id
+                yield payload
+            if not rows:
+                self.server.sleep(POLL_SECONDS)
+
+
+class PostgresNotifyManager(socketio.PubSubManager):
+    """Pub/sub over Postgres ``LISTEN``/``NOTIFY`` (psycopg 3)."""
+
+    name = "postgres"
+
+    def __init__(self, url: str, channel: str = "socketio", write_only: bool = False, logger=None):
+        import psycopg
+
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._psycopg = psycopg
+        # Accept SQLAlchemy URLs such as postgresql+psycopg://.
+        scheme, rest = url.split("://", 1)
+        self.dsn = f"{scheme.split('+', 1)[0]}://{rest}"
+        self._publish_conn = None
+        self._publish_lock = threading.Lock()
+
+    def _publish(self, data):
+        payload = json.dumps(data)
+        if len(payload.encode("utf-8")) > NOTIFY_MAX_BYTES:
+            logger.error("socketio message too large for NOTIFY (%s bytes); delivered locally only", len(payload))
+            return
+        with self._publish_lock:
+            for attempt in (1, 2):
+                try:
+                    if self._publish_conn is None or self._publish_conn.closed:
+                        self._publish_conn = self._psycopg.connect(self.dsn, autocommit=True)
+                    self._publish_conn.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+                    return
+                except self._psycopg.OperationalError as exc:
+                    self._publish_conn = None
+                    if attempt == 2:
+                        logger.error("socketio NOTIFY failed: %s", exc)
+
+    def _listen(self):
+        sql = self._psycopg.sql
+        while True:
+            try:
+                with self._psycopg.connect(self.dsn, autocommit=True) as conn:
+                    conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+                    for notify in conn.notifies():
+                        yield notify.payload
+            except self._psycopg.Error as exc:
+                logger.warning("socketio LISTEN connection lost: %s; reconnecting", exc)
+                self.server.sleep(1)
+
+
+def message_queue_options(url: str | None, channel: str) -> dict:
+    """Keyword arguments for ``socketio.init_app`` selecting the fan-out backend."""
+    if not url:
+        return {}
+    scheme = url.split(":", 1)[0].lower()
+    if scheme == "sqlite":
+        return {"client_manager": SQLiteQueueManager(url, channel=channel)}
+    if scheme.startswith("postgres"):
+        return {"client_manager": PostgresNotifyManager(url, channel=channel)}
+    return {"message_queue": url, "channel": channel}
+
+
+__all__ = ["SQLiteQueueManager", "PostgresNotifyManager", "message_queue_options"]
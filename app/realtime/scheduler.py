@@ -1,23 +1,565 @@
-"""Background popup scheduler."""
+"""Popup scheduler.
+
+One cooperative loop (``socketio.start_background_task``) plays back every
+active simulation from a heap of due times, so a classroom starting at once
+costs heap entries rather than sleeping threads. Each simulation has at most
+one entry in the heap (its next popup); the gap after a popup is derived from
+its ``ttl`` so the next card arrives as the previous one leaves the screen.
+
+Each simulation is a record in a ``simulation_store`` (state, popups, display
+offsets and a wall-clock origin from which the cursor is derived); the heap
+only holds the simulations this worker is playing. Records change by
+compare-and-set on their ``generation``, so a simulation can be paused,
+resumed, cancelled or reported from any worker sharing the store, the worker
+playing it stops at its next wake-up once the generation moves on, and a
+second start for the same session is a no-op. State changes are emitted to
+the session room as ``simulation_state``.
+
+Simulations started in ``batch`` delivery send the whole list once as
+``popup_batch`` with display offsets and let the client schedule it; the
+server then only wakes up again when playback ends. ``stream`` delivery emits
+each ``popup`` from the server as before.
+
+When wired to the presence registry the scheduler does no work for rooms
+nobody is listening to: a simulation started before anyone joined, or whose
+room emptied, waits paused (``paused_by="no_listener"``) until a join resumes
+it.
+"""
 from __future__ import annotations
 
+import bisect
+import heapq
+import logging
+import os
 import threading
 import time
 
 from ..extensions import socketio
+from ..metrics import registry
+from .presence import presence
+from .simulation_store import LocalSimulationStore
+
+logger = logging.getLogger(__name__)
+
+# Seconds between popups = ttl (ms) / 1000 * factor, clamped to [min, max].
+POPUP_GAP_FACTOR = float(os.getenv("POPUP_GAP_FACTOR", "1.0"))
+POPUP_MIN_GAP_SECONDS = float(os.getenv("POPUP_MIN_GAP_SECONDS", "3"))
+POPUP_MAX_GAP_SECONDS = float(os.getenv("POPUP_MAX_GAP_SECONDS", "15"))
+MAX_SIMULATIONS = int(os.getenv("POPUP_SCHEDULER_MAX_SIMULATIONS", "20000"))
+
+STREAM = "stream"
+BATCH = "batch"
+DELIVERY_MODES = (STREAM, BATCH)
+
+PLAYING = "playing"
+PAUSED = "paused"
+FINISHED = "finished"
+CANCELLED = "cancelled"
+
+# ``paused_by`` of a simulation held back because its room has no listener.
+NO_LISTENER = "no_listener"
+
+emit_jitter = registry.histogram(
+    "popup_emit_jitter_seconds",
+    "Delay between a popup's due time and its emit.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+popups_emitted = registry.counter("popup_emits_total", "Popups emitted by the scheduler.")
+batches_emitted = registry.counter("popup_batches_total", "popup_batch events emitted for client-side playback.")
+popups_deferred = registry.counter(
+    "popup_deferred_total", "Simulation starts and popups held back because nobody was listening."
+)
+simulations_active = registry.gauge("popup_simulations_active", "Simulations this worker is playing.")
+
+
+class SchedulerFullError(RuntimeError):
+    """Raised when ``MAX_SIMULATIONS`` simulations are already playing."""
+
+
+def popup_gap(popup: dict) -> float:
+    ttl = popup.get("ttl") if isinstance(popup, dict) else None
+    try:
+        seconds = float(ttl) / 1000.0 * POPUP_GAP_FACTOR
+    except (TypeError, ValueError):
+        seconds = POPUP_MIN_GAP_SECONDS
+    return max(POPUP_MIN_GAP_SECONDS, min(POPUP_MAX_GAP_SECONDS, seconds))
+
+
+def popup_offsets(popups: list[dict], delay: float = 0.0) -> list[float]:
+    """Seconds from the start of playback at which each popup is shown."""
+    offsets = []
+    at = delay
+    for popup in popups:
+        offsets.append(at)
+        at += popup_gap(popup)
+    return offsets
+
+
+def _position(record: dict) -> float:
+    """Playback position in seconds (wall clock, so any worker can compute it)."""
+    if record["state"] == PLAYING:
+        return max(0.0, time.time() - record["origin"])
+    return record.get("elapsed") or 0.0
+
+
+def _state(record: dict) -> str:
+    """Stored state, except that a playing simulation past its last popup counts as finished."""
+    offsets = record["offsets"]
+    if record["state"] == PLAYING and (not offsets or _position(record) > offsets[-1]):
+        return FINISHED
+    return record["state"]
+
+
+def _status(record: dict, position: float | None = None) -> dict:
+    """Status at ``position`` (default: now); the cursor counts popups whose offset has passed."""
+    state = _state(record)
+    total = len(record["popups"])
+    position = _position(record) if position is None else position
+    return {
+        "session_id": record["session_id"],
+        "state": state,
+        "delivery": record["delivery"],
+        "cursor": total if state == FINISHED else bisect.bisect_left(record["offsets"], position),
+        "total": total,
+        "started_at": record["started_at"],
+        "paused_by": record["paused_by"],
+    }
+
+
+def _batch(record: dict, elapsed: float) -> dict:
+    """The popups still to show, with offsets relative to ``elapsed``."""
+    offsets = record["offsets"]
+    popups = record["popups"]
+    return {
+        "session_id": record["session_id"],
+        "total": len(popups),
+        "popups": [
+            {**popups[i], "index": i, "offset_ms": int(round((offsets[i] - elapsed) * 1000))}
+            for i in range(bisect.bisect_left(offsets, elapsed), len(popups))
+        ],
+    }
+
+
+class _Playback:
+    """What this worker needs to play one simulation; the record stays in the store."""
+
+    __slots__ = ("session_id", "popups", "offsets", "mode", "generation", "origin", "cursor")
+
+    def __init__(self, record: dict, elapsed: float):
+        self.session_id = record["session_id"]
+        self.popups = record["popups"]
+        self.offsets = record["offsets"]
+        self.mode = record["delivery"]
+        self.generation = record["generation"]
+        self.origin = time.monotonic() - elapsed
+        self.cursor = bisect.bisect_left(self.offsets, elapsed)
+
+    def next_entry(self) -> tuple[float, int, str, int]:
+        """Heap entry of the next wake-up; index ``len(popups)`` marks the end of a batch."""
+        if self.mode == BATCH:
+            return self.origin + self.offsets[-1], self.generation, self.session_id, len(self.popups)
+        return self.origin + self.offsets[self.cursor], self.generation, self.session_id, self.cursor
+
+    def clamp(self, position: float) -> float:
+        """Keep a stream position between the last popup sent and the next one due."""
+        if self.mode == BATCH:
+            return position
+        if self.cursor > 0:
+            position = max(position, self.offsets[self.cursor - 1] + 1e-6)
+        if self.cursor < len(self.offsets):
+            position = min(position, self.offsets[self.cursor])
+        return position
+
+
+class PopupScheduler:
+    """Heap-driven playback of all simulations on one background task.
+
+    ``emit``, ``spawn`` and ``event`` default to the Socket.IO server's so the
+    loop cooperates with eventlet/gevent; the benchmark swaps in a recorder.
+    The loop waits on that event (green under eventlet/gevent) until the
+    earliest entry is due, and anything that moves the head of the heap sets
+    it.
+    ``presence`` (a ``PresenceRegistry``) gates work on rooms having listeners;
+    without it every room counts as watched. ``store`` holds the simulation
+    records (``LocalSimulationStore`` unless the app factory shares them).
+    """
+
+    def __init__(
+        self,
+        emit=None,
+        spawn=None,
+        event=None,
+        max_simulations: int = MAX_SIMULATIONS,
+        presence=None,
+        store=None,
+    ):
+        self._emit = emit or (lambda event, data, room: socketio.emit(event, data, room=room))
+        self.presence = presence
+        self.store = store or LocalSimulationStore()
+        self._spawn = spawn or socketio.start_background_task
+        self.max_simulations = max_simulations
+        self._heap: list[tuple[float, int, str, int]] = []
+        self._simulations: dict[str, _Playback] = {}
+        self._lock = threading.Lock()
+        self._event = event
+        self._wake = None
+        self._running = False
+
+    def start(
+        self,
+        session_id: str,
+        popups: list[dict],
+        delay: float = 0.0,
+        restart: bool = False,
+        mode: str = STREAM,
+    ) -> tuple[dict, bool]:
+        """Play ``popups`` into the session room; return (status, started).
+
+        A session that is already playing, paused or finished is left alone
+        unless ``restart`` is set.
+        """
+        session_id = str(session_id)
+        popups = list(popups or [])
+        existing = self.store.load(session_id)
+        if existing is not None and not restart and _state(existing) != CANCELLED:
+            return self._report(existing), False
+        expected = existing["generation"] if existing is not None else 0
+        now = time.time()
+        record = {
+            "session_id": session_id,
+            "generation": expected + 1,
+            "state": PLAYING,
+            "delivery": mode,
+            "popups": popups,
+            "offsets": popup_offsets(popups, delay),
+            "origin": now,
+            "elapsed": 0.0,
+            "paused_by": None,
+            "started_at": now,
+        }
+        if not popups:
+            record["state"] = FINISHED
+        elif not self._watched(session_id):
+            # Nobody in the room yet (HTTP ahead of the socket join): wait for a join.
+            record.update(state=PAUSED, paused_by=NO_LISTENER)
+            popups_deferred.inc()
+        else:
+            with self._lock:
+                if session_id not in self._simulations and len(self._simulations) >= self.max_simulations:
+                    raise SchedulerFullError(f"{self.max_simulations} popup simulations already running")
+        if not self.store.save(record, expected):
+            # Another request started or replaced it first.
+            current = self.store.load(session_id)
+            return self._report(current if current is not None else record), False
+        if record["state"] == PLAYING:
+            self._play(record, 0.0)
+        else:
+            self._drop(session_id)
+        status = _status(record, 0.0)  # nothing has been shown yet
+        self._emit_state(status)
+        if record["state"] == PLAYING and mode == BATCH:
+            self._emit_batch(_batch(record, 0.0))
+        return status, True
+
+    def pause(self, session_id: str, by: str = "client") -> dict | None:
+        """Stop the clock on a playing simulation, keeping its cursor."""
+        return self._pause(str(session_id), by)
+
+    def resume(self, session_id: str, only_if_paused_by: tuple[str, ...] | None = None) -> dict | None:
+        """Continue a paused simulation from its cursor (only if paused for one of ``only_if_paused_by``)."""
+
+        def change(record):
+            if record["state"] != PAUSED or (
+                only_if_paused_by is not None and record["paused_by"] not in only_if_paused_by
+            ):
+                return None
+            record.update(state=PLAYING, origin=time.time() - record["elapsed"], paused_by=None)
+            return record
+
+        record, changed = self._transition(str(session_id), change)
+        if record is None or _state(record) in (FINISHED, CANCELLED):
+            return None
+        if not changed:
+            return self._report(record)
+        status = _status(record, record["elapsed"])
+        self._play(record, record["elapsed"])
+        self._emit_state(status)
+        if record["delivery"] == BATCH:
+            self._emit_batch(_batch(record, record["elapsed"]))
+        return status
+
+    def cancel(self, session_id: str) -> dict | None:
+        """Stop a simulation for good; a later start plays it from the beginning."""
+        session_id = str(session_id)
+        before = []
+
+        def change(record):
+            before.append(_state(record))
+            if record["state"] == CANCELLED:
+                return None
+            record.update(state=CANCELLED, elapsed=_position(record))
+            return record
+
+        record, changed = self._transition(session_id, change)
+        self._drop(session_id)
+        if record is None or before[-1] in (FINISHED, CANCELLED):
+            return None
+        status = _status(record)
+        if changed:
+            self._emit_state(status)
+        return status
+
+    def status(self, session_id: str) -> dict | None:
+        record = self.store.load(str(session_id))
+        if record is None or record["state"] == CANCELLED:
+            return None
+        return self._report(record)
+
+    def pending_batch(self, session_id: str) -> dict | None:
+        """Remaining ``popup_batch`` payload for a playing batch simulation, for late joiners."""
+        record = self.store.load(str(session_id))
+        if record is None or record["delivery"] != BATCH or _state(record) != PLAYING:
+            return None
+        return _batch(record, _position(record))
+
+    def active(self) -> int:
+        """Simulations this worker is playing."""
+        return len(self._simulations)
+
+    def _report(self, record: dict) -> dict:
+        """Status of ``record``, with the exact emitted count if this worker streams it."""
+        status = _status(record)
+        if status["state"] == PLAYING and record["delivery"] == STREAM:
+            with self._lock:
+                playback = self._simulations.get(record["session_id"])
+            if playback is not None and playback.generation == record["generation"]:
+                status["cursor"] = playback.cursor
+        return status
+
+    def _transition(self, session_id: str, change) -> tuple[dict | None, bool]:
+        """Apply ``change`` to the stored record with compare-and-set; return (record, changed).
+
+        ``change`` gets a shallow copy of the record and returns it with top-level
+        keys replaced, or None to leave it alone.
+        """
+        for _ in range(3):
+            record = self.store.load(session_id)
+            if record is None:
+                return None, False
+            expected = record["generation"]
+            updated = change(dict(record))
+            if updated is None:
+                return record, False
+            updated["generation"] = expected + 1
+            if self.store.save(updated, expected):
+                if updated["state"] != PLAYING:
+                    self._drop(session_id)
+                return updated, True
+        logger.warning("simulation update kept losing races session=%s", session_id)
+        return self.store.load(session_id), False
+
+    def _pause(
+        self, session_id: str, by: str, position: float | None = None, generation: int | None = None
+    ) -> dict | None:
+        with self._lock:
+            playback = self._simulations.get(session_id)
+
+        def change(record):
+            if generation is not None and record["generation"] != generation:
+                return None
+            if _state(record) != PLAYING:
+                return None
+            at = _position(record) if position is None else position
+            if playback is not None and playback.generation == record["generation"]:
+                at = playback.clamp(at)
+            record.update(state=PAUSED, elapsed=at, paused_by=by)
+            return record
+
+        record, changed = self._transition(session_id, change)
+        if record is None or _state(record) in (FINISHED, CANCELLED):
+            return None
+        status = _status(record)
+        if changed:
+            self._emit_state(status)
+        return status
+
+    def _finish(self, playback: _Playback) -> None:
+        def change(record):
+            if record["generation"] != playback.generation:
+                return None  # paused, cancelled or replaced elsewhere
+            record.update(state=FINISHED, elapsed=record["offsets"][-1])
+            return record
+
+        record, changed = self._transition(playback.session_id, change)
+        if changed:
+            self._emit_state(_status(record))
+        with self._lock:
+            if self._simulations.get(playback.session_id) is playback:
+                del self._simulations[playback.session_id]
+            simulations_active.set(len(self._simulations))
+
+    def _play(self, record: dict, elapsed: float) -> None:
+        playback = _Playback(record, elapsed)
+        entry = playback.next_entry()
+        with self._lock:
+            self._simulations[playback.session_id] = playback
+            if self._heap and entry < self._heap[0]:
+                self._wake_event().set()  # due before whatever the loop is sleeping towards
+            heapq.heappush(self._heap, entry)
+            simulations_active.set(len(self._simulations))
+            self._ensure_running()
+
+    def _drop(self, session_id: str) -> None:
+        """Forget the local playback; the loop wakes to discard its heap entry."""
+        with self._lock:
+            if self._simulations.pop(session_id, None) is not None:
+                self._wake_event().set()
+            simulations_active.set(len(self._simulations))
+
+    def _wake_event(self):
+        """The loop's wake-up event, created on first use (after ``socketio.init_app``)."""
+        if self._wake is None:
+            if self._event is not None:
+                self._wake = self._event()
+            elif socketio.server is not None:
+                self._wake = socketio.server.eio.create_event()
+            else:
+                self._wake = threading.Event()
+        return self._wake
+
+    def _watched(self, room: str) -> bool:
+        return self.presence is None or self.presence.listeners(room) > 0
+
+    def _send(self, event: str, data: dict, room: str) -> None:
+        if self.presence is not None:
+            self.presence.observe_fanout(event, room)
+        self._emit(event, data, room)
+
+    def _emit_state(self, status: dict) -> None:
+        try:
+            self._send("simulation_state", status, status["session_id"])
+        except Exception as exc:  # pragma: no cover - state events are advisory
+            logger.warning("simulation_state emit failed session=%s: %s", status["session_id"], exc)
+
+    def _emit_batch(self, batch: dict) -> None:
+        try:
+            self._send("popup_batch", batch, batch["session_id"])
+            batches_emitted.inc()
+        except Exception as exc:  # pragma: no cover - the client can rejoin for a fresh batch
+            logger.warning("popup_batch emit failed session=%s: %s", batch["session_id"], exc)
+
+    def _ensure_running(self) -> None:
+        if not self._running:
+            self._running = True
+            self._spawn(self._run)
+
+    def _due(self, now: float) -> tuple[list[tuple[float, str, dict]], list[_Playback], list[tuple[_Playback, int]]]:
+        """Pop due entries, queue each simulation's next popup; return (due popups, finished, deferred)."""
+        popped = []
+        with self._lock:
+            while self._heap:
+                due_at, generation, session_id, index = self._heap[0]
+                playback = self._simulations.get(session_id)
+                if playback is not None and playback.generation == generation and due_at > now:
+                    break
+                heapq.heappop(self._heap)
+                if playback is None or playback.generation != generation:
+                    continue  # paused, cancelled or replaced: drop it now rather than when due
+                popped.append((due_at, playback, index))
+        if not popped:
+            return [], [], []
+        # Another worker may have paused, cancelled or restarted it since.
+        current = self.store.generations({playback.session_id for _, playback, _ in popped})
+        due = []
+        finished = []
+        deferred = []
+        with self._lock:
+            for due_at, playback, index in popped:
+                session_id = playback.session_id
+                if self._simulations.get(session_id) is not playback:
+                    continue
+                generation = current.get(session_id, 0)
+                if generation is not None and generation != playback.generation:
+                    del self._simulations[session_id]
+                    continue
+                if index >= len(playback.popups):
+                    # End of a client-scheduled batch; still active until _finish records it.
+                    finished.append(playback)
+                    continue
+                if not self._watched(session_id):
+                    # Nobody is listening (e.g. resumed over HTTP after the tab closed).
+                    del self._simulations[session_id]
+                    deferred.append((playback, index))
+                    continue
+                popup = playback.popups[index]
+                due.append((due_at, session_id, {**popup, "index": index}))
+                playback.cursor = index + 1
+                if playback.cursor < len(playback.popups):
+                    heapq.heappush(self._heap, playback.next_entry())
+                else:
+                    finished.append(playback)
+            simulations_active.set(len(self._simulations))
+        return due, finished, deferred
+
+    def _run(self) -> None:
+        while True:
+            due, finished, deferred = self._due(time.monotonic())
+            for due_at, session_id, popup in due:
+                try:
+                    self._send("popup", popup, session_id)
+                except Exception as exc:  # pragma: no cover - keep the loop alive
+                    logger.warning("popup emit failed session=%s: %s", session_id, exc)
+                emit_jitter.observe(max(0.0, time.monotonic() - due_at))
+                popups_emitted.inc()
+            for playback in finished:
+                self._finish(playback)
+            for playback, index in deferred:
+                popups_deferred.inc()
+                self._pause(
+                    playback.session_id, NO_LISTENER, position=playback.offsets[index], generation=playback.generation
+                )
+            with self._lock:
+                if not self._heap:
+                    self._running = False
+                    return
+                wake = self._wake_event()
+                wake.clear()
+                wait = self._heap[0][0] - time.monotonic()
+            if wait > 0:
+                wake.wait(wait)
+
+
+scheduler = PopupScheduler(presence=presence)
 
 
-def start_popup_simulation(session_id: str, popups: list[dict]) -> None:
-    """Emit popup payloads sequentially into session-specific room."""
+def start_popup_simulation(
+    session_id: str,
+    popups: list[dict],
+    restart: bool = False,
+    mode: str = STREAM,
+) -> tuple[dict, bool]:
+    """Schedule popup payloads into the session-specific room (no-op if already started)."""
+    return scheduler.start(session_id, popups, restart=restart, mode=mode)
 
-    def run() -> None:
-        room = str(session_id)
-        for popup in list(popups or []):
-            socketio.emit("popup", popup, room=room)
-            time.sleep(3)
-            socketio.emit("popup", popup, room=room)
 
-    threading.Thread(target=run, daemon=True).start()
+def cancel_popup_simulation(session_id: str) -> dict | None:
+    return scheduler.cancel(session_id)
 
 
-__all__ = ["start_popup_simulation"]
+__all__ = [
+    "PopupScheduler",
+    "SchedulerFullError",
+    "scheduler",
+    "popup_gap",
+    "popup_offsets",
+    "start_popup_simulation",
+    "cancel_popup_simulation",
+    "PLAYING",
+    "PAUSED",
+    "FINISHED",
+    "CANCELLED",
+    "NO_LISTENER",
+    "STREAM",
+    "BATCH",
+    "DELIVERY_MODES",
+]
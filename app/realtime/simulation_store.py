@@ -0,0 +1,123 @@
+"""Where popup simulation state lives.
+
+The scheduler treats a simulation *record* (state, delivery, popups, offsets,
+playback position, ``generation``) as the source of truth and only keeps a
+local executor for simulations it is playing. Every change is a compare-and-set
+on ``generation``, so any worker can pause, resume, cancel or report a
+simulation another worker started, and the playing worker drops its executor
+when it sees a newer generation.
+
+``LocalSimulationStore`` keeps records in this process (single worker, tests,
+benchmarks); ``DatabaseSimulationStore`` keeps them in the
+``popup_simulations`` table for workers sharing a message queue.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from ..db.models import USE_SQLITE, PopupSimulation
+from ..extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Records kept by the in-process store (finished ones keep a repeated start a no-op).
+LOCAL_RETENTION = int(os.getenv("POPUP_SCHEDULER_FINISHED_RETENTION", "10000")) + int(
+    os.getenv("POPUP_SCHEDULER_MAX_SIMULATIONS", "20000")
+)
+
+
+class LocalSimulationStore:
+    """Simulation records in this process.
+
+    Copies are shallow: the scheduler replaces a record's top-level values and
+    never mutates its ``popups`` or ``offsets`` in place.
+    """
+
+    def __init__(self, retention: int = LOCAL_RETENTION):
+        self.retention = retention
+        self._records: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> dict | None:
+        with self._lock:
+            record = self._records.get(session_id)
+            return dict(record) if record is not None else None
+
+    def save(self, record: dict, expected_generation: int) -> bool:
+        """Store ``record`` if the current generation is ``expected_generation`` (0: none yet)."""
+        session_id = record["session_id"]
+        with self._lock:
+            current = self._records.get(session_id)
+            if (current["generation"] if current is not None else 0) != expected_generation:
+                return False
+            self._records[session_id] = dict(record)
+            self._records.move_to_end(session_id)
+            while len(self._records) > self.retention:
+                self._records.popitem(last=False)
+            return True
+
+    def generations(self, session_ids) -> dict[str, int]:
+        with self._lock:
+            return {sid: self._records[sid]["generation"] for sid in session_ids if sid in self._records}
+
+
+class DatabaseSimulationStore:
+    """Simulation records in the ``popup_simulations`` table (shared by all workers)."""
+
+    def __init__(self, app):
+        self.app = app
+        self.table = PopupSimulation.__table__
+
+    def _key(self, session_id: str):
+        return session_id if USE_SQLITE else uuid.UUID(str(session_id))
+
+    def load(self, session_id: str) -> dict | None:
+        with self.app.app_context(), db.engine.connect() as conn:
+            row = conn.execute(
+                select(self.table.c.record).where(self.table.c.session_id == self._key(session_id))
+            ).first()
+        return dict(row.record) if row is not None else None
+
+    def save(self, record: dict, expected_generation: int) -> bool:
+        values = {"generation": record["generation"], "state": record["state"], "record": record}
+        key = self._key(record["session_id"])
+        try:
+            with self.app.app_context(), db.engine.begin() as conn:
+                if expected_generation == 0:
+                    conn.execute(insert(self.table).values(session_id=key, **values))
+                    return True
+                result = conn.execute(
+                    update(self.table)
+                    .where(self.table.c.session_id == key, self.table.c.generation == expected_generation)
+                    .values(**values)
+                )
+                return result.rowcount == 1
+        except IntegrityError:
+            return False  # another worker created it first
+
+    def generations(self, session_ids) -> dict[str, int]:
+        keys = {self._key(sid): sid for sid in session_ids}
+        if not keys:
+            return {}
+        try:
+            with self.app.app_context(), db.engine.connect() as conn:
+                rows = conn.execute(
+                    select(self.table.c.session_id, self.table.c.generation).where(
+                        self.table.c.session_id.in_(list(keys))
+                    )
+                ).all()
+        except SQLAlchemyError as exc:
+            # Keep playing on a database hiccup rather than dropping every simulation.
+            logger.warning("simulation generation check failed: %s", exc)
+            return {sid: None for sid in session_ids}
+        return {keys[row.session_id]: row.generation for row in rows}
+
+
+__all__ = ["LocalSimulationStore", "DatabaseSimulationStore"]
@@ -1,24 +1,122 @@
-"""Socket.IO events."""
+"""Socket.IO events.
+
+Besides room membership and simulation control, the question loop runs over
+the socket: ``next_question`` and ``answer`` call the same session service as
+``POST /session/<id>/next-question`` and ``/answer`` (so idempotency, conflict
+retries and ``fields`` behave identically) and are answered via ack as
+``{ok, status, data}``.
+"""
 from __future__ import annotations
 
+from flask import request
 from flask_socketio import emit, join_room
 
 from ..extensions import socketio
+from ..metrics import registry
+from ..services import session_service
+from ..services.projection import FieldsError, parse_fields
+from .presence import presence
+from .scheduler import NO_LISTENER, scheduler
+
+DISCONNECT = "disconnect"
+
+socket_calls = registry.counter(
+    "socketio_session_calls_total",
+    "Question-loop calls served over Socket.IO by event and status code.",
+    labels=("event", "status"),
+)
+
+
+def _session_id(data) -> str:
+    return str((data or {}).get("session_id") or "")
 
 
 @socketio.on("connect")
 def on_connect():
+    presence.connect(request.sid)
     emit("server_hello", {"ok": True, "message": "Socket connected"})
 
 
 @socketio.on("join_session")
 def on_join_session(data):
-    session_id = str((data or {}).get("session_id") or "")
+    session_id = _session_id(data)
     if session_id:
         join_room(session_id)
-        emit("joined", {"ok": True, "session_id": session_id})
+        listeners = presence.join(request.sid, session_id)
+        emit("joined", {"ok": True, "session_id": session_id, "listeners": listeners})
+        # A reconnect or refresh picks playback up where the disconnect left it, and a
+        # simulation started before anyone joined begins now.
+        batch = scheduler.pending_batch(session_id)
+        simulation = scheduler.resume(session_id, only_if_paused_by=(DISCONNECT, NO_LISTENER))
+        if simulation is not None:
+            emit("simulation_state", simulation)
+        if batch is not None:
+            # Batch playback already running: hand this client the rest of the schedule.
+            # (A resumed batch simulation has just sent it to the whole room.)
+            emit("popup_batch", batch)
+
+
+def _control(action, data):
+    session_id = _session_id(data)
+    simulation = action(session_id) if session_id else None
+    if simulation is None:
+        return {"ok": False, "error": "no active simulation for this session"}
+    return {"ok": True, "simulation": simulation}
+
+
+@socketio.on("pause_simulation")
+def on_pause_simulation(data):
+    return _control(scheduler.pause, data)
+
+
+@socketio.on("resume_simulation")
+def on_resume_simulation(data):
+    return _control(scheduler.resume, data)
+
+
+@socketio.on("cancel_simulation")
+def on_cancel_simulation(data):
+    return _control(scheduler.cancel, data)
+
+
+def _session_call(event: str, data):
+    """Run ``event`` through the session service and shape the ack."""
+    payload = dict(data or {}) if isinstance(data, dict) else {}
+    session_id = str(payload.pop("session_id", "") or "")
+    key = str(payload.pop("idempotency_key", "") or "")
+    if not session_id:
+        body, status, replayed = {"error": "session_id is required"}, 400, False
+    else:
+        try:
+            fields = parse_fields(payload.pop("fields", None))
+        except FieldsError as exc:
+            body, status, replayed = {"error": str(exc)}, 400, False
+        else:
+            body, status, replayed = session_service.handle(event, session_id, payload, fields, key)
+    socket_calls.inc(event=event, status=status)
+    ack = {"ok": status < 400, "status": status, "data": body}
+    if replayed:
+        ack["replayed"] = True
+    return ack
+
+
+@socketio.on("next_question")
+def on_next_question(data):
+    return _session_call("next_question", data)
+
+
+@socketio.on("answer")
+def on_answer(data):
+    return _session_call("answer", data)
 
 
 @socketio.on("disconnect")
 def on_disconnect():
-    return None
+    # Pause playback nobody is watching; the next join resumes it. With a message
+    # queue the room may still have listeners on another worker, so presence
+    # gating is off and only the registry is updated.
+    emptied = presence.disconnect(request.sid)
+    if scheduler.presence is None:
+        return
+    for room in emptied:
+        scheduler.pause(room, by=DISCONNECT)
@@ -0,0 +1,119 @@
+"""Fill several slots from one free-text answer."""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+
+from pydantic import ValidationError
+
+from .llm_metrics import record_fallback, record_parse_failure
+from .openai_client import CircuitOpenError, chat_json
+from .slot_manager import get_missing_slots, is_slot_negated
+from .slot_prefill_schema import SlotPrefillResponse
+
+logger = logging.getLogger(__name__)
+
+# Shorter answers rarely carry more than the slot that was asked.
+MIN_WORDS = int(os.getenv("ANSWER_EXTRACT_MIN_WORDS", "4"))
+
+SYSTEM_PROMPT_ANSWER_EXTRACT = """
+A student answered one question in a stress-test interview. Besides the asked slot,
+the answer may also state values for other open slots.
+
+Return ONLY JSON:
+{"prefill": {"time_pressure": {"study_hours_per_day": "3 hours"}}, "negated_slots": []}
+
+Rules:
+- Consider ONLY the slots listed in open_slots; never fill asked_slot.
+- Fill a slot only when the answer states it explicitly. Do not guess or infer.
+- Values are short (1-8 words) and copied or lightly normalized from the answer.
+- negated_slots: open slot names the answer explicitly says do NOT apply.
+- If nothing else is stated, return {"prefill": {}, "negated_slots": []}.
+"""
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _grounded(value: str, answer: str) -> bool:
+    """Require a word of the value (or its digits) to appear in the answer."""
+    answer_tokens = set(_TOKEN.findall(answer.lower()))
+    value_tokens = [t for t in _TOKEN.findall(value.lower()) if len(t) >= 3 or t.isdigit()]
+    return any(token in answer_tokens for token in value_tokens)
+
+
+def extract_answer_slots(
+    answer: str,
+    domain: str,
+    slot: str,
+    active_domains: list[str],
+    filled_slots: dict,
+    timeout: float | None = None,
+) -> tuple[dict[str, dict[str, str]], list[str]]:
+    """Return (extra slot values, negated slots) stated in ``answer``.
+
+    Merging is conservative: only slots in the active domains that are still
+    missing and not negated are considered, the asked slot is never touched,
+    and every value must be grounded in the answer text.
+    """
+    text = " ".join((answer or "").split())[:1000]
+    if len(text.split()) < MIN_WORDS:
+        return {}, []
+
+    open_slots = [
+        (d, s)
+        for d, s in get_missing_slots(active_domains or [], filled_slots or {})
+        if (d, s) != (domain, slot) and not is_slot_negated(filled_slots or {}, s)
+    ]
+    if not open_slots:
+        return {}, []
+
+    open_by_domain: dict[str, list[str]] = {}
+    for d, s in open_slots:
+        open_by_domain.setdefault(d, []).append(s)
+
+    payload = {
+        "asked_slot": {"domain": domain, "slot": slot},
+        "answer": text,
+        "open_slots": open_by_domain,
+    }
+    try:
+        resp = chat_json(
+            model="gpt-5-mini",
+            system=SYSTEM_PROMPT_ANSWER_EXTRACT,
+            user=json.dumps(payload, ensure_ascii=False),
+            timeout=timeout,
+            call_site="extract",
+            validate=lambda content: SlotPrefillResponse(**json.loads(content)),
+        )
+        raw = (resp.choices[0].message.content or "").strip()
+        parsed = SlotPrefillResponse(**json.loads(raw))
+    except (json.JSONDecodeError, ValidationError, TypeError) as exc:
+        record_parse_failure("extract")
+        record_fallback("extract")
+        logger.warning("answer extraction unparseable: %s", exc)
+        return {}, []
+    except CircuitOpenError as exc:
+        record_fallback("extract")
+        logger.warning("answer extraction skipped: %s", exc)
+        return {}, []
+    except Exception as exc:  # pragma: no cover - extraction is best effort
+        record_fallback("extract")
+        logger.warning("answer extraction failed: %s", exc)
+        return {}, []
+
+    extra: dict[str, dict[str, str]] = {}
+    for d, values in parsed.prefill.items():
+        for s, value in values.items():
+            if s in open_by_domain.get(d, []) and _grounded(value, text):
+                extra.setdefault(d, {})[s] = value
+    filled_names = {s for values in extra.values() for s in values}
+    open_names = {s for _, s in open_slots}
+    negated = [s for s in parsed.negated_slots if s in open_names and s not in filled_names]
+    if extra or negated:
+        logger.info("answer extraction filled=%s negated=%s", sorted(filled_names), negated)
+    return extra, negated
+
+
+__all__ = ["extract_answer_slots", "SYSTEM_PROMPT_ANSWER_EXTRACT"]
@@ -0,0 +1,65 @@
+"""Worker pools for off-request work.
+
+Request-critical intake calls, question pregeneration and popup jobs run on
+separate pools, so a burst of popup generation can't queue ``/session/start``
+intake behind it.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+
+INTAKE_WORKERS = int(os.getenv("INTAKE_WORKERS", "8"))
+BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", "8"))
+POPUP_WORKERS = int(os.getenv("POPUP_WORKERS", "4"))
+
+intake_executor = ThreadPoolExecutor(max_workers=INTAKE_WORKERS, thread_name_prefix="stress-intake")
+executor = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="stress-bg")
+popup_executor = ThreadPoolExecutor(max_workers=POPUP_WORKERS, thread_name_prefix="stress-popup")
+
+_locks: "weakref.WeakValueDictionary[str, threading.RLock]" = weakref.WeakValueDictionary()
+_locks_guard = threading.Lock()
+
+
+def submit(fn, *args, **kwargs) -> Future:
+    """Run ``fn`` on the background pool (green threads when eventlet monkey-patches)."""
+    return executor.submit(fn, *args, **kwargs)
+
+
+def submit_intake(fn, *args, **kwargs) -> Future:
+    """Run latency-critical intake work on its own pool."""
+    return intake_executor.submit(fn, *args, **kwargs)
+
+
+def submit_popup(fn, *args, **kwargs) -> Future:
+    """Run popup generation jobs on their own pool."""
+    return popup_executor.submit(fn, *args, **kwargs)
+
+
+def keyed_lock(key: str) -> threading.RLock:
+    """Process-local lock for ``key``; dropped once nobody holds a reference."""
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = threading.RLock()
+            _locks[key] = lock
+        return lock
+
+
+def session_lock(session_id) -> threading.RLock:
+    """Per-session lock serializing background read-modify-write of a session row in this process."""
+    return keyed_lock(f"session:{session_id}")
+
+
+__all__ = [
+    "executor",
+    "intake_executor",
+    "popup_executor",
+    "submit",
+    "submit_intake",
+    "submit_popup",
+    "keyed_lock",
+    "session_lock",
+]
@@ -0,0 +1,155 @@
+"""Pluggable byte-value cache backends."""
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryLRUBackend:
+    """In-process LRU bounded by total value size in bytes."""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.evictions = 0
+        self._items: OrderedDict[str, tuple[bytes, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                self._drop(key)
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            if key in self._items:
+                self._drop(key)
+            self._items[key] = (value, expires_at)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._items:
+                oldest = next(iter(self._items))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._items:
+                self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def _drop(self, key: str) -> None:
+        value, _ = self._items.pop(key)
+        self.current_bytes -= len(value)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "entries": len(self._items),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+
+class SQLiteBackend:
+    """On-disk store shared by every worker on the host."""
+
+    def __init__(self, path: str, table: str = "cache_entries"):
+        self.path = path
+        self.table = table
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            row = self._conn().execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as exc:
+            logger.warning("sqlite cache read failed: %s", exc)
+            return None
+        if not row:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            self.delete(key)
+            return None
+        return bytes(value)
+
+    def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        try:
+            self._conn().execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, sqlite3.Binary(value), expires_at),
+            )
+        except sqlite3.Error as exc:
+            logger.warning("sqlite cache write failed: %s", exc)
+
+    def delete(self, key: str) -> None:
+        try:
+            self._conn().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+        except sqlite3.Error as exc:
+            logger.warning("sqlite cache delete failed: %s", exc)
+
+    def clear(self) -> None:
+        self._conn().execute(f"DELETE FROM {self.table}")
+
+    def stats(self) -> dict:
+        try:
+            entries, size = self._conn().execute(
+                f"SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM {self.table}"
+            ).fetchone()
+        except sqlite3.Error:
+            entries, size = 0, 0
+        return {"backend": "sqlite", "path": self.path, "entries": entries, "bytes": size}
+
+
+def build_backend(kind: str, *, max_bytes: int, path: str, table: str = "cache_entries"):
+    """Return a backend for ``memory``/``sqlite``; anything else disables caching."""
+    kind = (kind or "").strip().lower()
+    if kind == "memory":
+        return MemoryLRUBackend(max_bytes=max_bytes)
+    if kind == "sqlite":
+        return SQLiteBackend(path, table=table)
+    return None
+
+
+__all__ = ["MemoryLRUBackend", "SQLiteBackend", "build_backend"]
@@ -0,0 +1,112 @@
+"""Process-wide circuit breaker for upstream dependencies."""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream that is known to be down."""
+
+
+class CircuitBreaker:
+    """Trip after consecutive failures, then probe with a few half-open calls."""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = max(1, half_open_max_calls)
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+        self.half_open_in_flight = 0
+        self.trips = 0
+        self.rejected = 0
+        self.last_error: str | None = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Return True if a call may proceed; half-open admits a bounded number of probes."""
+        with self._lock:
+            if self.state == OPEN:
+                if self.opened_at is not None and time.monotonic() - self.opened_at >= self.reset_timeout:
+                    self.state = HALF_OPEN
+                    self.half_open_in_flight = 0
+                    logger.info("circuit %s half-open", self.name)
+                else:
+                    self.rejected += 1
+                    return False
+            if self.state == HALF_OPEN:
+                if self.half_open_in_flight >= self.half_open_max_calls:
+                    self.rejected += 1
+                    return False
+                self.half_open_in_flight += 1
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("circuit %s closed", self.name)
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.half_open_in_flight = 0
+
+    def record_failure(self, exc: BaseException | None = None) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if exc is not None:
+                self.last_error = f"{type(exc).__name__}: {exc}"[:200]
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.trips += 1
+                    logger.warning(
+                        "circuit %s open after %s failures: %s",
+                        self.name,
+                        self.consecutive_failures,
+                        self.last_error,
+                    )
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.half_open_in_flight = 0
+
+    def release(self) -> None:
+        """Free a half-open probe slot without judging upstream health."""
+        with self._lock:
+            if self.state == HALF_OPEN and self.half_open_in_flight > 0:
+                self.half_open_in_flight -= 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN and self.opened_at is not None:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            return {
+                "name": self.name,
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+                "retry_in": retry_in,
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "last_error": self.last_error,
+            }
+
+
+__all__ = ["CircuitBreaker", "CircuitOpenError", "CLOSED", "OPEN", "HALF_OPEN"]
@@ -0,0 +1,327 @@
+"""Offline stand-in for the OpenAI client (``LLM_BACKEND=fake``).
+
+Recognises each system prompt used by the services and answers with
+schema-valid canned JSON after a configurable latency. Errors are raised as
+real ``openai`` exceptions so retries, fallbacks and the circuit breaker
+behave exactly as they would against the provider.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+
+import httpx
+from openai import APIConnectionError, APITimeoutError
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from ..constants import SLOT_SCHEMA
+
+LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))
+LATENCY_SIGMA = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.4"))
+ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+SEED = os.getenv("FAKE_LLM_SEED")
+# Share of the sampled latency spent before the first streamed token.
+FIRST_TOKEN_SHARE = float(os.getenv("FAKE_LLM_FIRST_TOKEN_SHARE", "0.2"))
+STREAM_CHUNK_CHARS = 24
+
+DOMAIN_CAUSES = {
+    "family_pressure": "family_pressure",
+    "distractions": "digital_distraction",
+    "social_comparison": "social_distraction",
+    "academic_confidence": "academic_confidence",
+    "time_pressure": "time_pressure",
+}
+
+APP_NAMES = ["instagram", "youtube", "snapchat", "whatsapp", "bgmi", "free fire"]
+SUBJECTS = ["physics", "chemistry", "maths", "math", "biology"]
+
+POPUP_LINES = [
+    ("panic", "Clock is running, page is still blank 😬", "Half the paper left and you are stuck on Q3"),
+    ("pressure", "Everyone expects a top rank from you 📉", "Results day is coming whether you are ready or not"),
+    ("self_doubt", "Did you even revise this chapter? 🤔", "Feels like seeing this topic for the first time"),
+    ("distraction", "Your phone just buzzed again 📱", "One quick peek will not hurt, right?"),
+    ("motivation", "Dream college seat is slipping away 🎯", "Tiny effort now beats big regret later"),
+    ("panic", "Heart racing like the bell already rang ⏰", "Ten questions left and five minutes to go"),
+    ("pressure", "Cutoff went up again this year 📈", "Every mark counts and you just lost two"),
+    ("self_doubt", "That answer looks wrong now 😶", "Change it or leave it, decide fast"),
+    ("distraction", "Reels will still be there after this 🙃", "Focus for ten minutes, then check it"),
+    ("panic", "Silly mistake on the easiest question 😵", "Negative marking is watching you"),
+    ("pressure", "Coaching fees paid, now show the result 💸", "No excuses left on this paper"),
+    ("self_doubt", "Topper finished this section already 🏃", "You are still reading question one"),
+]
+
+
+def _seeded_random() -> random.Random:
+    return random.Random(int(SEED)) if SEED else random.Random()
+
+
+class _Completions:
+    def __init__(self, backend: "FakeOpenAI"):
+        self._backend = backend
+
+    def create(self, *, model: str, messages: list[dict], timeout=None, stream: bool = False, **kwargs):
+        if stream:
+            return self._backend.stream(model, messages, timeout)
+        return self._backend.complete(model, messages, timeout)
+
+
+class _Chat:
+    def __init__(self, backend: "FakeOpenAI"):
+        self.completions = _Completions(backend)
+
+
+class _Models:
+    def list(self, **kwargs):
+        return []
+
+
+class FakeOpenAI:
+    """Duck-typed subset of ``openai.OpenAI`` used by ``openai_client``."""
+
+    def __init__(
+        self,
+        latency_ms: float = LATENCY_MS,
+        latency_sigma: float = LATENCY_SIGMA,
+        error_rate: float = ERROR_RATE,
+    ):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.chat = _Chat(self)
+        self.models = _Models()
+        self._random = _seeded_random()
+        self._random_lock = threading.Lock()
+        self._handlers: dict[str, object] | None = None
+
+    def with_options(self, **_options) -> "FakeOpenAI":
+        # No retries to turn off.
+        return self
+
+    # Latency / failure model ---------------------------------------------
+    def _sample(self) -> tuple[float, bool]:
+        """Return (latency seconds, should_fail) from a log-normal around ``latency_ms``."""
+        with self._random_lock:
+            jitter = self._random.gauss(0.0, self.latency_sigma) if self.latency_sigma > 0 else 0.0
+            fail = self._random.random() < self.error_rate
+        return max(0.0, self.latency_ms * math.exp(jitter) / 1000.0), fail
+
+    @staticmethod
+    def _timeout_seconds(timeout) -> float | None:
+        if isinstance(timeout, httpx.Timeout):
+            return timeout.read
+        if isinstance(timeout, (int, float)):
+            return float(timeout)
+        return None
+
+    def _prepare(self, messages: list[dict], timeout, first_share: float = 1.0) -> tuple[str, str, float]:
+        """Sleep until the (first) response byte, raising injected failures; return prompt and remaining latency."""
+        system = messages[0]["content"] if messages else ""
+        user = messages[-1]["content"] if len(messages) > 1 else ""
+        latency, fail = self._sample()
+        request = httpx.Request("POST", "https://fake-llm.local/v1/chat/completions")
+
+        wait = latency * first_share
+        limit = self._timeout_seconds(timeout)
+        if limit is not None and wait > limit:
+            time.sleep(limit)
+            raise APITimeoutError(request=request)
+        time.sleep(wait)
+        if fail:
+            raise APIConnectionError(message="fake LLM injected failure", request=request)
+        return system, user, latency - wait
+
+    @staticmethod
+    def _usage(system: str, user: str, content: str) -> dict:
+        prompt_tokens = (len(system) + len(user)) // 4
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_tokens + len(content) // 4,
+        }
+
+    def complete(self, model: str, messages: list[dict], timeout=None) -> ChatCompletion:
+        system, user, _ = self._prepare(messages, timeout)
+        content = self._respond(system, user)
+        return ChatCompletion.model_validate(
+            {
+                "id": f"fake-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }
+                ],
+                "usage": self._usage(system, user, content),
+            }
+        )
+
+    def stream(self, model: str, messages: list[dict], timeout=None):
+        """Yield ``ChatCompletionChunk`` objects, spreading the remaining latency over the content."""
+        system, user, remaining = self._prepare(messages, timeout, FIRST_TOKEN_SHARE)
+        content = self._respond(system, user)
+        pieces = [content[i : i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+        pause = remaining / max(1, len(pieces))
+        completion_id = f"fake-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        def chunk(choices: list[dict], usage: dict | None = None) -> ChatCompletionChunk:
+            return ChatCompletionChunk.model_validate(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": choices,
+                    "usage": usage,
+                }
+            )
+
+        for index, piece in enumerate(pieces):
+            if index:
+                time.sleep(pause)
+            yield chunk([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+        yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        yield chunk([], self._usage(system, user, content))
+
+    # Prompt recognition ----------------------------------------------------
+    def _respond(self, system: str, user: str) -> str:
+        if self._handlers is None:
+            # Imported lazily: every service module imports openai_client.
+            from .answer_extractor import SYSTEM_PROMPT_ANSWER_EXTRACT
+            from .intake_analyzer import SYSTEM_PROMPT_INTAKE
+            from .popup_generator import SYSTEM_PROMPT_POPUPS
+            from .question_generator import SYSTEM_PROMPT_QUESTION
+            from .question_mutator import SYSTEM_PROMPT_MUTATE
+            from .slot_gate_llm import SYSTEM_PROMPT_SLOT_GATE, SYSTEM_PROMPT_SLOT_GATE_BATCH
+
+            self._handlers = {
+                SYSTEM_PROMPT_INTAKE: _intake,
+                SYSTEM_PROMPT_SLOT_GATE: _gate,
+                SYSTEM_PROMPT_SLOT_GATE_BATCH: _gate_batch,
+                SYSTEM_PROMPT_QUESTION: _question,
+                SYSTEM_PROMPT_POPUPS: _popups,
+                SYSTEM_PROMPT_MUTATE: _mutate,
+                SYSTEM_PROMPT_ANSWER_EXTRACT: _extract,
+            }
+        handler = self._handlers.get(system)
+        try:
+            payload = json.loads(user)
+        except json.JSONDecodeError:
+            payload = {"user_text": user}
+        if handler is None:
+            return "{}"
+        return json.dumps(handler(payload if isinstance(payload, dict) else {}), ensure_ascii=False)
+
+
+# Canned responders ---------------------------------------------------------
+def _intake(payload: dict) -> dict:
+    from .gpt_client import keyword_fallback
+
+    text = str(payload.get("user_text") or "")
+    lowered = text.lower()
+    domains = [d for d in keyword_fallback(text) if d in SLOT_SCHEMA] or ["time_pressure"]
+
+    prefill: dict[str, dict[str, str]] = {}
+    app = next((name for name in APP_NAMES if name in lowered), None)
+    if app and "distractions" in domains:
+        prefill.setdefault("distractions", {})["phone_app"] = app.title()
+    subject = next((name for name in SUBJECTS if name in lowered), None)
+    if subject and "academic_confidence" in domains:
+        prefill.setdefault("academic_confidence", {})["weak_subject"] = subject.title()
+
+    causes = {cause: False for cause in DOMAIN_CAUSES.values()}
+    causes["emotional_overwhelm"] = False
+    for domain in domains:
+        if domain in DOMAIN_CAUSES:
+            causes[DOMAIN_CAUSES[domain]] = True
+
+    return {
+        "active_domains": domains,
+        "components": [{"id": d, "excerpt": text[:80] or d} for d in domains],
+        "negated_slots": [],
+        "prefill": prefill,
+        "causes": causes,
+    }
+
+
+def _gate(payload: dict) -> dict:
+    return {"ask": True}
+
+
+def _gate_batch(payload: dict) -> dict:
+    slots = payload.get("slots") or []
+    return {
+        "decisions": [
+            {"domain": item.get("domain"), "slot": item.get("slot"), "ask": True}
+            for item in slots
+            if isinstance(item, dict)
+        ]
+    }
+
+
+def _question(payload: dict) -> dict:
+    from .fallbacks import FALLBACK_QUESTIONS
+
+    domain = str(payload.get("domain") or "")
+    slot = str(payload.get("slot") or "")
+    question = (FALLBACK_QUESTIONS.get(domain) or {}).get(slot)
+    if not question:
+        question = f"Can you tell me about your {slot.replace('_', ' ')}?"
+    if question == payload.get("last_question"):
+        question = "Quick one: " + question[0].lower() + question[1:]
+    return {"question": question}
+
+
+def _popups(payload: dict) -> dict:
+    profile = payload.get("stress_profile") or {}
+    weak = ((profile.get("academic_confidence") or {}).get("weak_subject") or "").strip()
+    popups = []
+    for popup_type, line1, line2 in POPUP_LINES:
+        if weak and popup_type == "self_doubt":
+            line2 = f"Another {weak[:30]} question, surprise surprise"
+        popups.append({"type": popup_type, "message": f"{line1}\n{line2}", "ttl": 8000})
+    return {"popups": popups}
+
+
+def _extract(payload: dict) -> dict:
+    answer = str(payload.get("answer") or "")
+    lowered = answer.lower()
+    open_slots = payload.get("open_slots") or {}
+    found: dict[str, dict[str, str]] = {}
+
+    def offer(domain: str, slot: str, value: str | None) -> None:
+        if value and slot in (open_slots.get(domain) or []):
+            found.setdefault(domain, {})[slot] = value
+
+    hours = re.search(r"(\d+(?:-\d+)?)\s*(?:hours|hrs|hr)", lowered)
+    offer("time_pressure", "study_hours_per_day", f"{hours.group(1)} hours" if hours else None)
+    exam = re.search(r"exam (?:is )?in (\d+ (?:days?|weeks?|months?))", lowered)
+    offer("time_pressure", "exam_time_left", exam.group(1) if exam else None)
+    subject = next((name for name in SUBJECTS if re.search(rf"\b{name}\b", lowered)), None)
+    offer("academic_confidence", "weak_subject", subject.title() if subject else None)
+    app = next((name for name in APP_NAMES if name in lowered), None)
+    offer("distractions", "phone_app", app.title() if app else None)
+    return {"prefill": found, "negated_slots": []}
+
+
+def _mutate(payload: dict) -> dict:
+    return {
+        "question_html": payload.get("question_html") or "",
+        "options": payload.get("options") or [],
+        "correct_answer": payload.get("correct_answer"),
+        "solution_html": payload.get("solution_html") or "",
+        "integer_answer": payload.get("integer_answer"),
+    }
+
+
+__all__ = ["FakeOpenAI"]
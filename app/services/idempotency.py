@@ -0,0 +1,100 @@
+"""Idempotency-Key replay cache for session endpoints.
+
+The first result computed for ``(session, endpoint, Idempotency-Key)`` is
+stored for ``IDEMPOTENCY_TTL_SECONDS``; a retry with the same key gets it back
+(``Idempotent-Replayed: true`` over HTTP, ``replayed`` in a Socket.IO ack)
+without running the session service again, so the planner, the slot gate and
+the LLM are not touched again. Duplicates that arrive while the first request
+is still running wait for it in this process. Reusing a key with a different
+body is rejected with ``422``.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Callable
+
+from ..metrics import registry
+from .background import keyed_lock
+from .cache_backends import build_backend
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+
+MAX_KEY_LENGTH = 128
+
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory")
+IDEMPOTENCY_MAX_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BYTES", str(8 * 1024 * 1024)))
+IDEMPOTENCY_PATH = os.getenv("IDEMPOTENCY_PATH", str(BASE_DIR / "instance" / "idempotency.db"))
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "300"))
+
+idempotency_requests = registry.counter(
+    "idempotency_requests_total",
+    "Requests carrying an Idempotency-Key by endpoint and result (stored, replayed, mismatch).",
+    labels=("endpoint", "result"),
+)
+
+_backend = build_backend(
+    IDEMPOTENCY_BACKEND,
+    max_bytes=IDEMPOTENCY_MAX_BYTES,
+    path=IDEMPOTENCY_PATH,
+    table="idempotency_entries",
+)
+
+
+def fingerprint(body, fields=()) -> str:
+    """Hash of the request as the session service sees it, identical for HTTP and Socket.IO."""
+    canonical = json.dumps({"body": body, "fields": sorted(fields)}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def _store(cache_key: str, fingerprint: str, payload: dict, status: int) -> None:
+    entry = {"fingerprint": fingerprint, "status": status, "body": payload}
+    try:
+        _backend.set(cache_key, json.dumps(entry).encode("utf-8"), ttl=IDEMPOTENCY_TTL)
+    except Exception as exc:  # pragma: no cover - replay cache is best effort
+        logger.warning("idempotency store failed: %s", exc)
+
+
+def run_idempotent(
+    session_id: str,
+    endpoint: str,
+    key: str,
+    fingerprint: str,
+    run: Callable[[], tuple[dict, int]],
+) -> tuple[dict, int, bool]:
+    """Return ``run()``'s ``(payload, status)`` plus whether it was replayed for ``key``.
+
+    Without a key (or with the backend off) ``run`` is simply called.
+    Exceptions from ``run`` propagate and nothing is stored.
+    """
+    key = (key or "").strip()
+    if not key or _backend is None:
+        return (*run(), False)
+    if len(key) > MAX_KEY_LENGTH:
+        return {"error": f"idempotency key is longer than {MAX_KEY_LENGTH} characters"}, 400, False
+
+    cache_key = f"idem:{session_id}:{endpoint}:{key}"
+    with keyed_lock(cache_key):
+        raw = _backend.get(cache_key)
+        if raw is not None:
+            entry = json.loads(raw)
+            if entry["fingerprint"] != fingerprint:
+                idempotency_requests.inc(endpoint=endpoint, result="mismatch")
+                return {"error": "idempotency key was already used with a different request"}, 422, False
+            idempotency_requests.inc(endpoint=endpoint, result="replayed")
+            return entry["body"], entry["status"], True
+
+        payload, status = run()
+        # Server errors are worth retrying for real.
+        if status < 500:
+            _store(cache_key, fingerprint, payload, status)
+            idempotency_requests.inc(endpoint=endpoint, result="stored")
+        return payload, status, False
+
+
+__all__ = ["run_idempotent", "fingerprint", "MAX_KEY_LENGTH", "IDEMPOTENCY_TTL"]
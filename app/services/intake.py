@@ -0,0 +1,41 @@
+"""Intake analysis for new sessions, overlapped with session creation."""
+from __future__ import annotations
+
+import logging
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from .background import submit_intake
+from .gpt_client import causes_from_analysis
+from .intake_analyzer import analyze_intake
+from .slot_prefill_llm import prefill_from_analysis
+from .slot_prefill_schema import SlotPrefillResponse
+
+logger = logging.getLogger(__name__)
+
+
+def start_intake(text: str, deadline: float) -> Future:
+    """Start the intake analysis on the shared pool.
+
+    ``deadline`` is an absolute ``time.monotonic()`` value for the whole request.
+    """
+    budget = max(0.1, deadline - time.monotonic())
+    return submit_intake(analyze_intake, text, timeout=budget)
+
+
+def collect_intake(
+    future: Future,
+    deadline: float,
+) -> tuple[SlotPrefillResponse, dict[str, bool]]:
+    """Wait until the deadline; a missed deadline yields empty prefills and causes."""
+    analysis = None
+    try:
+        analysis = future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeoutError:
+        logger.warning("intake analysis missed deadline; continuing without it")
+    except Exception as exc:  # pragma: no cover - defensive logging
+        logger.exception("intake analysis failed: %s", exc)
+    return prefill_from_analysis(analysis), causes_from_analysis(analysis)
+
+
+__all__ = ["start_intake", "collect_intake"]
@@ -0,0 +1,90 @@
+"""Single-call LLM analysis of the initial student text."""
+from __future__ import annotations
+
+import json
+import logging
+
+from pydantic import ValidationError
+
+from ..constants import CAUSE_KEYS, SLOT_SCHEMA
+from .intake_schema import IntakeAnalysisResponse
+from .llm_metrics import record_fallback, record_parse_failure, record_retry
+from .openai_client import CircuitOpenError, chat_json
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT_INTAKE = """
+You analyze the opening message of a student stress-test system in ONE pass.
+
+Return ONLY JSON (no markdown, no extra keys). Use the provided SLOT_SCHEMA and CAUSE_KEYS.
+
+Rules:
+- active_domains: the stress domains present in the user's text.
+- components: stress components with a short excerpt copied from the text.
+  Allowed ids only: academic_confidence, time_pressure, distractions, social_comparison,
+  family_pressure, motivation, demotivation, backlog_stress
+- prefill: only domains and slots that exist in SLOT_SCHEMA. If a value is not clearly
+  stated/implied, do not guess. Values should be short (1–8 words). You may correct
+  spelling/casing (e.g., "instragram" -> "Instagram").
+- negated_slots: slot names the user explicitly says do NOT apply
+  (e.g., "not distracted by phone" -> "phone_app").
+- causes: one boolean per CAUSE_KEYS entry. true ONLY when the cause is explicitly
+  mentioned; false when denied or not stated. Do NOT infer.
+
+Output format:
+{
+  "active_domains": ["distractions", "time_pressure"],
+  "components": [{"id": "time_pressure", "excerpt": "exam in 2 weeks"}],
+  "negated_slots": ["friend_name"],
+  "prefill": {"distractions": {"phone_app": "Instagram"}},
+  "causes": {"family_pressure": false, "digital_distraction": true, "social_distraction": false,
+             "academic_confidence": false, "time_pressure": true, "emotional_overwhelm": false}
+}
+"""
+
+def analyze_intake(user_text: str, timeout: float | None = None) -> IntakeAnalysisResponse | None:
+    """Return the validated intake analysis, or None when the LLM could not provide one.
+
+    Repeated texts are served by the ``intake`` LLM cache (``LLM_CACHE_TTL_INTAKE``);
+    only completions that parse into an analysis are cached.
+    """
+    text = (user_text or "").strip()[:2000]
+    if not text:
+        return None
+
+    payload = {
+        "SLOT_SCHEMA": SLOT_SCHEMA,
+        "CAUSE_KEYS": CAUSE_KEYS,
+        "user_text": text,
+    }
+
+    for attempt in (1, 2):
+        if attempt > 1:
+            record_retry("intake")
+        try:
+            resp = chat_json(
+                model="gpt-5-mini",
+                system=SYSTEM_PROMPT_INTAKE,
+                user=json.dumps(payload, ensure_ascii=False),
+                timeout=timeout,
+                call_site="intake",
+                refresh=attempt > 1,
+                validate=lambda content: IntakeAnalysisResponse(**json.loads(content)),
+            )
+            raw = (resp.choices[0].message.content or "").strip()
+            return IntakeAnalysisResponse(**json.loads(raw))
+        except (json.JSONDecodeError, ValidationError, TypeError) as exc:
+            record_parse_failure("intake")
+            logger.warning("analyze_intake attempt %s failed: %s", attempt, exc)
+        except CircuitOpenError as exc:
+            logger.warning("analyze_intake skipped: %s", exc)
+            break
+        except Exception as exc:  # pragma: no cover
+            logger.exception("analyze_intake unexpected error: %s", exc)
+            break
+
+    record_fallback("intake")
+    return None
+
+
+__all__ = ["analyze_intake", "SYSTEM_PROMPT_INTAKE"]
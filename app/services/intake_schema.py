@@ -0,0 +1,25 @@
+"""Schema for the unified intake analysis."""
+from __future__ import annotations
+
+from typing import Dict
+
+from pydantic import Field, field_validator
+
+from ..constants import CAUSE_KEYS
+from .schemas import ExtractComponentsResponse
+from .slot_prefill_schema import SlotPrefillResponse
+
+
+class IntakeAnalysisResponse(SlotPrefillResponse, ExtractComponentsResponse):
+    """Domains, prefills, negations, component excerpts and causes in one payload."""
+
+    causes: Dict[str, bool] = Field(default_factory=dict, validate_default=True)
+
+    @field_validator("causes", mode="before")
+    @classmethod
+    def normalize_causes(cls, value):
+        value = value if isinstance(value, dict) else {}
+        return {key: value.get(key) is True for key in CAUSE_KEYS}
+
+
+__all__ = ["IntakeAnalysisResponse"]
@@ -0,0 +1,92 @@
+"""Content-addressed cache for LLM completions."""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+from .cache_backends import build_backend
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+
+CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")
+CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", str(BASE_DIR / "instance" / "llm_cache.db"))
+PROMPT_VERSION = os.getenv("LLM_PROMPT_VERSION", "1")
+DEFAULT_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+
+# Per-call-site TTL in seconds; 0 disables caching for that site.
+CALL_SITE_TTLS = {
+    "intake": float(os.getenv("LLM_CACHE_TTL_INTAKE", str(DEFAULT_TTL))),
+    "gate": float(os.getenv("LLM_CACHE_TTL_GATE", str(DEFAULT_TTL))),
+    "question": float(os.getenv("LLM_CACHE_TTL_QUESTION", "3600")),
+    "popup": float(os.getenv("LLM_CACHE_TTL_POPUP", "3600")),
+    "mutate": float(os.getenv("LLM_CACHE_TTL_MUTATE", "0")),
+    "extract": float(os.getenv("LLM_CACHE_TTL_EXTRACT", str(DEFAULT_TTL))),
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats: dict[str, dict[str, int]] = {}
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = build_backend(CACHE_BACKEND, max_bytes=CACHE_MAX_BYTES, path=CACHE_PATH, table="llm_cache")
+    return _backend
+
+
+def cache_key(model: str, system: str, user: str, version: str | None = None) -> str:
+    digest = hashlib.sha256()
+    for part in (model, system, user, version or PROMPT_VERSION):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def ttl_for(call_site: str | None) -> float:
+    if call_site is None:
+        return DEFAULT_TTL
+    return CALL_SITE_TTLS.get(call_site, DEFAULT_TTL)
+
+
+def _count(call_site: str | None, field: str) -> None:
+    with _stats_lock:
+        bucket = _stats.setdefault(call_site or "default", {"hits": 0, "misses": 0, "stores": 0})
+        bucket[field] += 1
+
+
+def lookup(key: str, call_site: str | None = None) -> bytes | None:
+    backend = get_backend()
+    if backend is None:
+        return None
+    value = backend.get(key)
+    _count(call_site, "hits" if value is not None else "misses")
+    return value
+
+
+def store(key: str, value: bytes, call_site: str | None = None) -> None:
+    backend = get_backend()
+    ttl = ttl_for(call_site)
+    if backend is None or ttl <= 0:
+        return
+    backend.set(key, value, ttl=ttl)
+    _count(call_site, "stores")
+
+
+def cache_stats() -> dict:
+    backend = get_backend()
+    with _stats_lock:
+        sites = {site: dict(counts) for site, counts in _stats.items()}
+    return {
+        "backend": backend.stats() if backend is not None else {"backend": "none"},
+        "call_sites": sites,
+    }
+
+
+__all__ = ["cache_key", "lookup", "store", "ttl_for", "cache_stats", "get_backend"]
@@ -0,0 +1,87 @@
+"""Per-call-site LLM instrumentation."""
+from __future__ import annotations
+
+from ..metrics import registry
+
+CALL_SITES = ("intake", "gate", "question", "popup", "mutate", "extract")
+
+llm_latency = registry.histogram(
+    "llm_request_duration_seconds",
+    "Upstream LLM completion latency.",
+    labels=("call_site", "outcome"),
+)
+llm_requests = registry.counter(
+    "llm_requests_total",
+    "LLM calls by outcome (ok, error, rejected, cache_hit).",
+    labels=("call_site", "outcome"),
+)
+llm_first_token = registry.histogram(
+    "llm_first_token_seconds",
+    "Time from request to the first streamed content token.",
+    labels=("call_site",),
+)
+llm_tokens = registry.counter(
+    "llm_tokens_total",
+    "Tokens reported by the provider.",
+    labels=("call_site", "kind"),
+)
+llm_retries = registry.counter(
+    "llm_retries_total",
+    "Retry attempts issued by LLM helpers.",
+    labels=("call_site",),
+)
+llm_parse_failures = registry.counter(
+    "llm_parse_failures_total",
+    "Completions rejected by JSON parsing or schema validation.",
+    labels=("call_site",),
+)
+llm_fallbacks = registry.counter(
+    "llm_fallbacks_total",
+    "Times a helper returned its canned fallback instead of LLM output.",
+    labels=("call_site",),
+)
+
+
+def _site(call_site: str | None) -> str:
+    return call_site or "other"
+
+
+def observe_call(call_site: str | None, seconds: float, outcome: str, usage=None) -> None:
+    site = _site(call_site)
+    llm_latency.observe(seconds, call_site=site, outcome=outcome)
+    llm_requests.inc(call_site=site, outcome=outcome)
+    if usage is not None:
+        llm_tokens.inc(getattr(usage, "prompt_tokens", 0) or 0, call_site=site, kind="prompt")
+        llm_tokens.inc(getattr(usage, "completion_tokens", 0) or 0, call_site=site, kind="completion")
+
+
+def observe_first_token(call_site: str | None, seconds: float) -> None:
+    llm_first_token.observe(seconds, call_site=_site(call_site))
+
+
+def record_outcome(call_site: str | None, outcome: str) -> None:
+    """Count a call that never reached the provider (cache hit, open circuit)."""
+    llm_requests.inc(call_site=_site(call_site), outcome=outcome)
+
+
+def record_retry(call_site: str) -> None:
+    llm_retries.inc(call_site=_site(call_site))
+
+
+def record_parse_failure(call_site: str) -> None:
+    llm_parse_failures.inc(call_site=_site(call_site))
+
+
+def record_fallback(call_site: str) -> None:
+    llm_fallbacks.inc(call_site=_site(call_site))
+
+
+__all__ = [
+    "CALL_SITES",
+    "observe_call",
+    "observe_first_token",
+    "record_outcome",
+    "record_retry",
+    "record_parse_failure",
+    "record_fallback",
+]
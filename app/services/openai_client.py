@@ -1,32 +1,395 @@
 """Shared OpenAI chat helpers."""
 from __future__ import annotations
 
-from openai import OpenAI
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Iterator
 
-client = OpenAI()
+import httpx
+from openai import (
+    NOT_GIVEN,
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    OpenAI,
+    RateLimitError,
+)
+from openai.types.chat import ChatCompletion
 
+from ..metrics import registry
+from . import llm_cache
+from .circuit_breaker import HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from .llm_metrics import observe_call, observe_first_token, record_outcome
 
-def chat_text(model: str, system: str, user: str, **kwargs):
-    """Basic chat completion returning text."""
-    return client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user},
-        ],
+logger = logging.getLogger(__name__)
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai").strip().lower()
+
+# Transport tuning ----------------------------------------------------------
+CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "30"))
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "1"))
+
+# Errors that indicate the provider (not the request) is unhealthy.
+OUTAGE_ERRORS = (
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError,
+    httpx.TimeoutException,
+)
+
+breaker = CircuitBreaker(
+    "openai",
+    failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+    half_open_max_calls=int(os.getenv("LLM_BREAKER_HALF_OPEN_PROBES", "1")),
+)
+
+circuit_state = registry.gauge("llm_circuit_state", "LLM circuit state: 0 closed, 1 half-open, 2 open.")
+circuit_trips = registry.gauge("llm_circuit_trips", "Times the LLM circuit has opened.")
+cache_lookups = registry.gauge(
+    "llm_cache_lookups",
+    "LLM response cache lookups by result.",
+    labels=("call_site", "result"),
+)
+
+
+def _collect_llm_state() -> None:
+    snapshot = breaker.snapshot()
+    circuit_state.set({OPEN: 2, HALF_OPEN: 1}.get(snapshot["state"], 0))
+    circuit_trips.set(snapshot["trips"])
+    for site, counts in llm_cache.cache_stats()["call_sites"].items():
+        cache_lookups.set(counts["hits"], call_site=site, result="hit")
+        cache_lookups.set(counts["misses"], call_site=site, result="miss")
+
+
+registry.add_collector(_collect_llm_state)
+
+_client: OpenAI | None = None
+_client_lock = threading.Lock()
+
+
+def _build_http_client() -> httpx.Client:
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+    )
+
+
+def get_client() -> OpenAI:
+    """Return the process-wide client, building the pooled transport lazily.
+
+    ``LLM_BACKEND=fake`` swaps in the offline ``FakeOpenAI`` stand-in.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None and LLM_BACKEND == "fake":
+                from .fake_llm import FakeOpenAI
+
+                logger.info("using fake LLM backend")
+                _client = FakeOpenAI()
+            if _client is None:
+                _client = OpenAI(
+                    http_client=_build_http_client(),
+                    max_retries=MAX_RETRIES,
+                    timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                )
+    return _client
+
+
+def _client_for(timeout: float | None) -> OpenAI:
+    """The client to call with a per-call deadline.
+
+    The SDK retries timeouts itself, so a deadline-bound call gets a copy
+    with ``max_retries=0``; otherwise one call could take about twice its budget.
+    """
+    client = get_client()
+    return client if timeout is None else client.with_options(max_retries=0)
+
+
+def _request_timeout(timeout: float | None):
+    """Clamp the transport timeouts to a per-call deadline (seconds)."""
+    if timeout is None:
+        return NOT_GIVEN
+    budget = max(0.1, float(timeout))
+    return httpx.Timeout(min(READ_TIMEOUT, budget), connect=min(CONNECT_TIMEOUT, budget))
+
+
+def warm_pool() -> None:
+    """Open a pooled connection in the background so the first request skips TLS setup."""
+
+    def run() -> None:
+        try:
+            get_client().models.list(timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT))
+            logger.info("openai pool warmed")
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("openai pool warmup failed: %s", exc)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+Validator = Callable[[str], object]
+
+
+def _nonempty(content: str) -> bool:
+    return bool(content.strip())
+
+
+def _json_object(content: str) -> bool:
+    return isinstance(json.loads(content), dict)
+
+
+def _cacheable(content: str, validate: Validator | None, call_site: str | None) -> bool:
+    """Whether ``content`` passes the caller's parse; unparseable completions are never cached."""
+    if validate is None:
+        return True
+    try:
+        return bool(validate(content))
+    except Exception as exc:
+        logger.info("llm completion not cached call_site=%s: %s", call_site, exc)
+        return False
+
+
+def _content(completion: ChatCompletion) -> str:
+    return (completion.choices[0].message.content or "") if completion.choices else ""
+
+
+def _complete(
+    model: str,
+    system: str,
+    user: str,
+    *,
+    timeout: float | None,
+    call_site: str | None,
+    cache: bool,
+    refresh: bool,
+    validate: Validator | None,
+    **kwargs,
+) -> ChatCompletion:
+    use_cache = cache and llm_cache.ttl_for(call_site) > 0
+    key = None
+    if use_cache:
+        extra = json.dumps(kwargs, sort_keys=True, default=str) if kwargs else ""
+        key = llm_cache.cache_key(model, system, user + extra)
+        if not refresh:
+            cached = llm_cache.lookup(key, call_site)
+            if cached is not None:
+                completion = ChatCompletion.model_validate_json(cached)
+                if _cacheable(_content(completion), validate, call_site):
+                    record_outcome(call_site, "cache_hit")
+                    return completion
+
+    if not breaker.allow():
+        record_outcome(call_site, "rejected")
+        raise CircuitOpenError("LLM circuit open; skipping call")
+    started = time.perf_counter()
+    try:
+        response = _client_for(timeout).chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": user},
+            ],
+            timeout=_request_timeout(timeout),
+            **kwargs,
+        )
+    except OUTAGE_ERRORS as exc:
+        breaker.record_failure(exc)
+        observe_call(call_site, time.perf_counter() - started, "error")
+        raise
+    except Exception:
+        breaker.release()
+        observe_call(call_site, time.perf_counter() - started, "error")
+        raise
+    breaker.record_success()
+    observe_call(call_site, time.perf_counter() - started, "ok", getattr(response, "usage", None))
+    if key is not None and _cacheable(_content(response), validate, call_site):
+        llm_cache.store(key, response.model_dump_json().encode("utf-8"), call_site)
+    return response
+
+
+def chat_text(
+    model: str,
+    system: str,
+    user: str,
+    *,
+    timeout: float | None = None,
+    call_site: str | None = None,
+    cache: bool = True,
+    refresh: bool = False,
+    validate: Validator | None = _nonempty,
+    **kwargs,
+):
+    """Basic chat completion returning text.
+
+    Responses are cached by (model, system, user, prompt version); ``refresh``
+    skips the lookup but still stores the fresh answer, ``cache=False`` bypasses it.
+    Only completions whose content passes ``validate`` (the caller's parse; it
+    may raise or return falsy) are stored or served from the cache.
+    """
+    return _complete(
+        model,
+        system,
+        user,
+        timeout=timeout,
+        call_site=call_site,
+        cache=cache,
+        refresh=refresh,
+        validate=validate,
         **kwargs,
     )
 
 
-def chat_json(model: str, system: str, user: str):
-    """Chat completion forced to return JSON object."""
-    return client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user},
-        ],
+def chat_json(
+    model: str,
+    system: str,
+    user: str,
+    *,
+    timeout: float | None = None,
+    call_site: str | None = None,
+    cache: bool = True,
+    refresh: bool = False,
+    validate: Validator | None = _json_object,
+):
+    """Chat completion forced to return JSON object.
+
+    Only completions that parse as a JSON object (or pass ``validate``) are cached.
+    """
+    return _complete(
+        model,
+        system,
+        user,
+        timeout=timeout,
+        call_site=call_site,
+        cache=cache,
+        refresh=refresh,
+        validate=validate,
+    )
+
+
+def _completion_from_text(model: str, content: str, usage=None) -> ChatCompletion:
+    """Rebuild a ChatCompletion from streamed text so the cache holds one format."""
+    return ChatCompletion.model_validate(
+        {
+            "id": "stream",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}
+            ],
+            "usage": usage.model_dump() if usage is not None else None,
+        }
     )
 
 
-__all__ = ["chat_text", "chat_json"]
+def chat_stream(
+    model: str,
+    system: str,
+    user: str,
+    *,
+    timeout: float | None = None,
+    call_site: str | None = None,
+    cache: bool = True,
+    refresh: bool = False,
+    validate: Validator | None = _nonempty,
+) -> Iterator[str]:
+    """Stream a chat completion as content deltas.
+
+    Shares cache entries with ``chat_json`` for the same prompt: a hit is
+    yielded as a single chunk. The breaker and metrics see one call that ends
+    when the stream is exhausted. The full text is cached only if it passes
+    ``validate``.
+    """
+    use_cache = cache and llm_cache.ttl_for(call_site) > 0
+    key = llm_cache.cache_key(model, system, user) if use_cache else None
+    if key is not None and not refresh:
+        cached = llm_cache.lookup(key, call_site)
+        content = _content(ChatCompletion.model_validate_json(cached)) if cached is not None else ""
+        if cached is not None and _cacheable(content, validate, call_site):
+            record_outcome(call_site, "cache_hit")
+            yield content
+            return
+
+    if not breaker.allow():
+        record_outcome(call_site, "rejected")
+        raise CircuitOpenError("LLM circuit open; skipping call")
+    started = time.perf_counter()
+    parts: list[str] = []
+    usage = None
+    stream = None
+    try:
+        stream = _client_for(timeout).chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": user},
+            ],
+            timeout=_request_timeout(timeout),
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not parts:
+                    observe_first_token(call_site, time.perf_counter() - started)
+                parts.append(delta)
+                yield delta
+    except OUTAGE_ERRORS as exc:
+        breaker.record_failure(exc)
+        observe_call(call_site, time.perf_counter() - started, "error")
+        raise
+    except GeneratorExit:
+        # Consumer stopped early; the provider answered, so this is not an outage.
+        breaker.record_success()
+        observe_call(call_site, time.perf_counter() - started, "ok", usage)
+        raise
+    except Exception:
+        breaker.release()
+        observe_call(call_site, time.perf_counter() - started, "error")
+        raise
+    finally:
+        # Return the pooled connection even when the consumer stops early.
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    breaker.record_success()
+    observe_call(call_site, time.perf_counter() - started, "ok", usage)
+    text = "".join(parts)
+    if key is not None and _cacheable(text, validate, call_site):
+        completion = _completion_from_text(model, text, usage)
+        llm_cache.store(key, completion.model_dump_json().encode("utf-8"), call_site)
+
+
+def llm_status() -> dict:
+    """Breaker state for the status API."""
+    return breaker.snapshot()
+
+
+__all__ = [
+    "chat_text",
+    "chat_json",
+    "chat_stream",
+    "get_client",
+    "warm_pool",
+    "llm_status",
+    "breaker",
+    "CircuitOpenError",
+]
@@ -2,7 +2,8 @@
 from __future__ import annotations
 
 from ..constants import PRIORITY_ORDER
-from .slot_gate_llm import should_ask_slot
+from .slot_gate_llm import gate_fingerprint, gate_key
+from .slot_rules import gate_slots_tiered
 from .generic_questions import get_generic_slot_name
 
 DOMAIN_CAUSE_MAP = {
@@ -42,7 +43,17 @@ def pick_next_slot(
     user_text: str,
     filled_slots: dict,
     causes: dict[str, bool] | None,
+    gate_state: dict | None = None,
 ) -> tuple[str, str] | None:
+    """Return the next (domain, slot) to ask, or None when nothing is eligible.
+
+    ``gate_state`` is the per-session gate memo (stored in ``session.meta``).
+    It is updated in place: every missing slot without a decision goes through
+    the rule tier, the ambiguous rest through one batched LLM call, and
+    decisions are reused until the initial text or the negated slots change.
+    Fail-open defaults from a failed gate call apply to this turn only, so the
+    next turn asks the LLM again.
+    """
 
     slots_by_domain: dict[str, list[tuple[str, str]]] = {}
     for domain, slot in missing_slots:
@@ -52,18 +63,36 @@ def pick_next_slot(
     if isinstance(filled_slots.get("__negated__"), list):
         negated = set(filled_slots["__negated__"])
 
-    gate_cache: dict[tuple[str, str], bool] = {}
     causes = causes or {}
 
+    if gate_state is None:
+        gate_state = {}
+    fingerprint = gate_fingerprint(user_text, negated)
+    if gate_state.get("fingerprint") != fingerprint:
+        gate_state["fingerprint"] = fingerprint
+        gate_state["decisions"] = {}
+    stored = dict(gate_state.get("decisions") or {})
+    decisions = dict(stored)
+
+    ungated = [
+        (domain, slot)
+        for domain, slot in missing_slots
+        if slot not in negated
+        and is_slot_allowed_by_cause(domain, causes)
+        and gate_key(domain, slot) not in decisions
+    ]
+    if ungated:
+        fresh, fallback = gate_slots_tiered(user_text, ungated)
+        decisions.update(fresh)
+        stored.update({key: ask for key, ask in fresh.items() if key not in fallback})
+    gate_state["decisions"] = stored
+
     def _eligible(domain: str, slot: str) -> bool:
         if slot in negated:
             return False
         if not is_slot_allowed_by_cause(domain, causes):
             return False
-        key = (domain, slot)
-        if key not in gate_cache:
-            gate_cache[key] = should_ask_slot(user_text, domain, slot)
-        return gate_cache[key]
+        return decisions.get(gate_key(domain, slot), True)
 
     for domain in PRIORITY_ORDER:
         if domain not in active_domains:
@@ -3,15 +3,19 @@ from __future__ import annotations
 
 import json
 import logging
+from typing import Callable
 
 from pydantic import ValidationError
 
 from .popup_schemas import Popup
 from .popup_validator import validate_popup_message
-from .openai_client import chat_json
+from .llm_metrics import record_fallback, record_parse_failure, record_retry
+from .openai_client import CircuitOpenError, chat_json, chat_stream
 
 logger = logging.getLogger(__name__)
 
+MAX_POPUPS = 15
+
 FALLBACK_TEMPLATES = {
     "pressure": "Schedule feels crushing right now 😔\nSlow inhale, slow exhale, one step at a time.",
     "self_doubt": "Mind says you aren't prepared enough.\nCounter it: you have survived tougher days.",
@@ -49,6 +53,8 @@ def _fallback_popups(
             continue
         lines = [ln.strip() for ln in message.split("\n") if ln.strip()]
         for line in lines or [message]:
+            if len(created) >= count:
+                break
             sub_key = (popup_type, line)
             if sub_key in seen:
                 continue
@@ -76,6 +82,13 @@ def _ensure_minimum_popups(
     return augmented[:limit]
 
 
+def _finish_popups(popups: list[dict], seen: set[tuple[str, str]], emotion_signals: list[str]) -> list[dict]:
+    """Top validated popups up to the minimum with fallbacks; the one exit for every path."""
+    if not popups:
+        record_fallback("popup")
+    return _ensure_minimum_popups(popups, seen, emotion_signals, limit=MAX_POPUPS)
+
+
 def _explode_popup(validated: Popup) -> list[dict]:
     """Split multi-line messages into individual popup cards."""
     lines = [ln.strip() for ln in (validated.message or "").split("\n") if ln.strip()]
@@ -175,7 +188,155 @@ def normalize_two_lines(msg: str, max_total: int = 160, max_line: int = 80) -> s
     return joined
 
 
-def generate_popups(stress_profile: dict, emotion_signals: list[str] | None = None) -> list[dict]:
+class PopupStreamParser:
+    """Incrementally pull complete popup objects out of a streamed ``{"popups":[...]}`` body.
+
+    Objects nested directly inside the top-level object are decoded as soon
+    as their closing brace arrives; string contents and escapes are tracked
+    so braces inside messages do not confuse the scan.
+    """
+
+    def __init__(self):
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buffer: list[str] = []
+
+    def feed(self, text: str) -> list[dict]:
+        found: list[dict] = []
+        for ch in text:
+            if self._depth >= 2:
+                self._buffer.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+                if self._depth == 2:
+                    self._buffer = ["{"]
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 1:
+                    raw = "".join(self._buffer)
+                    self._buffer = []
+                    try:
+                        item = json.loads(raw)
+                    except json.JSONDecodeError as exc:
+                        logger.warning("POPUP_STREAM_ITEM_PARSE_FAIL raw=%s err=%s", raw, exc)
+                        continue
+                    if isinstance(item, dict):
+                        found.append(item)
+        return found
+
+
+def _accept_popup(popup, stress_profile: dict, seen: set[tuple[str, str]]) -> list[dict]:
+    """Normalize, validate and de-duplicate one raw popup; return its new cards."""
+    if not isinstance(popup, dict):
+        return []
+    popup["message"] = normalize_two_lines(popup.get("message", ""))
+    try:
+        popup["ttl"] = int(popup.get("ttl", 12000))
+    except (TypeError, ValueError):
+        popup["ttl"] = 12000
+    popup["ttl"] = max(10000, min(14000, popup["ttl"]))
+
+    try:
+        validated = Popup.model_validate(popup)
+    except ValidationError as e:
+        logger.warning("POPUP_SCHEMA_FAIL popup=%s err=%s", popup, e)
+        return []
+
+    if not validate_popup_message(validated.message, stress_profile):
+        return []
+
+    accepted: list[dict] = []
+    for sub in _explode_popup(validated):
+        key = (sub["type"], sub["message"].strip())
+        if key in seen:
+            continue
+        seen.add(key)
+        accepted.append(sub)
+    return accepted
+
+
+def _has_popups(content: str) -> bool:
+    """Cache only completions that carry a non-empty ``popups`` list."""
+    return bool(json.loads(content).get("popups"))
+
+
+def _stream_popups(
+    payload: dict,
+    stress_profile: dict,
+    emotion_signals: list[str],
+    timeout: float | None,
+    on_popup: Callable[[dict], None],
+) -> list[dict]:
+    valid_popups: list[dict] = []
+    seen: set[tuple[str, str]] = set()
+
+    for attempt in (1, 2):
+        if attempt > 1:
+            record_retry("popup")
+        parser = PopupStreamParser()
+        try:
+            stream = chat_stream(
+                model="gpt-5-mini",
+                system=SYSTEM_PROMPT_POPUPS,
+                user=json.dumps(payload, ensure_ascii=False),
+                timeout=timeout,
+                call_site="popup",
+                refresh=attempt > 1,
+                validate=_has_popups,
+            )
+            try:
+                for delta in stream:
+                    for popup in parser.feed(delta):
+                        for sub in _accept_popup(popup, stress_profile, seen):
+                            valid_popups.append(sub)
+                            on_popup(sub)
+                    if len(valid_popups) >= MAX_POPUPS:
+                        break
+            finally:
+                stream.close()
+
+            if valid_popups:
+                break
+            record_parse_failure("popup")
+            logger.warning("POPUP_STREAM_EMPTY attempt=%s", attempt)
+
+        except CircuitOpenError as exc:
+            logger.warning("POPUP_CALL_SKIPPED err=%s", exc)
+            break
+
+        except Exception as exc:
+            logger.exception("POPUP_STREAM_FAIL attempt=%s streamed=%s err=%s", attempt, len(valid_popups), exc)
+            break
+
+    augmented = _finish_popups(valid_popups, seen, emotion_signals)
+    for extra in augmented[len(valid_popups):]:
+        on_popup(extra)
+    logger.info("POPUP_STREAM_OK count=%s", len(augmented))
+    return augmented
+
+
+def generate_popups(
+    stress_profile: dict,
+    emotion_signals: list[str] | None = None,
+    timeout: float | None = None,
+    on_popup: Callable[[dict], None] | None = None,
+) -> list[dict]:
+    """Return validated popup cards.
+
+    With ``on_popup`` the completion is streamed and each card is handed to
+    the callback as soon as it validates; the full list is still returned.
+    """
     if not stress_profile:
         return []
 
@@ -184,12 +345,21 @@ def generate_popups(stress_profile: dict, emotion_signals: list[str] | None = No
         "emotion_signals": emotion_signals or [],
     }
 
+    if on_popup is not None:
+        return _stream_popups(payload, stress_profile, emotion_signals or [], timeout, on_popup)
+
     for attempt in (1, 2):
+        if attempt > 1:
+            record_retry("popup")
         try:
             response = chat_json(
                 model="gpt-5-mini",
                 system=SYSTEM_PROMPT_POPUPS,
                 user=json.dumps(payload, ensure_ascii=False),
+                timeout=timeout,
+                call_site="popup",
+                refresh=attempt > 1,
+                validate=_has_popups,
             )
 
             raw = (response.choices[0].message.content or "").strip()
@@ -202,50 +372,30 @@ def generate_popups(stress_profile: dict, emotion_signals: list[str] | None = No
             seen: set[tuple[str, str]] = set()
 
             for popup in popups:
-                if not isinstance(popup, dict):
-                    continue
-                popup["message"] = normalize_two_lines(popup.get("message", ""))
-                popup["ttl"] = int(popup.get("ttl", 12000))
-                popup["ttl"] = max(10000, min(14000, popup["ttl"]))
-
-                try:
-                    validated = Popup.model_validate(popup)
-                except ValidationError as e:
-                    logger.warning("POPUP_SCHEMA_FAIL popup=%s err=%s", popup, e)
-                    continue
-
-                if validate_popup_message(validated.message, stress_profile):
-                    for sub in _explode_popup(validated):
-                        key = (sub["type"], sub["message"].strip())
-                        if key in seen:
-                            continue
-                        seen.add(key)
-                        valid_popups.append(sub)
+                valid_popups.extend(_accept_popup(popup, stress_profile, seen))
 
             if valid_popups:
-                augmented = _ensure_minimum_popups(
-                    valid_popups,
-                    seen,
-                    emotion_signals or [],
-                )
+                augmented = _finish_popups(valid_popups, seen, emotion_signals or [])
                 logger.info("POPUP_OK count=%s", len(augmented))
                 return augmented
 
+            record_parse_failure("popup")
             logger.warning("POPUP_EMPTY_AFTER_VALIDATION attempt=%s", attempt)
 
         except (json.JSONDecodeError, ValidationError) as exc:
+            record_parse_failure("popup")
             logger.error("POPUP_PARSE_FAIL attempt=%s err=%s", attempt, exc)
 
+        except CircuitOpenError as exc:
+            logger.warning("POPUP_CALL_SKIPPED err=%s", exc)
+            break
+
         except Exception as exc:
             logger.exception("POPUP_CALL_FAIL attempt=%s err=%s", attempt, exc)
             break
 
-    fallback = _fallback_popups(3, set(), emotion_signals or [])
-    if fallback:
-        return fallback[:15]
-
-    return []
+    return _finish_popups([], set(), emotion_signals or [])
 
 
 
-__all__ = ["generate_popups"]
+__all__ = ["generate_popups", "PopupStreamParser"]
@@ -0,0 +1,174 @@
+"""Background popup preparation for completing sessions.
+
+Popups are generated off the request path, either speculatively once the
+planner decides the session is done or when ``/next-question`` completes it.
+Progress lives in ``session.meta["popups_status"]`` (pending, ready, failed)
+tagged with a fingerprint of the stress profile the popups were built from;
+``popups_ready`` is emitted to the session room when the job finishes.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from ..extensions import socketio
+from .background import session_lock, submit_popup
+from .popup_generator import generate_popups
+from .slot_manager import infer_emotion_signals
+
+logger = logging.getLogger(__name__)
+
+# A pending job older than this with no worker tracking it is assumed lost and restarted.
+POPUP_JOB_STALE_SECONDS = float(os.getenv("POPUP_JOB_STALE_SECONDS", "90"))
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+_jobs: dict[str, tuple[str, Future]] = {}
+_jobs_lock = threading.Lock()
+
+
+def popup_inputs(filled_slots: dict, meta: dict) -> tuple[dict, list[str]]:
+    """Return (stress_profile, emotion_signals) as used for popup generation."""
+    stress_profile = filled_slots or {}
+    inferred_signals = infer_emotion_signals(stress_profile)
+    stored_signals = (meta or {}).get("emotion_signals") or []
+    return stress_profile, list(dict.fromkeys(stored_signals + inferred_signals))
+
+
+def profile_fingerprint(stress_profile: dict, emotion_signals: list[str]) -> str:
+    encoded = json.dumps([stress_profile, emotion_signals], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+def job_for(session_id: str, version: str | None = None) -> Future | None:
+    """Return this worker's job for the session, optionally only if it matches ``version``."""
+    with _jobs_lock:
+        job_version, future = _jobs.get(str(session_id), (None, None))
+    if future is None or (version is not None and job_version != version):
+        return None
+    return future
+
+
+def _store_result(app, session_id: str, version: str, popups: list[dict] | None) -> None:
+    from ..db.repo import retry_on_conflict
+
+    with app.app_context(), session_lock(session_id):
+        retry_on_conflict(_write_result)(session_id, version, popups)
+
+
+def _write_result(session_id: str, version: str, popups: list[dict] | None) -> None:
+    from ..db.repo import get_session, save_session, set_popups
+
+    session = get_session(session_id)
+    if session is None:
+        return
+    meta = dict(session.meta or {})
+    if meta.get("popups_version") not in (None, version):
+        logger.info("popup job superseded session=%s", session_id)
+        return
+    meta["popups_version"] = version
+    meta["popups_status"] = READY if popups is not None else FAILED
+    meta["popups_count"] = len(popups or [])
+    session.meta = meta
+    set_popups(session, popups or [])
+    save_session(session)
+
+
+def _run_job(app, session_id: str, version: str, stress_profile: dict, emotion_signals: list[str], stream: bool):
+    room = str(session_id)
+    on_popup = None
+    if stream:
+        streamed: list[dict] = []
+
+        def on_popup(popup: dict) -> None:
+            streamed.append(popup)
+            socketio.emit("popup_generated", popup | {"index": len(streamed) - 1}, room=room)
+
+    popups: list[dict] | None
+    try:
+        popups = generate_popups(stress_profile, emotion_signals, on_popup=on_popup)
+    except Exception as exc:  # pragma: no cover - generate_popups already falls back
+        logger.exception("popup job failed session=%s: %s", session_id, exc)
+        popups = None
+
+    try:
+        _store_result(app, session_id, version, popups)
+    except Exception as exc:  # pragma: no cover - defensive logging
+        logger.exception("popup job store failed session=%s: %s", session_id, exc)
+
+    socketio.emit(
+        "popups_ready",
+        {
+            "session_id": room,
+            "popups_status": READY if popups is not None else FAILED,
+            "popups_count": len(popups or []),
+        },
+        room=room,
+    )
+    return popups
+
+
+def start_popup_job(
+    app,
+    session_id: str,
+    stress_profile: dict,
+    emotion_signals: list[str],
+    *,
+    stream: bool = False,
+) -> str:
+    """Start (or reuse) the popup job for this profile; return its version tag."""
+    session_id = str(session_id)
+    version = profile_fingerprint(stress_profile, emotion_signals)
+    with _jobs_lock:
+        job_version, future = _jobs.get(session_id, (None, None))
+        if future is not None and job_version == version:
+            return version
+        future = submit_popup(_run_job, app, session_id, version, stress_profile, emotion_signals, stream)
+        _jobs[session_id] = (version, future)
+
+    def _forget(done: Future) -> None:
+        # The result is in the database by now; drop the handle.
+        with _jobs_lock:
+            if _jobs.get(session_id, (None, None))[1] is done:
+                _jobs.pop(session_id, None)
+
+    future.add_done_callback(_forget)
+    logger.info("popup job started session=%s version=%s", session_id, version[:8])
+    return version
+
+
+def wait_for_popups(session_id: str, timeout: float) -> list[dict] | None:
+    """Block until this worker's job finishes; ``None`` when there is none or it timed out."""
+    future = job_for(session_id)
+    if future is None:
+        return None
+    try:
+        return future.result(timeout=timeout) or []
+    except FutureTimeoutError:
+        logger.warning("popup job still running after %.1fs session=%s", timeout, session_id)
+    return None
+
+
+def is_stale(meta: dict) -> bool:
+    started = (meta or {}).get("popups_started_at") or 0
+    return time.time() - float(started) > POPUP_JOB_STALE_SECONDS
+
+
+__all__ = [
+    "PENDING",
+    "READY",
+    "FAILED",
+    "popup_inputs",
+    "profile_fingerprint",
+    "job_for",
+    "start_popup_job",
+    "wait_for_popups",
+    "is_stale",
+]
@@ -0,0 +1,49 @@
+"""Field projection for session responses.
+
+Session responses are lean by default; clients opt into the large documents
+with ``fields=filled_slots,meta`` (or ``fields=all``), as an HTTP query
+parameter or a Socket.IO payload key.
+"""
+from __future__ import annotations
+
+from ..db.repo import get_history, get_popups
+
+SESSION_FIELDS = ("active_domains", "filled_slots", "meta", "popups", "history")
+
+_GETTERS = {
+    "active_domains": lambda session: session.active_domains or [],
+    "filled_slots": lambda session: session.filled_slots or {},
+    "meta": lambda session: session.meta or {},
+    "popups": get_popups,
+    "history": get_history,
+}
+
+
+class FieldsError(ValueError):
+    """Raised for a ``fields`` value naming unknown fields."""
+
+
+def parse_fields(raw, default=()) -> frozenset[str]:
+    """Parse a ``fields`` value (comma-separated string or list); None means ``default``."""
+    if raw is None:
+        return frozenset(default)
+    if isinstance(raw, (list, tuple)):
+        raw = ",".join(str(name) for name in raw)
+    names = {name.strip() for name in str(raw).split(",") if name.strip()}
+    if "all" in names:
+        return frozenset(SESSION_FIELDS)
+    unknown = names - set(SESSION_FIELDS)
+    if unknown:
+        raise FieldsError(f"unknown fields: {', '.join(sorted(unknown))}")
+    return frozenset(names)
+
+
+def project(session, body: dict, fields) -> dict:
+    """Add the requested session fields to ``body``."""
+    for name in SESSION_FIELDS:
+        if name in fields:
+            body[name] = _GETTERS[name](session)
+    return body
+
+
+__all__ = ["SESSION_FIELDS", "FieldsError", "parse_fields", "project"]
@@ -6,8 +6,9 @@ import logging
 
 from .fallbacks import FALLBACK_QUESTIONS
 from .validators import is_valid_question
-from .openai_client import chat_json
+from .openai_client import CircuitOpenError, chat_json
 from .generic_questions import get_generic_domain_question
+from .llm_metrics import record_fallback, record_parse_failure, record_retry
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +34,7 @@ def generate_question(
     slot: str,
     excerpt: str | None = None,
     context: dict | None = None,
+    timeout: float | None = None,
 ) -> str | None:
     """Generate a slot-specific question with validation and fallback."""
     context = context or {}
@@ -59,15 +61,27 @@ def generate_question(
 
     for attempt in (1, 2):
         question = ""
+        if attempt > 1:
+            record_retry("question")
         try:
             resp = chat_json(
                 model="gpt-5-mini",
                 system=SYSTEM_PROMPT_QUESTION,
                 user=json.dumps(payload, ensure_ascii=False),
+                timeout=timeout,
+                call_site="question",
+                refresh=attempt > 1,
             )
             raw = (resp.choices[0].message.content or "").strip()
             data = json.loads(raw)
             question = " ".join((data.get("question") or "").strip().split())
+        except CircuitOpenError as exc:
+            logger.warning("QUESTION_LLM_SKIPPED err=%s", exc)
+            break
+        except json.JSONDecodeError as exc:
+            record_parse_failure("question")
+            logger.warning("QUESTION_PARSE_FAIL attempt=%s err=%s", attempt, exc)
+            question = ""
         except Exception as exc:  # pragma: no cover - defensive logging
             logger.warning("QUESTION_LLM_FAIL attempt=%s err=%s", attempt, exc)
             question = ""
@@ -75,8 +89,11 @@ def generate_question(
         if question and question != last_question and is_valid_question(question):
             return question
 
+        if question:
+            record_parse_failure("question")
         logger.warning("Invalid question (attempt %s): %s", attempt, question)
 
+    record_fallback("question")
     return fallback
 
 
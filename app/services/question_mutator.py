@@ -6,6 +6,7 @@ import logging
 import re
 from typing import Tuple
 
+from .llm_metrics import record_fallback, record_parse_failure
 from .openai_client import chat_json
 
 logger = logging.getLogger(__name__)
@@ -117,7 +118,7 @@ def _deterministic_nudge(question: dict) -> tuple[dict, bool]:
     return mutated, changed
 
 
-def mutate_question(question: dict) -> Tuple[dict, bool]:
+def mutate_question(question: dict, timeout: float | None = None) -> Tuple[dict, bool]:
     """
     Return (mutated_question, mutated_flag).
     Only scq and integer questions are mutated; others are returned as-is.
@@ -140,10 +141,18 @@ def mutate_question(question: dict) -> Tuple[dict, bool]:
             model="gpt-5-mini",
             system=SYSTEM_PROMPT_MUTATE,
             user=json.dumps(base_payload, ensure_ascii=False),
+            timeout=timeout,
+            call_site="mutate",
         )
         raw = (resp.choices[0].message.content or "").strip()
         data = json.loads(raw)
+    except json.JSONDecodeError as exc:
+        record_parse_failure("mutate")
+        record_fallback("mutate")
+        logger.warning("question mutate unparseable: %s", exc)
+        return question, False
     except Exception as exc:  # pragma: no cover - defensive
+        record_fallback("mutate")
         logger.warning("question mutate failed: %s", exc)
         return question, False
 
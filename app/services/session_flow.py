@@ -0,0 +1,352 @@
+"""Next-question planning shared by ``/next-question`` and speculative pregeneration.
+
+``plan_next_question`` decides what to ask from plain copies of the session
+state and never touches the database, so it can run on the background pool
+right after ``/answer`` commits. The result is tagged with a fingerprint of
+the state it was computed from; ``/next-question`` serves it only while the
+fingerprint still matches.
+"""
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from types import SimpleNamespace
+
+from .answer_extractor import extract_answer_slots
+from .background import session_lock, submit
+from .combo_question_generator import generate_combo_question
+from .gpt_client import detect_causes, extract_components
+from .planner import activate_domains_from_causes, pick_next_slot
+from .popup_jobs import popup_inputs, start_popup_job
+from .question_generator import generate_question, get_generic_domain_question
+from .relevance import combo_relevant, domain_relevant
+from .slot_manager import add_negated_slots, get_missing_slots, set_slot_value
+from .stop_engine import should_stop
+
+logger = logging.getLogger(__name__)
+
+PREGENERATE_WAIT_SECONDS = float(os.getenv("PREGENERATE_WAIT_SECONDS", "15"))
+
+DEFAULT_DOMAINS = ["time_pressure", "distractions", "academic_confidence"]
+
+# Meta keys that influence planning; anything else may change without invalidating a plan.
+PLANNING_META_KEYS = (
+    "causes",
+    "total_questions_asked",
+    "domain_question_count",
+    "combo_history",
+    "last_question",
+    "pending_extraction",
+)
+
+_inflight: dict[str, tuple[str, Future]] = {}
+_inflight_lock = threading.Lock()
+
+
+def state_fingerprint(raw_text: str, active_domains, filled_slots, meta: dict) -> str:
+    """Version tag for the planning inputs of one session."""
+    payload = {
+        "raw_text": raw_text or "",
+        "active_domains": list(active_domains or []),
+        "filled_slots": filled_slots or {},
+        "meta": {key: (meta or {}).get(key) for key in PLANNING_META_KEYS},
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+def _is_missing(filled_slots: dict, domain: str, slot: str) -> bool:
+    return not filled_slots.get(domain, {}).get(slot)
+
+
+def _pick_combo(raw_text: str, filled_slots: dict, meta: dict) -> str | None:
+    total_questions = int(meta.get("total_questions_asked", 0))
+    combo_history = set(meta.get("combo_history") or [])
+    if total_questions > 2:
+        return None
+    if (
+        "friend_compare_emotion" not in combo_history
+        and combo_relevant("friend_compare_emotion", raw_text)
+        and domain_relevant("social_comparison", raw_text)
+        and (
+            _is_missing(filled_slots, "distractions", "friend_name")
+            or _is_missing(filled_slots, "social_comparison", "comparison_person")
+            or _is_missing(filled_slots, "social_comparison", "comparison_gap")
+        )
+    ):
+        return "friend_compare_emotion"
+    if (
+        "distraction_time_combo" not in combo_history
+        and combo_relevant("distraction_time_combo", raw_text)
+        and domain_relevant("distractions", raw_text)
+        and domain_relevant("time_pressure", raw_text)
+        and (
+            _is_missing(filled_slots, "distractions", "gaming_app")
+            or _is_missing(filled_slots, "distractions", "gaming_time")
+            or _is_missing(filled_slots, "time_pressure", "timetable_breaker")
+        )
+    ):
+        return "distraction_time_combo"
+    return None
+
+
+def _excerpt_for(domain: str, filled_slots: dict) -> str | None:
+    domain_profile = filled_slots.get(domain) or {}
+    if domain == "academic_confidence":
+        weak = domain_profile.get("weak_subject") or ""
+        last = domain_profile.get("last_test_experience") or ""
+        if weak or last:
+            return f"Weak in {weak}. Last test felt {last}."
+    elif domain == "family_pressure":
+        expect = domain_profile.get("expectation_type") or ""
+        member = domain_profile.get("family_member") or ""
+        if expect or member:
+            return f"Family member {member} expects {expect}."
+    elif domain == "distractions":
+        friend = domain_profile.get("friend_name") or ""
+        app = domain_profile.get("phone_app") or ""
+        if friend or app:
+            return f"Distractions include {friend} and app {app}."
+    return None
+
+
+def plan_next_question(
+    raw_text: str,
+    active_domains,
+    filled_slots,
+    meta: dict,
+    *,
+    min_questions: int,
+    max_questions: int,
+    max_domain_questions: int,
+) -> dict:
+    """Decide the next step for a session without mutating its state.
+
+    Returns ``{"kind": "combo"|"question"|"done", "active_domains",
+    "filled_slots", "meta_updates", ...}``; ``filled_slots`` carries any slots
+    negated while searching or extracted from the last answer, and
+    ``meta_updates`` the causes / gate memo.
+    """
+    raw_text = raw_text or ""
+    active_domains = list(active_domains or [])
+    filled_slots = copy.deepcopy(dict(filled_slots or {}))
+    meta_updates: dict = {}
+    causes = (meta or {}).get("causes")
+
+    if not active_domains:
+        active_domains = extract_components(raw_text)
+
+    if not active_domains:
+        if not causes:
+            causes = detect_causes(raw_text)
+            meta_updates["causes"] = causes
+        active_domains = activate_domains_from_causes(causes)
+
+    if not active_domains:
+        active_domains = list(DEFAULT_DOMAINS)
+
+    pending = (meta or {}).get("pending_extraction")
+    if pending:
+        # Other slots stated in the last answer, extracted off the /answer path.
+        meta_updates["pending_extraction"] = None
+        extra, negated = extract_answer_slots(
+            pending.get("answer") or "",
+            pending.get("domain") or "",
+            pending.get("slot") or "",
+            active_domains,
+            filled_slots,
+        )
+        for domain, values in extra.items():
+            for slot, value in values.items():
+                set_slot_value(filled_slots, domain, slot, value)
+        add_negated_slots(filled_slots, negated)
+
+    plan = {"active_domains": active_domains, "filled_slots": filled_slots, "meta_updates": meta_updates}
+
+    combo_spec_id = _pick_combo(raw_text, filled_slots, meta)
+    if combo_spec_id:
+        question = generate_combo_question(combo_spec_id, SimpleNamespace(filled_slots=filled_slots), raw_text)
+        if question:
+            return plan | {"kind": "combo", "combo_id": combo_spec_id, "question": question}
+
+    missing = get_missing_slots(active_domains, filled_slots)
+    if should_stop(
+        total_questions_asked=int(meta.get("total_questions_asked", 0)),
+        missing_slots_count=len(missing),
+        min_questions=min_questions,
+        max_questions=max_questions,
+    ):
+        return plan | {"kind": "done"}
+
+    domain_counts = dict(meta.get("domain_question_count") or {})
+    gate_state = copy.deepcopy(dict(meta.get("slot_gate") or {}))
+    last_question = (meta.get("last_question") or "").strip()
+    question = None
+    domain = slot = None
+    attempts = 0
+    max_attempts = len(missing) + 3
+
+    while attempts < max_attempts:
+        missing = get_missing_slots(active_domains, filled_slots)
+        next_slot = pick_next_slot(
+            active_domains,
+            missing,
+            domain_counts,
+            max_domain_questions,
+            raw_text,
+            filled_slots,
+            meta_updates.get("causes") or meta.get("causes") or {},
+            gate_state=gate_state,
+        )
+        meta_updates["slot_gate"] = gate_state
+        if not next_slot:
+            return plan | {"kind": "done"}
+
+        domain, slot = next_slot
+        context = {
+            "user_text": raw_text,
+            "filled_slots": filled_slots,
+            "domain": domain,
+            "slot": slot,
+            "causes": meta_updates.get("causes") or meta.get("causes") or {},
+        }
+        context["meta"] = {"last_question": last_question}
+
+        if slot == "__generic__":
+            generic = get_generic_domain_question(domain)
+            if generic:
+                next_slot, generic_question = generic
+                if generic_question == last_question:
+                    add_negated_slots(filled_slots, [next_slot])
+                    attempts += 1
+                    continue
+                slot, question = next_slot, generic_question
+                break
+            attempts += 1
+            continue
+
+        question = generate_question(domain, slot, excerpt=_excerpt_for(domain, filled_slots), context=context)
+        if question:
+            break
+
+        generic = get_generic_domain_question(domain)
+        if generic:
+            next_slot, generic_question = generic
+            if generic_question == last_question:
+                add_negated_slots(filled_slots, [next_slot])
+                attempts += 1
+                continue
+            slot, question = next_slot, generic_question
+            break
+
+        add_negated_slots(filled_slots, [slot])
+        attempts += 1
+
+    if not question:
+        return plan | {"kind": "done"}
+    return plan | {"kind": "question", "domain": domain, "slot": slot, "question": question}
+
+
+def _run_pregeneration(app, session_id: str, version: str, snapshot: dict, limits: dict) -> dict | None:
+    try:
+        plan = plan_next_question(
+            snapshot["raw_text"],
+            snapshot["active_domains"],
+            snapshot["filled_slots"],
+            snapshot["meta"],
+            **limits,
+        )
+    except Exception as exc:  # pragma: no cover - defensive logging
+        logger.exception("pregeneration failed session=%s: %s", session_id, exc)
+        return None
+
+    if plan["kind"] == "done":
+        # The next request will complete the session; start on its popups now.
+        stress_profile, emotion_signals = popup_inputs(plan["filled_slots"], snapshot["meta"])
+        start_popup_job(app, session_id, stress_profile, emotion_signals, stream=app.config["POPUP_STREAMING"])
+
+    # Persist for other workers; skip if the session moved on while we planned.
+    from ..db.repo import StaleSessionError, get_session, save_session
+
+    with app.app_context(), session_lock(session_id):
+        try:
+            session = get_session(session_id)
+            if session is None or session.status != "active":
+                return plan
+            meta = dict(session.meta or {})
+            if meta.get("current_question"):
+                return plan
+            current = state_fingerprint(session.raw_initial_text, session.active_domains, session.filled_slots, meta)
+            if current != version:
+                logger.info("pregeneration stale session=%s", session_id)
+                return plan
+            meta["pregenerated"] = {"version": version, "plan": plan}
+            session.meta = meta
+            save_session(session)
+        except StaleSessionError:
+            # A request wrote first; it invalidates this plan anyway.
+            logger.info("pregeneration store lost a version race session=%s", session_id)
+        except Exception as exc:  # pragma: no cover - defensive logging
+            logger.exception("pregeneration store failed session=%s: %s", session_id, exc)
+    return plan
+
+
+def schedule_pregeneration(app, session, *, min_questions: int, max_questions: int, max_domain_questions: int) -> str:
+    """Plan the next question for ``session`` on the background pool; return the version tag."""
+    session_id = str(session.id)
+    meta = dict(session.meta or {})
+    snapshot = {
+        "raw_text": session.raw_initial_text or "",
+        "active_domains": list(session.active_domains or []),
+        "filled_slots": copy.deepcopy(dict(session.filled_slots or {})),
+        "meta": copy.deepcopy(meta),
+    }
+    version = state_fingerprint(snapshot["raw_text"], snapshot["active_domains"], snapshot["filled_slots"], meta)
+    limits = {
+        "min_questions": min_questions,
+        "max_questions": max_questions,
+        "max_domain_questions": max_domain_questions,
+    }
+    future = submit(_run_pregeneration, app, session_id, version, snapshot, limits)
+    with _inflight_lock:
+        _inflight[session_id] = (version, future)
+
+    def _forget(done: Future) -> None:
+        with _inflight_lock:
+            if _inflight.get(session_id, (None, None))[1] is done:
+                _inflight.pop(session_id, None)
+
+    future.add_done_callback(_forget)
+    return version
+
+
+def take_pregenerated(session_id: str, meta: dict, version: str, wait: float = PREGENERATE_WAIT_SECONDS) -> dict | None:
+    """Return a plan computed for ``version``: stored in meta, or from a job still running here."""
+    stored = meta.get("pregenerated") or {}
+    if stored.get("version") == version and stored.get("plan"):
+        return stored["plan"]
+
+    with _inflight_lock:
+        version_inflight, future = _inflight.get(str(session_id), (None, None))
+    if future is None or version_inflight != version:
+        return None
+    try:
+        return future.result(timeout=wait)
+    except FutureTimeoutError:
+        logger.warning("pregeneration still running after %.1fs session=%s; planning inline", wait, session_id)
+    except Exception as exc:  # pragma: no cover - defensive logging
+        logger.exception("pregeneration failed session=%s: %s", session_id, exc)
+    return None
+
+
+__all__ = [
+    "state_fingerprint",
+    "plan_next_question",
+    "schedule_pregeneration",
+    "take_pregenerated",
+]
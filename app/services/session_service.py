@@ -0,0 +1,298 @@
+"""The question loop, independent of transport.
+
+``answer`` and ``next_question`` take the request body and the projected
+``fields`` and return ``(payload, status)``. ``handle`` wraps them with the
+``Idempotency-Key`` replay cache and conflict mapping and is what both the
+HTTP routes and the Socket.IO events call, so the two transports behave
+identically.
+"""
+from __future__ import annotations
+
+import logging
+import time
+
+from flask import current_app
+
+from ..db.repo import (
+    append_history,
+    get_session,
+    load_committed_meta,
+    retry_on_conflict,
+    save_session,
+    StaleSessionError,
+)
+from .background import session_lock
+from .combo_answer_parser import PARSERS as COMBO_PARSERS
+from .combo_specs import COMBO_SPECS
+from .fallbacks import CLARIFIER_QUESTION
+from .idempotency import fingerprint, run_idempotent
+from .popup_jobs import PENDING, READY, popup_inputs, profile_fingerprint, start_popup_job
+from .projection import project
+from .session_flow import plan_next_question, schedule_pregeneration, state_fingerprint, take_pregenerated
+from .slot_manager import is_slot_allowed, set_slot_value
+
+logger = logging.getLogger(__name__)
+
+CONFLICT_ERROR = "session is being updated by another request, retry"
+
+
+@retry_on_conflict
+def answer(session_id: str, body: dict, fields=frozenset()) -> tuple[dict, int]:
+    session = get_session(session_id)
+    if not session:
+        return {"error": "session not found"}, 404
+    if session.status != "active":
+        return {"error": "session is not active"}, 400
+
+    answer_text = (body.get("answer") or "").strip()
+
+    meta = dict(session.meta or {})
+    current_question = meta.get("current_question") or {}
+    if current_question.get("type") == "combo":
+        combo_id = current_question.get("combo_id")
+        parser = COMBO_PARSERS.get(combo_id)
+        if parser:
+            parsed = parser(answer_text)
+            if not parsed:
+                hint = COMBO_SPECS.get(combo_id, {}).get("hint", "")
+                return {"need_clarification": True, "question": f"Please follow the format:\n{hint}"}, 200
+
+            for key, value in parsed["slots"].items():
+                domain_key, slot_key = key.split(".", 1)
+                set_slot_value(session.filled_slots, domain_key, slot_key, value)
+
+            emotion = parsed.get("emotion")
+            if emotion:
+                signals = list(meta.get("emotion_signals") or [])
+                signals.append(emotion)
+                meta["emotion_signals"] = signals
+
+            meta["current_question"] = None
+            session.meta = meta
+            append_history(session, "user", answer_text)
+            save_session(session)
+            pregenerate_next(session)
+            return project(session, {"ok": True}, fields), 200
+
+    domain = body.get("domain")
+    slot = body.get("slot")
+    domain = domain or current_question.get("domain")
+    slot = slot or current_question.get("slot")
+
+    if not (domain and slot):
+        return {"error": "domain/slot missing (no current_question found)"}, 400
+
+    if not is_slot_allowed(domain, slot):
+        return {"error": "invalid domain/slot"}, 400
+
+    if not answer_text:
+        return {"error": "answer is required"}, 400
+
+    clarifier_used = list(meta.get("clarifier_used") or [])
+    key = f"{domain}.{slot}"
+    if len(answer_text.split()) < 2 and key not in clarifier_used:
+        clarifier_used.append(key)
+        meta["clarifier_used"] = clarifier_used
+        meta["current_question"] = {
+            "domain": domain,
+            "slot": slot,
+            "question": CLARIFIER_QUESTION,
+        }
+        session.meta = meta
+
+        append_history(session, "user", answer_text)
+        append_history(session, "assistant", CLARIFIER_QUESTION)
+        save_session(session)
+        return {
+            "need_clarification": True,
+            "domain": domain,
+            "slot": slot,
+            "question": CLARIFIER_QUESTION,
+        }, 200
+
+    append_history(session, "user", answer_text)
+    set_slot_value(session.filled_slots, domain, slot, answer_text)
+    meta["current_question"] = None
+    if current_app.config["ANSWER_EXTRACTION"]:
+        meta["pending_extraction"] = {"domain": domain, "slot": slot, "answer": answer_text}
+    session.meta = meta
+
+    save_session(session)
+    pregenerate_next(session)
+    return project(session, {"ok": True}, fields), 200
+
+
+@retry_on_conflict
+def next_question(session_id: str, body: dict | None = None, fields=frozenset()) -> tuple[dict, int]:
+    session = get_session(session_id)
+    if not session or session.status != "active":
+        return {"error": "invalid session"}, 400
+
+    current_q = (session.meta or {}).get("current_question")
+    if current_q:
+        return project(
+            session,
+            {
+                "done": False,
+                "domain": current_q.get("domain"),
+                "slot": current_q.get("slot"),
+                "question": current_q.get("question"),
+                "pending": True,
+                "message": "Answer the current question first",
+            },
+            fields,
+        ), 200
+
+    meta = dict(session.meta or {})
+    version = state_fingerprint(session.raw_initial_text, session.active_domains, session.filled_slots, meta)
+    plan = take_pregenerated(session_id, meta, version) if current_app.config["PREGENERATE_QUESTIONS"] else None
+    if plan is None:
+        plan = plan_next_question(
+            session.raw_initial_text or "",
+            session.active_domains,
+            session.filled_slots,
+            meta,
+            min_questions=current_app.config["MIN_QUESTIONS"],
+            max_questions=current_app.config["MAX_QUESTIONS"],
+            max_domain_questions=current_app.config["MAX_DOMAIN_QUESTIONS"],
+        )
+
+    meta.pop("pregenerated", None)
+    meta.update(plan["meta_updates"])
+    session.active_domains = plan["active_domains"]
+    session.filled_slots = plan["filled_slots"]
+    total_questions = int(meta.get("total_questions_asked", 0))
+
+    if plan["kind"] == "done":
+        session.meta = meta
+        return complete_session(session, fields), 200
+
+    question = plan["question"]
+    if plan["kind"] == "combo":
+        combo_spec_id = plan["combo_id"]
+        meta["total_questions_asked"] = total_questions + 1
+        meta["current_question"] = {
+            "type": "combo",
+            "combo_id": combo_spec_id,
+            "question": question,
+        }
+        history = list(meta.get("combo_history") or [])
+        history.append(combo_spec_id)
+        meta["combo_history"] = history
+        session.meta = meta
+        append_history(session, "assistant", question)
+        save_session(session)
+        return project(
+            session,
+            {
+                "done": False,
+                "combo": True,
+                "question": question,
+                "hint": COMBO_SPECS[combo_spec_id]["hint"],
+            },
+            fields,
+        ), 200
+
+    domain, slot = plan["domain"], plan["slot"]
+    domain_counts = dict(meta.get("domain_question_count") or {})
+    append_history(session, "assistant", question)
+    meta["total_questions_asked"] = total_questions + 1
+    domain_counts[domain] = int(domain_counts.get(domain, 0)) + 1
+    meta["domain_question_count"] = domain_counts
+    meta["current_question"] = {"domain": domain, "slot": slot, "question": question}
+    meta["last_question"] = question
+    session.meta = meta
+
+    save_session(session)
+
+    return project(
+        session,
+        {
+            "done": False,
+            "domain": domain,
+            "slot": slot,
+            "question": question,
+        },
+        fields,
+    ), 200
+
+
+ACTIONS = {"answer": answer, "next_question": next_question}
+
+
+def handle(
+    action: str, session_id: str, body: dict, fields=frozenset(), idempotency_key: str = ""
+) -> tuple[dict, int, bool]:
+    """Run ``action`` for one request; return ``(payload, status, replayed)``.
+
+    A conflict that outlives ``retry_on_conflict`` is answered ``409`` and,
+    like server errors, is not stored for replay.
+    """
+    run = ACTIONS[action]
+    try:
+        return run_idempotent(
+            session_id,
+            action,
+            idempotency_key,
+            fingerprint(body, fields),
+            lambda: run(session_id, body, fields),
+        )
+    except StaleSessionError:
+        return {"error": CONFLICT_ERROR}, 409, False
+
+
+def pregenerate_next(session) -> None:
+    """Start planning the next question once an answer is committed."""
+    if not current_app.config["PREGENERATE_QUESTIONS"] or session.status != "active":
+        return
+    schedule_pregeneration(
+        current_app._get_current_object(),
+        session,
+        min_questions=current_app.config["MIN_QUESTIONS"],
+        max_questions=current_app.config["MAX_QUESTIONS"],
+        max_domain_questions=current_app.config["MAX_DOMAIN_QUESTIONS"],
+    )
+
+
+def complete_session(session, fields=frozenset()) -> dict:
+    """Mark the session completed and make sure its popups are being prepared."""
+    session.status = "completed"
+    session_id = str(session.id)
+    meta = dict(session.meta or {})
+    stress_profile, emotion_signals = popup_inputs(session.filled_slots or {}, meta)
+    version = profile_fingerprint(stress_profile, emotion_signals)
+
+    with session_lock(session_id):
+        stored_meta = load_committed_meta(session.id)
+        if stored_meta.get("popups_version") == version and stored_meta.get("popups_status") == READY:
+            # A speculative job already finished for this exact profile.
+            meta["popups_status"] = READY
+            meta["popups_count"] = stored_meta.get("popups_count", 0)
+        else:
+            start_popup_job(
+                current_app._get_current_object(),
+                session_id,
+                stress_profile,
+                emotion_signals,
+                stream=current_app.config["POPUP_STREAMING"],
+            )
+            meta["popups_status"] = PENDING
+            meta["popups_started_at"] = time.time()
+        meta["popups_version"] = version
+        session.meta = meta
+        save_session(session)
+
+    return project(
+        session,
+        {
+            "done": True,
+            "status": session.status,
+            "popups_status": meta["popups_status"],
+            "popups_ready": meta["popups_status"] == READY,
+            "popups_count": meta.get("popups_count", 0) if meta["popups_status"] == READY else 0,
+        },
+        fields,
+    )
+
+
+__all__ = ["answer", "next_question", "handle", "complete_session", "pregenerate_next", "CONFLICT_ERROR"]
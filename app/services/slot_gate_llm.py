@@ -1,9 +1,11 @@
 """LLM guardrail for slot eligibility."""
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
 
+from .llm_metrics import record_fallback, record_parse_failure
 from .openai_client import chat_json
 
 logger = logging.getLogger(__name__)
@@ -19,8 +21,40 @@ Rules:
 - Be conservative: if unsure, set ask=false.
 """
 
+SYSTEM_PROMPT_SLOT_GATE_BATCH = """
+You decide, for EACH listed domain+slot, whether its question should be asked.
+Return STRICT JSON only, one entry per requested slot:
+{"decisions":[{"domain":"time_pressure","slot":"exam_time_left","ask":true}]}
 
-def should_ask_slot(user_text: str, domain: str, slot: str) -> bool:
+Rules:
+- If the user clearly denies a cause, return ask=false for those slots.
+- Do not invent or explain. Only rely on the provided user_text.
+- Be conservative: if unsure, set ask=false.
+"""
+
+
+def _valid_single(content: str) -> bool:
+    return isinstance(json.loads(content).get("ask"), bool)
+
+
+def _valid_batch(content: str) -> bool:
+    return isinstance(json.loads(content).get("decisions"), list)
+
+
+def gate_key(domain: str, slot: str) -> str:
+    return f"{domain}.{slot}"
+
+
+def gate_fingerprint(user_text: str, negated_slots) -> str:
+    """Identify the inputs a stored gate decision depends on."""
+    material = json.dumps(
+        {"user_text": user_text or "", "negated": sorted(set(negated_slots or []))},
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(material.encode("utf-8")).hexdigest()
+
+
+def should_ask_slot(user_text: str, domain: str, slot: str, timeout: float | None = None) -> bool:
     payload = {
         "user_text": (user_text or "")[:2000],
         "domain": domain,
@@ -31,13 +65,74 @@ def should_ask_slot(user_text: str, domain: str, slot: str) -> bool:
             model="gpt-5-mini",
             system=SYSTEM_PROMPT_SLOT_GATE,
             user=json.dumps(payload, ensure_ascii=False),
+            timeout=timeout,
+            call_site="gate",
+            validate=_valid_single,
         )
         raw = (resp.choices[0].message.content or "").strip()
         data = json.loads(raw)
         return bool(data.get("ask", False))
+    except json.JSONDecodeError as exc:
+        record_parse_failure("gate")
+        logger.warning("slot gate unparseable for %s.%s: %s", domain, slot, exc)
     except Exception as exc:  # pragma: no cover - fail open
         logger.warning("slot gate failed for %s.%s: %s", domain, slot, exc)
-        return True
+    record_fallback("gate")
+    return True
+
+
+def gate_slots(
+    user_text: str,
+    slots: list[tuple[str, str]],
+    timeout: float | None = None,
+) -> tuple[dict[str, bool], set[str]]:
+    """Decide every (domain, slot) in one call; return (decisions, fallback keys).
+
+    Keys are ``domain.slot``. Fails open like ``should_ask_slot``: slots the
+    model omits, or every slot when the call fails, are treated as askable and
+    listed in the fallback keys so callers don't remember them as decisions.
+    """
+    if not slots:
+        return {}, set()
+    decisions = {gate_key(domain, slot): True for domain, slot in slots}
+    fallback = set(decisions)
+    payload = {
+        "user_text": (user_text or "")[:2000],
+        "slots": [{"domain": domain, "slot": slot} for domain, slot in slots],
+    }
+    try:
+        resp = chat_json(
+            model="gpt-5-mini",
+            system=SYSTEM_PROMPT_SLOT_GATE_BATCH,
+            user=json.dumps(payload, ensure_ascii=False),
+            timeout=timeout,
+            call_site="gate",
+            validate=_valid_batch,
+        )
+        raw = (resp.choices[0].message.content or "").strip()
+        data = json.loads(raw)
+        for item in data.get("decisions") or []:
+            if not isinstance(item, dict):
+                continue
+            key = gate_key(str(item.get("domain") or ""), str(item.get("slot") or ""))
+            if key in decisions:
+                decisions[key] = bool(item.get("ask", False))
+                fallback.discard(key)
+    except json.JSONDecodeError as exc:
+        record_parse_failure("gate")
+        record_fallback("gate")
+        logger.warning("batched slot gate unparseable for %s slots: %s", len(slots), exc)
+    except Exception as exc:  # pragma: no cover - fail open
+        record_fallback("gate")
+        logger.warning("batched slot gate failed for %s slots: %s", len(slots), exc)
+    return decisions, fallback
 
 
-__all__ = ["should_ask_slot"]
+__all__ = [
+    "should_ask_slot",
+    "gate_slots",
+    "gate_key",
+    "gate_fingerprint",
+    "SYSTEM_PROMPT_SLOT_GATE",
+    "SYSTEM_PROMPT_SLOT_GATE_BATCH",
+]
@@ -3,7 +3,9 @@ from __future__ import annotations
 
 from typing import Dict, List, Literal
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
+
+from ..constants import SLOT_SCHEMA
 
 DomainId = Literal[
     "distractions",
@@ -19,10 +21,52 @@ DomainId = Literal[
 PrefillMap = Dict[str, Dict[str, str]]
 
 
+def clean_prefill(prefill) -> PrefillMap:
+    """Keep schema slots with short, whitespace-normalized string values."""
+    clean: PrefillMap = {}
+    if not isinstance(prefill, dict):
+        return clean
+    for domain, slots in prefill.items():
+        if domain not in SLOT_SCHEMA or not isinstance(slots, dict):
+            continue
+        for slot, value in slots.items():
+            if slot in SLOT_SCHEMA[domain] and isinstance(value, str) and value.strip():
+                clean.setdefault(domain, {})[slot] = " ".join(value.strip().split())[:80]
+    return clean
+
+
+def clean_negated_slots(slots) -> list[str]:
+    """Keep slot names that exist somewhere in SLOT_SCHEMA."""
+    negated: list[str] = []
+    for slot in slots or []:
+        slot_name = (slot or "").strip() if isinstance(slot, str) else ""
+        if not slot_name:
+            continue
+        if any(slot_name in SLOT_SCHEMA[d] for d in SLOT_SCHEMA):
+            negated.append(slot_name)
+    return negated
+
+
 class SlotPrefillResponse(BaseModel):
     active_domains: List[DomainId] = Field(default_factory=list)
     prefill: PrefillMap = Field(default_factory=dict)
     negated_slots: List[str] = Field(default_factory=list)
 
+    @field_validator("prefill", mode="before")
+    @classmethod
+    def normalize_prefill(cls, value):
+        return clean_prefill(value)
+
+    @field_validator("negated_slots", mode="before")
+    @classmethod
+    def normalize_negated_slots(cls, value):
+        return clean_negated_slots(value)
 
-__all__ = ["SlotPrefillResponse", "DomainId", "PrefillMap"]
+
+__all__ = [
+    "SlotPrefillResponse",
+    "DomainId",
+    "PrefillMap",
+    "clean_prefill",
+    "clean_negated_slots",
+]
@@ -0,0 +1,259 @@
+"""Deterministic rule tier in front of the LLM slot gate.
+
+Clear-cut slots are decided from the initial text with precompiled,
+negation-aware patterns: an explicit denial skips the slot, an explicit
+keyword hit asks it. Every rule carries a confidence; decisions below
+``SLOT_RULES_MIN_CONFIDENCE`` and slots no rule matches are left to the
+batched LLM gate.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+from typing import NamedTuple
+
+from ..constants import SLOT_SCHEMA
+from ..metrics import registry
+from .relevance import DOMAIN_DENIAL_PATTERNS, DOMAIN_KEYWORDS, NEGATORS, _norm
+from .slot_gate_llm import gate_key, gate_slots
+
+logger = logging.getLogger(__name__)
+
+# Set above 1 to send every slot to the LLM gate.
+MIN_CONFIDENCE = float(os.getenv("SLOT_RULES_MIN_CONFIDENCE", "0.8"))
+
+RULE_CONFIDENCE = {
+    "domain_denial": 0.95,
+    "slot_denial": 0.9,
+    "slot_keyword": 0.9,
+    # Domain-level evidence says nothing about a particular slot: recorded as a
+    # rule hit but below the floor, so those slots still go to the LLM gate.
+    "domain_keyword": 0.6,
+}
+
+# Explicit phrases only: a hit asks the slot without the LLM, so words most
+# intakes contain anyway ("study", "hours", "want to") don't belong here.
+SLOT_KEYWORDS: dict[str, dict[str, list[str]]] = {
+    "distractions": {
+        "phone_app": ["instagram", "youtube", "snapchat", "whatsapp", "reels", "phone", "mobile"],
+        "app_activity": ["scrolling", "scroll", "reels", "shorts", "chatting", "watching"],
+        "reel_type": ["reels", "shorts", "memes"],
+        "friend_name": ["friend", "friends", "bestie"],
+        "gaming_app": ["bgmi", "pubg", "free fire", "call of duty", "cod", "valorant", "game", "games", "gaming"],
+        "gaming_time": ["bgmi", "pubg", "free fire", "call of duty", "cod", "valorant", "game", "games", "gaming"],
+    },
+    "academic_confidence": {
+        "weak_subject": ["weak", "physics", "chemistry", "math", "maths", "biology", "bio"],
+        "favorite_subject": ["favorite", "favourite", "enjoy", "love"],
+        "concept_confidence": ["concept", "concepts", "cannot understand", "confused", "understand"],
+        "last_test_experience": ["test", "mock", "marks", "scores", "low marks", "result"],
+    },
+    "time_pressure": {
+        "exam_time_left": ["exam in", "days left", "weeks left", "months left", "jee", "neet", "boards"],
+        "study_hours_per_day": [
+            "hours a day",
+            "hours per day",
+            "hours daily",
+            "hours every day",
+            "hrs a day",
+            "hrs per day",
+            "study hours",
+        ],
+        "timetable_breaker": ["timetable", "schedule", "routine"],
+    },
+    "social_comparison": {
+        "comparison_person": ["compare", "topper", "better than me", "friend scored", "cousin"],
+        "comparison_gap": ["compare", "gap", "better than me", "behind"],
+    },
+    "family_pressure": {
+        "family_member": ["dad", "mom", "father", "mother", "parents", "family", "brother", "sister"],
+        "expectation_type": ["expect", "expects", "expectation", "iit", "aiims", "rank", "doctor", "engineer"],
+    },
+    "motivation": {
+        "motivation_reason": ["my dream", "my goal", "motivates me", "motivated by", "want to become"],
+        "demotivation_reason": [
+            "demotivated",
+            "lost motivation",
+            "lost my motivation",
+            "lost interest",
+            "give up",
+            "giving up",
+            "no motivation",
+        ],
+    },
+    "backlog_stress": {
+        "backlog_subject": ["backlog", "pending", "incomplete"],
+        "backlog_deadline": ["backlog", "deadline", "pending"],
+    },
+}
+
+SLOT_DENIAL_PATTERNS: dict[str, dict[str, list[str]]] = {
+    "distractions": {
+        "gaming_app": [r"\b(i )?(dont|don't|do not|never) (play|game)\b", r"\bno (games|gaming)\b"],
+        "gaming_time": [r"\b(i )?(dont|don't|do not|never) (play|game)\b", r"\bno (games|gaming)\b"],
+        "friend_name": [r"\bno friends\b", r"\bfriends (do not|don't|dont) distract\b"],
+        "phone_app": [r"\b(i )?(dont|don't|do not) (have|use) (a )?(phone|mobile)\b"],
+    },
+    "family_pressure": {
+        "family_member": [r"\b(parents|family) (do not|don't|dont|never) (pressure|force)\b"],
+        "expectation_type": [r"\bno (family )?pressure\b"],
+    },
+}
+
+_NEGATOR_RE = re.compile(r"\b(?:" + "|".join(sorted((re.escape(n) for n in NEGATORS), key=len, reverse=True)) + r")\b")
+_NEGATION_WINDOW = 5
+
+
+def _alternation(words: list[str]) -> re.Pattern | None:
+    if not words:
+        return None
+    escaped = sorted({re.escape(word.lower()) for word in words}, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(escaped) + r")\b")
+
+
+def _any(patterns: list[str]) -> re.Pattern | None:
+    return re.compile("|".join(f"(?:{p})" for p in patterns)) if patterns else None
+
+
+class _CompiledSlot(NamedTuple):
+    domain_denial: re.Pattern | None
+    slot_denial: re.Pattern | None
+    slot_keywords: re.Pattern | None
+    domain_keywords: re.Pattern | None
+
+
+def _compile() -> dict[tuple[str, str], _CompiledSlot]:
+    compiled = {}
+    for domain, slots in SLOT_SCHEMA.items():
+        domain_denial = _any(DOMAIN_DENIAL_PATTERNS.get(domain, []))
+        domain_keywords = _alternation(DOMAIN_KEYWORDS.get(domain, []))
+        for slot in slots:
+            compiled[(domain, slot)] = _CompiledSlot(
+                domain_denial,
+                _any(SLOT_DENIAL_PATTERNS.get(domain, {}).get(slot, [])),
+                _alternation(SLOT_KEYWORDS.get(domain, {}).get(slot, [])),
+                domain_keywords,
+            )
+    return compiled
+
+
+_COMPILED = _compile()
+
+
+class RuleDecision(NamedTuple):
+    ask: bool
+    confidence: float
+    rule: str
+
+
+gate_tier_decisions = registry.counter(
+    "slot_gate_decisions_total",
+    "Slot gate decisions by tier (rule, llm) and result (ask, skip).",
+    labels=("tier", "result"),
+)
+gate_rule_hits = registry.counter(
+    "slot_gate_rule_hits_total",
+    "Rule-tier matches by rule, including ones below the confidence floor.",
+    labels=("rule",),
+)
+
+
+def _positive(pattern: re.Pattern | None, normalized: str) -> bool:
+    """True when a keyword occurs without a negator in the preceding few words."""
+    if pattern is None:
+        return False
+    for match in pattern.finditer(normalized):
+        near_left = " ".join(normalized[max(0, match.start() - 80) : match.start()].split()[-_NEGATION_WINDOW:])
+        if _NEGATOR_RE.search(near_left):
+            continue
+        return True
+    return False
+
+
+def decide_slot(user_text: str, domain: str, slot: str) -> RuleDecision | None:
+    """Rule decision for one slot, or None when no rule applies."""
+    compiled = _COMPILED.get((domain, slot))
+    if compiled is None:
+        return None
+    normalized = _norm(user_text)
+    if compiled.domain_denial is not None and compiled.domain_denial.search(normalized):
+        return RuleDecision(False, RULE_CONFIDENCE["domain_denial"], "domain_denial")
+    if compiled.slot_denial is not None and compiled.slot_denial.search(normalized):
+        return RuleDecision(False, RULE_CONFIDENCE["slot_denial"], "slot_denial")
+    if _positive(compiled.slot_keywords, normalized):
+        return RuleDecision(True, RULE_CONFIDENCE["slot_keyword"], "slot_keyword")
+    if _positive(compiled.domain_keywords, normalized):
+        return RuleDecision(True, RULE_CONFIDENCE["domain_keyword"], "domain_keyword")
+    return None
+
+
+def apply_slot_rules(
+    user_text: str,
+    slots: list[tuple[str, str]],
+    min_confidence: float = MIN_CONFIDENCE,
+) -> tuple[dict[str, bool], list[tuple[str, str]]]:
+    """Split slots into rule-decided ``{"domain.slot": ask}`` and the ambiguous rest."""
+    decided: dict[str, bool] = {}
+    ambiguous: list[tuple[str, str]] = []
+    for domain, slot in slots:
+        decision = decide_slot(user_text, domain, slot)
+        if decision is not None:
+            gate_rule_hits.inc(rule=decision.rule)
+        if decision is None or decision.confidence < min_confidence:
+            ambiguous.append((domain, slot))
+            continue
+        decided[gate_key(domain, slot)] = decision.ask
+        gate_tier_decisions.inc(tier="rule", result="ask" if decision.ask else "skip")
+    return decided, ambiguous
+
+
+def gate_slots_tiered(
+    user_text: str,
+    slots: list[tuple[str, str]],
+    timeout: float | None = None,
+) -> tuple[dict[str, bool], set[str]]:
+    """Rule tier first; only ambiguous slots reach the batched LLM gate.
+
+    Returns (decisions, fallback keys); fallback keys are fail-open defaults
+    from a failed or incomplete LLM answer and should not be memoized.
+    """
+    decided, ambiguous = apply_slot_rules(user_text, slots)
+    fallback: set[str] = set()
+    if ambiguous:
+        llm_decisions, fallback = gate_slots(user_text, ambiguous, timeout=timeout)
+        for key, ask in llm_decisions.items():
+            if key not in fallback:
+                gate_tier_decisions.inc(tier="llm", result="ask" if ask else "skip")
+        decided.update(llm_decisions)
+    logger.debug(
+        "slot gate tiers rule=%s llm=%s fallback=%s", len(slots) - len(ambiguous), len(ambiguous), len(fallback)
+    )
+    return decided, fallback
+
+
+def gate_tier_stats() -> dict:
+    """Per-tier decision counts and the share decided without the LLM."""
+    counts = {
+        tier: int(sum(gate_tier_decisions.value(tier=tier, result=r) for r in ("ask", "skip")))
+        for tier in ("rule", "llm")
+    }
+    total = counts["rule"] + counts["llm"]
+    return {
+        "decisions": counts,
+        "rule_hit_ratio": round(counts["rule"] / total, 4) if total else None,
+        "rules": {rule: int(gate_rule_hits.value(rule=rule)) for rule in RULE_CONFIDENCE},
+        "min_confidence": MIN_CONFIDENCE,
+    }
+
+
+__all__ = [
+    "RuleDecision",
+    "decide_slot",
+    "apply_slot_rules",
+    "gate_slots_tiered",
+    "gate_tier_stats",
+    "SLOT_KEYWORDS",
+    "SLOT_DENIAL_PATTERNS",
+    "MIN_CONFIDENCE",
+]
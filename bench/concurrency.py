@@ -0,0 +1,131 @@
+"""Concurrency stress test for session saves.
+
+Fires every slot of the schema at ``/answer`` for the same session in
+parallel (a double-click / two-tabs storm), retrying ``409`` responses like a
+client would, then reads the row back and checks that every answer was
+applied: each request ends in ``200``, every slot value is present and every
+answer has exactly one history event. Exits non-zero on a lost or rejected
+answer, so it doubles as the regression check for conflict retries.
+
+    python -m bench.concurrency --sessions 5 --concurrency 16
+    python -m bench.concurrency --session-cache none --database-url postgresql+psycopg://...
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+START_TEXT = "I play BGMI for hours, weak in physics, my dad expects IIT and exams are in 3 weeks"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--client-retries", type=int, default=20, help="client-side retries of a 409")
+    parser.add_argument("--session-cache", default="memory", help="SESSION_CACHE_BACKEND for the run")
+    parser.add_argument("--llm-latency-ms", type=float, default=20.0)
+    parser.add_argument("--database-url", default=None, help="defaults to a temporary SQLite file")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args) -> None:
+    database_url = args.database_url or f"sqlite:///{tempfile.mkdtemp(prefix='stress-conc-')}/conc.db"
+    os.environ.update(
+        {
+            "DATABASE_URL": database_url,
+            "LLM_BACKEND": "fake",
+            "OPENAI_WARMUP": "false",
+            "SOCKETIO_MESSAGE_QUEUE": "",
+            "FAKE_LLM_LATENCY_MS": str(args.llm_latency_ms),
+            "SESSION_CACHE_BACKEND": args.session_cache,
+        }
+    )
+
+
+def answer_slot(app, session_id: str, domain: str, slot: str, retries: int) -> tuple[int, int]:
+    """Submit one answer; return (final status code, 409s seen)."""
+    client = app.test_client()
+    body = {"answer": f"stress value for {domain} {slot}", "domain": domain, "slot": slot}
+    conflicts = 0
+    for _ in range(retries + 1):
+        response = client.post(f"/session/{session_id}/answer", json=body)
+        if response.status_code != 409:
+            return response.status_code, conflicts
+        conflicts += 1
+        time.sleep(0.005 * conflicts)
+    return 409, conflicts
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    configure_environment(args)
+
+    from app import create_app
+    from app.constants import SLOT_SCHEMA
+    from app.db.models import HISTORY, Session, SessionEvent
+    from app.db.repo import session_conflicts
+    from app.extensions import db
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+
+    slots = [(domain, slot) for domain, names in SLOT_SCHEMA.items() for slot in names]
+    client = app.test_client()
+    lost: list[str] = []
+    client_conflicts = 0
+    failed = 0
+    started = time.perf_counter()
+
+    for _ in range(args.sessions):
+        session_id = client.post("/session/start", json={"text": START_TEXT}).get_json()["session_id"]
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda ds: answer_slot(app, session_id, *ds, args.client_retries), slots))
+        acknowledged = [ds for ds, (code, _) in zip(slots, results) if code == 200]
+        client_conflicts += sum(seen for _, seen in results)
+        failed += len(slots) - len(acknowledged)
+        for (domain, slot), (code, _) in zip(slots, results):
+            if code != 200:
+                lost.append(f"{session_id} {domain}.{slot} not applied (HTTP {code})")
+
+        with app.app_context():
+            row = db.session.get(Session, session_id)
+            filled = row.filled_slots or {}
+            answers = (
+                db.session.query(SessionEvent)
+                .filter(SessionEvent.session_id == session_id, SessionEvent.kind == HISTORY)
+                .count()
+                - 1
+            )
+        for domain, slot in acknowledged:
+            if (filled.get(domain) or {}).get(slot) != f"stress value for {domain} {slot}":
+                lost.append(f"{session_id} {domain}.{slot} acknowledged but missing")
+        if answers != len(slots):
+            lost.append(f"{session_id} history has {answers} answers for {len(slots)} sent")
+
+    wall = time.perf_counter() - started
+    print(f"sessions={args.sessions} answers={args.sessions * len(slots)} wall={wall:.3f}s")
+    print(
+        "server retries={:.0f} server exhausted={:.0f} client 409 retries={} failed={}".format(
+            session_conflicts.value(outcome="retried"),
+            session_conflicts.value(outcome="exhausted"),
+            client_conflicts,
+            failed,
+        )
+    )
+    if lost:
+        print("LOST OR REJECTED ANSWERS:")
+        for line in lost:
+            print(f"  {line}")
+        return 1
+    print("all answers applied, no lost updates")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
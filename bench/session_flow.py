@@ -0,0 +1,368 @@
+"""End-to-end session-flow load benchmark.
+
+Drives many concurrent synthetic students through the whole flow in-process:
+``POST /session/start`` → alternating ``/next-question`` and ``/answer``
+(combo answers and clarifier detours included) → ``/start-simulation`` with a
+Socket.IO test client joined to the session room → practice-question load.
+
+The LLM is the offline fake backend and the Acadza question API is served by a
+local HTTP stand-in, so the run needs no network. Reports throughput,
+p50/p95/p99 latency per endpoint, DB time versus LLM time, and regressions
+against a stored baseline. ``--transport socket`` sends ``next_question`` and
+``answer`` as Socket.IO events with acks instead of HTTP requests.
+
+    python -m bench.session_flow --students 100 --concurrency 20
+    python -m bench.session_flow --save-baseline bench/baseline.json
+    python -m bench.session_flow --baseline bench/baseline.json --tolerance 0.25
+    python -m bench.session_flow --students 100 --concurrency 20 --transport socket
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VENTS = [
+    "Exam in {n} weeks and I keep scrolling Instagram reels instead of studying",
+    "Weak in physics, my last test went badly and my parents keep asking about rank",
+    "I play BGMI for hours, my timetable breaks every day and the syllabus is left",
+    "My friend scored better than me again, I compare myself all the time",
+    "Backlog in chemistry is huge, {n} chapters pending and mock tests every week",
+    "Dad expects IIT, I study {n} hours but nothing sticks and I feel demotivated",
+]
+
+ANSWERS = [
+    "Around {n} hours on most days",
+    "Physics, especially rotation and electrostatics",
+    "Mostly Instagram reels late at night",
+    "My mom checks my marks after every test",
+    "About {n} weeks left for the main exam",
+    "Gaming with friends after dinner usually",
+    "Physics is weak, I study {n} hours, exam in {n} weeks",
+]
+
+COMBO_ANSWERS = {
+    "friend_compare_emotion": "Rahul\nTopper in class | big\npressure",
+    "distraction_time_combo": "BGMI\n2-3 hours daily\nphone",
+}
+
+
+# Local stand-ins ----------------------------------------------------------
+class _QuestionAPIHandler(BaseHTTPRequestHandler):
+    def do_POST(self):  # noqa: N802 - http.server naming
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        question_id = self.headers.get("questionId") or "q"
+        body = json.dumps(
+            {
+                "_id": question_id,
+                "questionType": "scq",
+                "subject": "Physics",
+                "chapter": "Kinematics",
+                "scq": {
+                    "question": "<p>A car moves at 20 m/s for 5 s. (A) 50 m (B) 100 m (C) 150 m (D) 200 m</p>",
+                    "answer": "B",
+                    "solution": "<p>distance = 20 x 5 = 100 m</p>",
+                },
+            }
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        return None
+
+
+def start_question_api() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _QuestionAPIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# Measurement ----------------------------------------------------------------
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.db_seconds: dict[str, float] = defaultdict(float)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.sessions_completed = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def db_elapsed(self) -> float:
+        return getattr(self._local, "db", 0.0)
+
+    def add_db(self, seconds: float) -> None:
+        self._local.db = self.db_elapsed() + seconds
+
+    def record(self, endpoint: str, seconds: float, db_seconds: float = 0.0, ok: bool = True) -> None:
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            self.db_seconds[endpoint] += db_seconds
+            if not ok:
+                self.errors[endpoint] += 1
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def install_db_timer(engine, recorder: Recorder) -> None:
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("bench_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["bench_started"].pop()
+        recorder.add_db(time.perf_counter() - started)
+
+
+# Synthetic student ----------------------------------------------------------
+def run_student(app, socketio, recorder: Recorder, index: int, args) -> None:
+    rng = random.Random(args.seed + index)
+    http = app.test_client()
+
+    sock = None
+
+    def call(endpoint: str, method: str, url: str, body: dict | None = None) -> tuple[int, dict]:
+        db_before = recorder.db_elapsed()
+        started = time.perf_counter()
+        if sock is not None and endpoint in ("next_question", "answer"):
+            ack = sock.emit(endpoint, {**(body or {}), "session_id": session_id}, callback=True) or {}
+            status, data = ack.get("status", 599), ack.get("data") or {}
+        else:
+            response = http.open(url, method=method, json=body)
+            status, data = response.status_code, response.get_json(silent=True) or {}
+        elapsed = time.perf_counter() - started
+        recorder.record(endpoint, elapsed, recorder.db_elapsed() - db_before, status < 400)
+        return status, data
+
+    text = rng.choice(VENTS).format(n=rng.randint(1, 12)) + f" (student {index})"
+    status, started = call("start", "POST", "/session/start", {"text": text})
+    if status != 200:
+        return
+    session_id = started["session_id"]
+
+    room = socketio.test_client(app, flask_test_client=http)
+    room.emit("join_session", {"session_id": session_id})
+    room.get_received()
+    if args.transport == "socket":
+        sock = room
+
+    done = False
+    for _ in range(args.max_turns):
+        status, data = call("next_question", "POST", f"/session/{session_id}/next-question", {})
+        if status != 200 or data.get("done"):
+            done = status == 200
+            break
+
+        if data.get("combo"):
+            combo_id = "friend_compare_emotion" if "Friend" in (data.get("question") or "") else "distraction_time_combo"
+            answer = COMBO_ANSWERS[combo_id]
+        else:
+            if rng.random() < args.clarifier_rate:
+                _, clarified = call(
+                    "answer",
+                    "POST",
+                    f"/session/{session_id}/answer",
+                    {"answer": "idk", "domain": data.get("domain"), "slot": data.get("slot")},
+                )
+                if not clarified.get("need_clarification"):
+                    continue
+            answer = rng.choice(ANSWERS).format(n=rng.randint(1, 8))
+
+        call(
+            "answer",
+            "POST",
+            f"/session/{session_id}/answer",
+            {"answer": answer, "domain": data.get("domain"), "slot": data.get("slot")},
+        )
+
+    if done:
+        simulation_started = time.perf_counter()
+        call("start_simulation", "POST", f"/session/{session_id}/start-simulation", {})
+        deadline = simulation_started + args.popup_wait
+        first_popup = None
+        while time.perf_counter() < deadline:
+            if any(packet["name"] == "popup" for packet in room.get_received()):
+                first_popup = time.perf_counter() - simulation_started
+                break
+            time.sleep(0.01)
+        recorder.record("first_popup", first_popup if first_popup is not None else args.popup_wait, ok=first_popup is not None)
+        call("load_questions", "GET", "/api/questions/load-test-questions")
+        with recorder._lock:
+            recorder.sessions_completed += 1
+
+    room.disconnect()
+
+
+# Reporting -----------------------------------------------------------------
+def summarize(recorder: Recorder, wall_seconds: float, llm_seconds: float) -> dict:
+    endpoints = {}
+    total_requests = 0
+    for endpoint, values in sorted(recorder.latencies.items()):
+        total_requests += len(values) if endpoint != "first_popup" else 0
+        endpoints[endpoint] = {
+            "count": len(values),
+            "errors": recorder.errors.get(endpoint, 0),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "db_ms_per_call": round(recorder.db_seconds[endpoint] / len(values) * 1000, 3) if values else 0.0,
+        }
+    db_total = sum(recorder.db_seconds.values())
+    return {
+        "wall_seconds": round(wall_seconds, 3),
+        "sessions_completed": recorder.sessions_completed,
+        "sessions_per_second": round(recorder.sessions_completed / wall_seconds, 3) if wall_seconds else 0.0,
+        "requests_per_second": round(total_requests / wall_seconds, 3) if wall_seconds else 0.0,
+        "db_seconds_total": round(db_total, 3),
+        "llm_seconds_total": round(llm_seconds, 3),
+        "endpoints": endpoints,
+    }
+
+
+def compare(summary: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for endpoint, stats in summary["endpoints"].items():
+        base = (baseline.get("endpoints") or {}).get(endpoint)
+        if not base:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if base.get(key) and stats[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{endpoint} {key}: {stats[key]} ms vs baseline {base[key]} ms")
+    base_rps = baseline.get("requests_per_second")
+    if base_rps and summary["requests_per_second"] < base_rps * (1 - tolerance):
+        regressions.append(f"requests_per_second: {summary['requests_per_second']} vs baseline {base_rps}")
+    return regressions
+
+
+def print_report(summary: dict) -> None:
+    print(
+        f"sessions={summary['sessions_completed']} wall={summary['wall_seconds']}s "
+        f"sessions/s={summary['sessions_per_second']} req/s={summary['requests_per_second']}"
+    )
+    print(f"db_time={summary['db_seconds_total']}s llm_time={summary['llm_seconds_total']}s")
+    print(f"{'endpoint':<18}{'count':>7}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'db ms':>9}")
+    for endpoint, stats in summary["endpoints"].items():
+        print(
+            f"{endpoint:<18}{stats['count']:>7}{stats['errors']:>5}{stats['p50_ms']:>10}"
+            f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['db_ms_per_call']:>9}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--max-turns", type=int, default=16)
+    parser.add_argument("--clarifier-rate", type=float, default=0.15)
+    parser.add_argument("--popup-wait", type=float, default=10.0, help="seconds to wait for the first popup")
+    parser.add_argument("--llm-latency-ms", type=float, default=150.0)
+    parser.add_argument("--llm-latency-sigma", type=float, default=0.4)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--transport", choices=("http", "socket"), default="http", help="question-loop transport")
+    parser.add_argument("--database-url", default=None, help="defaults to a temporary SQLite file")
+    parser.add_argument("--output", default=None, help="write the JSON summary here")
+    parser.add_argument("--baseline", default=None, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", default=None, help="write this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args) -> ThreadingHTTPServer:
+    """Point the app at the fake LLM, a scratch DB and the local question API before import."""
+    question_api = start_question_api()
+    database_url = args.database_url or f"sqlite:///{tempfile.mkdtemp(prefix='stress-bench-')}/bench.db"
+    os.environ.update(
+        {
+            "DATABASE_URL": database_url,
+            "LLM_BACKEND": "fake",
+            "OPENAI_WARMUP": "false",
+            "SOCKETIO_MESSAGE_QUEUE": "",
+            "FAKE_LLM_LATENCY_MS": str(args.llm_latency_ms),
+            "FAKE_LLM_LATENCY_SIGMA": str(args.llm_latency_sigma),
+            "FAKE_LLM_ERROR_RATE": str(args.llm_error_rate),
+            "FAKE_LLM_SEED": str(args.seed),
+            "ACADZA_API_URL": f"http://127.0.0.1:{question_api.server_address[1]}/question/details",
+        }
+    )
+    return question_api
+
+
+def llm_seconds_total() -> float:
+    from app.services.llm_metrics import CALL_SITES, llm_latency
+
+    return sum(
+        llm_latency.totals(call_site=site, outcome=outcome)[0]
+        for site in CALL_SITES
+        for outcome in ("ok", "error")
+    )
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    question_api = configure_environment(args)
+
+    from app import create_app
+    from app.extensions import db, socketio
+
+    app = create_app()
+    recorder = Recorder()
+    with app.app_context():
+        db.create_all()
+        install_db_timer(db.engine, recorder)
+
+    llm_before = llm_seconds_total()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(run_student, app, socketio, recorder, i, args) for i in range(args.students)]
+        for future in futures:
+            future.result()
+    wall = time.perf_counter() - started
+    question_api.shutdown()
+
+    summary = summarize(recorder, wall, llm_seconds_total() - llm_before)
+    print_report(summary)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(summary, fh, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as fh:
+            json.dump(summary, fh, indent=2)
+        print(f"baseline saved to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            regressions = compare(summary, json.load(fh), args.tolerance)
+        if regressions:
+            print("REGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("no regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,6 +13,8 @@ const popupOverlay = $("popupOverlay");
 const popupQueue = [];
 let popupActive = false;
 let popupTimer = null;
+// Timers for a server-sent popup_batch, played back locally.
+let batchTimers = [];
 
 const loadingTextEl = $("loadingText");
 const introHintEl = $("introHint");
@@ -52,6 +54,12 @@ let currentDomain = null;
 let currentSlot = null;
 let socket = null;
 let socketInitialized = false;
+let joinedSessionId = null;
+let streamedPopups = 0;
+// First streamed card, shown as soon as it is generated; playback skips it when it arrives.
+let previewedPopup = null;
+const popupsReadySessions = new Set();
+const popupsReadyWaiters = [];
 let testQuestions = [];
 let testQuestionIndex = 0;
 let selectedOptions = {};
@@ -76,17 +84,58 @@ async function getJSON(url) {
   return data;
 }
 
-async function postJSON(url, body) {
-  const res = await fetch(url, {
-    method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify(body || {}),
-  });
+function newIdempotencyKey() {
+  if (window.crypto?.randomUUID) return window.crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+// With an idempotency key, a dropped connection or 5xx is retried once and the
+// server replays the first response instead of redoing the work.
+async function postJSON(url, body, idempotencyKey) {
+  const headers = { "Content-Type": "application/json" };
+  if (idempotencyKey) headers["Idempotency-Key"] = idempotencyKey;
+  const attempts = idempotencyKey ? 2 : 1;
+  let res;
+  for (let attempt = 1; attempt <= attempts; attempt += 1) {
+    try {
+      res = await fetch(url, { method: "POST", headers, body: JSON.stringify(body || {}) });
+      if (res.status < 500 || attempt === attempts) break;
+    } catch (err) {
+      if (attempt === attempts) throw err;
+    }
+    log("retry", url);
+  }
   const data = await res.json().catch(() => ({}));
   if (!res.ok) throw new Error(data.error || data.message || `HTTP ${res.status}`);
   return data;
 }
 
+// Question-loop calls ride the open socket (`next_question` / `answer` events run
+// the same server code as the HTTP routes). If the socket is down, the ack times
+// out or the server fails, the call falls back to HTTP with the same key, so
+// work already done on the socket is replayed rather than repeated.
+const SOCKET_ACK_TIMEOUT_MS = 30000;
+
+async function sessionCall(event, path, body) {
+  const idempotencyKey = newIdempotencyKey();
+  if (socket?.connected) {
+    let ack = null;
+    try {
+      ack = await socket
+        .timeout(SOCKET_ACK_TIMEOUT_MS)
+        .emitWithAck(event, { ...body, session_id: sessionId, idempotency_key: idempotencyKey });
+    } catch (err) {
+      log("socket_fallback", event, err.message || String(err));
+    }
+    if (ack && ack.status < 500) {
+      const data = ack.data || {};
+      if (!ack.ok) throw new Error(data.error || data.message || `HTTP ${ack.status}`);
+      return data;
+    }
+  }
+  return postJSON(`/session/${sessionId}/${path}`, body, idempotencyKey);
+}
+
 function showStage(name, message) {
   Object.values(stageEls).forEach((el) => el?.classList.remove("active"));
   const stage = stageEls[name];
@@ -163,6 +212,9 @@ function resetFlow() {
   setTestHint("");
   popupSummary.textContent = "We’re releasing your personalized pulses now. Watch the center top.";
   popupOverlay.innerHTML = "";
+  clearBatchTimers();
+  streamedPopups = 0;
+  previewedPopup = null;
   log("reset_flow");
   setSessionUI(null, null);
   showStage("intro");
@@ -183,12 +235,16 @@ function initSocket() {
     $("wsStatus").textContent = "WS: connected";
     log("WS connected", socket.id);
     logPopupEvent({ event: "connect", socket_id: socket.id });
+    // After a reconnect, rejoining resumes a simulation paused by the drop.
+    if (joinedSessionId) socket.emit("join_session", { session_id: joinedSessionId });
   });
 
   socket.on("disconnect", () => {
     $("wsStatus").textContent = "WS: disconnected";
     log("WS disconnected");
     logPopupEvent({ event: "disconnect" });
+    // The server pauses playback for the drop; rejoining sends a fresh batch.
+    clearBatchTimers();
   });
 
   socket.on("connect_error", (err) => {
@@ -203,11 +259,47 @@ function initSocket() {
   socket.on("popup", (payload) => {
     log("popup event", payload);
     logPopupEvent({ event: "popup", payload });
-    enqueuePopup(payload);
+    deliverPopup(payload);
+  });
+
+  socket.on("popup_batch", (payload) => {
+    // Batch delivery: the whole remaining schedule at once; replaces any earlier batch.
+    logPopupEvent({ event: "popup_batch", total: payload?.total, pending: payload?.popups?.length ?? 0 });
+    clearBatchTimers();
+    (payload?.popups || []).forEach((popup) => {
+      batchTimers.push(setTimeout(() => deliverPopup(popup), Math.max(0, popup.offset_ms || 0)));
+    });
+  });
+
+  socket.on("popup_generated", (payload) => {
+    // Streamed while the final answer is processed. The first card is shown right away
+    // instead of waiting for the whole batch; the simulation delivers the rest.
+    streamedPopups = Math.max(streamedPopups, (payload?.index ?? 0) + 1);
+    popupSummary.textContent = `Preparing your pulses… ${streamedPopups} ready.`;
+    if ((payload?.index ?? 0) === 0 && !previewedPopup) {
+      previewedPopup = payload;
+      logPopupEvent({ event: "popup_preview", payload });
+      enqueuePopup(payload);
+    }
+  });
+
+  socket.on("simulation_state", (payload) => {
+    if (!payload) return;
+    if (payload.state === "paused" || payload.state === "cancelled") clearBatchTimers();
+    const left = Math.max(0, (payload.total ?? 0) - (payload.cursor ?? 0));
+    popupSummary.textContent =
+      payload.state === "finished"
+        ? "All pulses delivered."
+        : `Pulses ${payload.state}: ${left} of ${payload.total ?? 0} to go.`;
+  });
+
+  socket.on("popups_ready", (payload) => {
+    if (payload?.session_id) popupsReadySessions.add(payload.session_id);
+    popupsReadyWaiters.splice(0).forEach((resolve) => resolve(payload));
   });
 
   socket.onAny((event, payload) => {
-    if (event === "popup") return;
+    if (event === "popup" || event === "popup_batch") return;
     logPopupEvent({ event, payload });
   });
 }
@@ -218,6 +310,7 @@ function joinSessionRoom(targetId) {
   if (!socketInitialized) initSocket();
   const payload = { session_id: id };
   const emitJoin = () => {
+    joinedSessionId = id;
     socket.emit("join_session", payload);
     logPopupEvent({ event: "join_session", session_id: id });
   };
@@ -226,6 +319,11 @@ function joinSessionRoom(targetId) {
   else socket.once("connect", emitJoin);
 }
 
+function clearBatchTimers() {
+  batchTimers.forEach((id) => clearTimeout(id));
+  batchTimers = [];
+}
+
 // Popup rendering ----------------------------------------------------------
 function logPopupEvent(obj) {
   if (!popupConsole) return;
@@ -236,6 +334,19 @@ function logPopupEvent(obj) {
   if (popupConsole.children.length > 200) popupConsole.removeChild(popupConsole.lastChild);
 }
 
+function deliverPopup(payload) {
+  // The card already previewed from the stream is not shown twice.
+  if (
+    previewedPopup &&
+    payload?.index === previewedPopup.index &&
+    payload?.message === previewedPopup.message
+  ) {
+    previewedPopup = null;
+    return;
+  }
+  enqueuePopup(payload);
+}
+
 function enqueuePopup(payload) {
   if (!payload) return;
   const message = String(payload.message || "");
@@ -570,7 +681,7 @@ async function fetchNextQuestion(message) {
   if (!sessionId) return;
   showStage("loading", message || "Designing your next cue…");
   try {
-    const data = await postJSON(`/session/${sessionId}/next-question`, {});
+    const data = await sessionCall("next_question", "next-question", {});
     log("next_question", data);
 
     if (data.pending) {
@@ -612,7 +723,7 @@ async function submitAnswer() {
       domain: currentDomain,
       slot: currentSlot,
     };
-    const data = await postJSON(`/session/${sessionId}/answer`, payload);
+    const data = await sessionCall("answer", "answer", payload);
     log("answer", data);
 
     if (data.need_clarification) {
@@ -634,12 +745,30 @@ async function submitAnswer() {
   }
 }
 
+function waitForPopupsReady(id, timeoutMs) {
+  if (popupsReadySessions.has(id)) return Promise.resolve();
+  return new Promise((resolve) => {
+    const timer = setTimeout(resolve, timeoutMs);
+    popupsReadyWaiters.push(() => {
+      clearTimeout(timer);
+      resolve();
+    });
+  });
+}
+
 async function handleCompletion() {
   showStage("loading", "Designing your focus pulses…");
   try {
-    const data = await postJSON(`/session/${sessionId}/start-simulation`, {});
+    // Batch delivery: the server sends the schedule once and this page plays it.
+    const body = { delivery: "batch" };
+    let data = await postJSON(`/session/${sessionId}/start-simulation`, body);
+    if (data.popups_status === "pending") {
+      // Popups are still being prepared in the background; retry once they land.
+      await waitForPopupsReady(sessionId, 30000);
+      data = await postJSON(`/session/${sessionId}/start-simulation`, body);
+    }
     log("start_simulation", data);
-    popupSummary.textContent = `Popups scheduled: ${data.popups_scheduled}. Keep an eye on the center top.`;
+    popupSummary.textContent = `Popups scheduled: ${data.popups_scheduled ?? 0}. Keep an eye on the center top.`;
   } catch (err) {
     log("simulation_error", err.message);
     popupSummary.textContent = err.message;